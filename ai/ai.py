@@ -1,60 +1,432 @@
+from typing import Optional, Tuple, List, TYPE_CHECKING
+from board.move import Move
 from board.piece import PieceColor
 from board.board import Board
+from ai.transposition import Bound, TranspositionTable
+from ai.move_ordering import MoveOrderer
+from ai.search_stats import SearchStats
+from ai.session import EngineSession
+from ai.tablebase import Tablebase
 import math
-import copy
+import time
+
+if TYPE_CHECKING:
+    from ai.opening_book import OpeningBook
+
+DEFAULT_BOOK_PLY = 8  # moves from the starting position covered by the opening book and played from it
+DEFAULT_QUIESCENCE_NODE_LIMIT = 256  # capture nodes searched below a single leaf of the main search
+
+# bounds seen from the other side of the board
+OPPOSITE_BOUND = {Bound.EXACT: Bound.EXACT, Bound.LOWER: Bound.UPPER, Bound.UPPER: Bound.LOWER}
 
 
 class AI:
-    def __init__(self, color: PieceColor, difficulty: int):
+    def __init__(self, color: PieceColor, difficulty: int, transposition_table_size: int = 1 << 18):
         self.color: PieceColor = color
         self.difficulty = difficulty
+        # state of searches made without a session, cleared before each of them
+        self._default_session = EngineSession(transposition_table_size)
+        self._session: Optional[EngineSession] = None  # session of the current search
+        self.transposition_table: TranspositionTable = self._default_session.transposition_table
+        self.move_orderer: MoveOrderer = self._default_session.move_orderer
+        self.tablebase: Optional[Tablebase] = None
+        self.opening_book: Optional['OpeningBook'] = None
+        self.book_max_ply = DEFAULT_BOOK_PLY
+        self.time_limit_ms: Optional[int] = None
+        self.node_limit: Optional[int] = None
+        self.always_deepen = False  # deepen one ply at a time even without limits, to report progress
+        self.nodes = 0  # nodes visited by the last search
+        self.completed_depth = 0  # deepest fully searched iteration of the last search
+        self._best_move: Optional[Move] = None  # best move of the deepest completed iteration
+        self.stats: Optional[SearchStats] = None  # statistics of the last search, when collected
+        self.quiescence_node_limit = DEFAULT_QUIESCENCE_NODE_LIMIT
+        # quiescence statistics of the last search: nodes, leaves evaluated because of the node limit and the
+        # deepest ply reached
+        self.quiescence_nodes = 0
+        self.quiescence_limit_hits = 0
+        self.max_quiescence_ply = 0
+        self._quiescence_budget = 0
+        self._principal_variation: List[Move] = []
+        self._following_pv = False
+        self._deadline = math.inf
+        self._max_nodes = math.inf
+        self._stopped = False
+        self._stop_requested = False
 
     def set_difficulty(self, difficulty: int):
         self.difficulty = difficulty
 
+    def set_search_limits(self, time_limit_ms: Optional[int], node_limit: Optional[int] = None):
+        """with any limit set `get_best_move` deepens the search one ply at a time, up to `difficulty`, and stops
+        when the limit is reached"""
+        self.time_limit_ms = time_limit_ms
+        self.node_limit = node_limit
+
+    def set_always_deepen(self, always_deepen: bool):
+        """without limits `get_best_move` searches straight to `difficulty` unless `always_deepen` is set, then every
+        shallower iteration is completed first and reported by `get_search_progress`"""
+        self.always_deepen = always_deepen
+
+    def set_quiescence_node_limit(self, node_limit: int):
+        """capture lines are followed below the leaves of the main search for at most `node_limit` nodes per leaf,
+        0 evaluates leaves directly"""
+        self.quiescence_node_limit = node_limit
+
+    def set_collect_stats(self, collect_stats: bool):
+        """fills `stats` during every search, without it `stats` is None and nothing is counted"""
+        self.stats = SearchStats() if collect_stats else None
+
     def set_color(self, color: PieceColor):
         self.color = color
 
-    def get_best_move(self, board: Board):
+    def set_tablebase(self, tablebase: Optional[Tablebase]):
+        """positions covered by `tablebase` are scored exactly, without searching them"""
+        self.tablebase = tablebase
+
+    def set_opening_book(self, opening_book: Optional['OpeningBook'], max_ply: int = DEFAULT_BOOK_PLY):
+        """book moves are played without searching in the first `max_ply` moves of the game"""
+        self.opening_book = opening_book
+        self.book_max_ply = max_ply
+
+    def get_node_count(self) -> int:
+        """nodes visited by the last search"""
+        return self.nodes
+
+    def get_transposition_hit_rate(self) -> float:
+        """hit rate of transposition table probes made during the last search"""
+        return self.transposition_table.get_hit_rate()
+
+    def create_session(self) -> EngineSession:
+        """search state for one game, pass it to every `get_best_move` call of the game"""
+        return EngineSession(self._default_session.transposition_table.size)
+
+    def _start_search(self, board: Board, session: Optional[EngineSession] = None) -> None:
+        self._session = session
+        if session is None:
+            session = self._default_session
+            session.reset()
+        self.transposition_table = session.transposition_table
+        self.move_orderer = session.move_orderer
+        self._principal_variation = session.start_search(board)
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.quiescence_limit_hits = 0
+        self.max_quiescence_ply = 0
+        self.completed_depth = -1
+        self._best_move = None
+        self._stopped = self._stop_requested
+        if self.stats is not None:
+            self.stats.reset()
+
+    def _finish_search(self) -> None:
+        if self.stats is not None:
+            self.stats.finish(self.nodes, self.quiescence_nodes, self.transposition_table.probes,
+                              self.transposition_table.hits)
+
+    def clone(self) -> 'AI':
+        """AI with the same settings and its own search state, for searching in another thread"""
+        ai = AI(self.color, self.difficulty, self._default_session.transposition_table.size)
+        ai.set_search_limits(self.time_limit_ms, self.node_limit)
+        ai.set_always_deepen(self.always_deepen)
+        ai.set_quiescence_node_limit(self.quiescence_node_limit)
+        ai.set_tablebase(self.tablebase)
+        ai.set_opening_book(self.opening_book, self.book_max_ply)
+        ai.set_collect_stats(self.stats is not None)
+        return ai
+
+    def stop(self) -> None:
+        """stops the search running in another thread and every later search of this AI, the stopped search
+        returns the best move found so far or None"""
+        self._stop_requested = True
+        self._stopped = True
+
+    def get_search_progress(self) -> Tuple[int, Optional[Move]]:
+        """(deepest completed iteration, its best move) of the running search, safe to call from another thread,
+        depth is -1 until the first iteration completes"""
+        return self.completed_depth, self._best_move
+
+    def is_stopped(self) -> bool:
+        """whether the last search was stopped before completing"""
+        return self._stopped
+
+    def get_best_move(self, board: Board, session: Optional[EngineSession] = None):
+        """searches `board` in place, the position is restored before returning. Without `session` nothing is
+        kept from previous searches."""
+        self._start_search(board, session)
         best_move = None
-        max_value = -math.inf
+        if self.opening_book is not None and board.ply < self.book_max_ply:
+            best_move = self.opening_book.get_move(board)
+            if best_move is not None:
+                self.completed_depth = 0
+                self._best_move = best_move
+        if best_move is None and self.time_limit_ms is None and self.node_limit is None and not self.always_deepen:
+            self._deadline = math.inf
+            self._max_nodes = math.inf
+            best_move, _ = self.search_root(board, self.difficulty)
+            if self._stopped:
+                self._finish_search()
+                return best_move
+            self.completed_depth = self.difficulty
+            self._best_move = best_move
+            if self.stats is not None:
+                self.stats.record_depth(self.difficulty, self.nodes)
+            assert best_move is not None
+            if session is not None:
+                self._principal_variation = self.get_principal_variation(board, self.difficulty + 1)
+        elif best_move is None:
+            best_move = self.iterative_deepening(board)
+        if session is not None:
+            variation = self._principal_variation
+            session.finish_search(board, variation if len(variation) and variation[0] == best_move else [best_move])
+        self._finish_search()
+        return best_move
+
+    def iterative_deepening(self, board: Board) -> Move:
+        """searches with increasing depth and returns the best move of the last iteration that completed
+        within the time and node limits"""
+        start = time.perf_counter()
+        self._deadline = math.inf if self.time_limit_ms is None else start + self.time_limit_ms / 1000
+        self._max_nodes = math.inf if self.node_limit is None else self.node_limit
+        self.completed_depth = -1
         capture_moves, standard_moves = board.generate_moves()
         all_moves = capture_moves if len(capture_moves) else standard_moves
-        for move in all_moves:
-            board_copy = copy.deepcopy(board)
-            board_copy.make_move(move)
-            value = self.minimax(board_copy, self.difficulty, -math.inf, math.inf, False)
-            max_value = max(max_value, value)
-            best_move = best_move if value < max_value else move
-        assert best_move is not None
+        assert len(all_moves), 'no legal moves'
+        best_move = all_moves[0]
+        if len(all_moves) == 1:
+            return best_move
+        for depth in range(self.difficulty + 1):
+            move, value = self.search_root(board, depth)
+            if self._stopped:
+                if self.completed_depth < 0 and move is not None:
+                    # nothing completed yet, the moves searched so far are better than a random one
+                    best_move = move
+                break
+            assert move is not None
+            best_move = move
+            self._best_move = move
+            self.completed_depth = depth
+            if self.stats is not None:
+                self.stats.record_depth(depth, self.nodes)
+            self._principal_variation = self.get_principal_variation(board, depth + 1)
+            if abs(value) == math.inf:
+                # forced win or loss found, deeper search cannot change it
+                break
+            if (time.perf_counter() - start) * 2 > self._deadline - start:
+                # next iteration takes longer than all previous ones together, it would not complete in time
+                break
         return best_move
 
-    def minimax(self, board: Board, depth: int, alpha: float, beta: float, maximizing: bool) -> float:
-        if depth == 0:
+    def search_root(self, board: Board, depth: int) -> Tuple[Optional[Move], float]:
+        """returns the first of the best moves and its value, children are searched to `depth`"""
+        best_move = None
+        max_value = -math.inf
+        all_moves = self.get_root_moves(board)
+        pv_move = self._principal_variation[0] if len(self._principal_variation) else None
+        for move in all_moves:
+            self._following_pv = move == pv_move
+            undo = board.make_move(move)
+            value = self.minimax(board, depth, max_value, math.inf, False, 1)
+            board.unmake_move(undo)
+            if self._stopped:
+                break
+            if value > max_value or best_move is None:
+                max_value = value
+                best_move = move
+        return best_move, max_value
+
+    def evaluate_root_moves(self, board: Board, depth: int) -> List[Tuple[Move, float]]:
+        """exact value of every legal move, children are searched to `depth` with a full window"""
+        self._start_search(board)
+        self._deadline = math.inf
+        self._max_nodes = math.inf
+        move_values = []
+        for move in self.get_root_moves(board):
+            self._following_pv = False
+            undo = board.make_move(move)
+            move_values.append((move, self.minimax(board, depth, -math.inf, math.inf, False, 1)))
+            board.unmake_move(undo)
+        self._finish_search()
+        return move_values
+
+    def get_root_moves(self, board: Board) -> List[Move]:
+        """legal moves in root search order, `Board` yields moves in set order, so they are sorted first to make
+        the choice between equally good moves reproducible"""
+        capture_moves, standard_moves = board.generate_moves()
+        all_moves = sorted(capture_moves if len(capture_moves) else standard_moves, key=lambda m: m.squares)
+        pv_move = self._principal_variation[0] if len(self._principal_variation) else None
+        if pv_move is not None and pv_move in all_moves:
+            all_moves.remove(pv_move)
+            all_moves.insert(0, pv_move)
+        return all_moves
+
+    def get_principal_variation(self, board: Board, max_length: int) -> List[Move]:
+        """line of best moves stored in the transposition table, starting at `board`"""
+        variation: List[Move] = []
+        undos = []
+        while len(variation) < max_length:
+            entry = self.transposition_table.probe(board.hash)
+            if entry is None or entry.best_move is None:
+                break
+            capture_moves, standard_moves = board.generate_moves()
+            if entry.best_move not in capture_moves + standard_moves:
+                break
+            variation.append(entry.best_move)
+            undos.append(board.make_move(entry.best_move))
+        for undo in reversed(undos):
+            board.unmake_move(undo)
+        return variation
+
+    def _check_limits(self) -> None:
+        if self.nodes >= self._max_nodes or time.perf_counter() >= self._deadline or self._stop_requested:
+            self._stopped = True
+
+    def probe_transposition_table(self, board: Board, depth: int) -> Tuple[Optional[float], Bound, Optional[Move]]:
+        """returns (score from the AI point of view, bound, best move), score is None when the entry is missing
+        or was searched to a lower depth"""
+        entry = self.transposition_table.probe(board.hash)
+        if entry is None:
+            return None, Bound.EXACT, None
+        if entry.depth < depth:
+            return None, Bound.EXACT, entry.best_move
+        if board.moving_side == self.color:
+            return entry.score, entry.bound, entry.best_move
+        return -entry.score, OPPOSITE_BOUND[entry.bound], entry.best_move
+
+    def store_transposition_table(self, board: Board, depth: int, value: float, bound: Bound,
+                                  best_move: Optional[Move]) -> None:
+        if board.moving_side == self.color:
+            self.transposition_table.store(board.hash, depth, value, bound, best_move)
+        else:
+            self.transposition_table.store(board.hash, depth, -value, OPPOSITE_BOUND[bound], best_move)
+
+    def probe_tablebase(self, board: Board) -> Optional[float]:
+        """returns the tablebase score from the AI point of view or None if the position is not covered"""
+        if self.tablebase is None:
+            return None
+        score = self.tablebase.probe_score(board)
+        if score is not None and self.stats is not None:
+            self.stats.tablebase_hits += 1
+        if score is None or board.moving_side == self.color:
+            return score
+        return -score
+
+    def evaluate_leaf(self, board: Board, alpha: float, beta: float, maximizing: bool, ply: int) -> float:
+        """value of a leaf of the main search, pending captures are resolved first"""
+        if self.quiescence_node_limit == 0:
+            if self.stats is not None:
+                self.stats.leaf_evaluations += 1
+            return board.evaluate_position(self.color)
+        self._quiescence_budget = self.quiescence_node_limit
+        return self.quiescence(board, alpha, beta, maximizing, ply)
+
+    def quiescence(self, board: Board, alpha: float, beta: float, maximizing: bool, ply: int) -> float:
+        """searches only capture moves until the position is quiet. Captures are compulsory, so there is no
+        standing pat, the side to move has to take."""
+        capture_moves = board.generate_captures()
+        if len(capture_moves) == 0 or self._quiescence_budget <= 0:
+            if len(capture_moves):
+                self.quiescence_limit_hits += 1
+            if self.stats is not None:
+                self.stats.leaf_evaluations += 1
             return board.evaluate_position(self.color)
+        self.max_quiescence_ply = max(self.max_quiescence_ply, ply)
+        best_value = -math.inf if maximizing else math.inf
+        # longer captures take more pieces, so they are searched first
+        for move in sorted(capture_moves, key=lambda m: -len(m.squares)):
+            self.nodes += 1
+            self.quiescence_nodes += 1
+            self._quiescence_budget -= 1
+            if self.nodes >= self._max_nodes or self.nodes & 127 == 0:
+                self._check_limits()
+            undo = board.make_move(move)
+            value = self.probe_tablebase(board)
+            if value is None:
+                value = self.quiescence(board, alpha, beta, not maximizing, ply + 1)
+            board.unmake_move(undo)
+            if self._stopped:
+                return 0
+            if maximizing:
+                best_value = max(best_value, value)
+                alpha = max(alpha, value)
+            else:
+                best_value = min(best_value, value)
+                beta = min(beta, value)
+            if beta <= alpha:
+                break
+        return best_value
+
+    def minimax(self, board: Board, depth: int, alpha: float, beta: float, maximizing: bool, ply: int = 0) -> float:
+        self.nodes += 1
+        if self.nodes >= self._max_nodes or self.nodes & 127 == 0:
+            self._check_limits()
+        table_value = self.probe_tablebase(board)
+        if table_value is not None:
+            return table_value
+        if depth == 0:
+            return self.evaluate_leaf(board, alpha, beta, maximizing, ply)
+        table_value, bound, table_move = self.probe_transposition_table(board, depth)
+        if table_value is not None:
+            if bound == Bound.EXACT:
+                if self.stats is not None:
+                    self.stats.transposition_cutoffs += 1
+                return table_value
+            if bound == Bound.LOWER:
+                alpha = max(alpha, table_value)
+            else:
+                beta = min(beta, table_value)
+            if beta <= alpha:
+                if self.stats is not None:
+                    self.stats.transposition_cutoffs += 1
+                return table_value
+        original_alpha, original_beta = alpha, beta
+        capture_moves, standard_moves = board.generate_moves()
+        following_pv = self._following_pv and ply < len(self._principal_variation)
+        pv_move = self._principal_variation[ply] if following_pv else None
+        all_moves = self.move_orderer.order_moves(capture_moves, standard_moves, ply, table_move, pv_move)
+        best_move = None
         if maximizing is True:
             max_value = -math.inf
-            capture_moves, standard_moves = board.generate_moves()
-            all_moves = capture_moves + standard_moves
             for move in all_moves:
-                board_copy = copy.deepcopy(board)
-                board_copy.make_move(move)
-                value = self.minimax(board_copy, depth - 1, alpha, beta, False)
+                self._following_pv = pv_move is not None and move == pv_move
+                undo = board.make_move(move)
+                value = self.minimax(board, depth - 1, alpha, beta, False, ply + 1)
+                board.unmake_move(undo)
+                if self._stopped:
+                    return 0
+                if value > max_value or best_move is None:
+                    best_move = move
                 max_value = max(max_value, value)
                 alpha = max(alpha, value)
                 if beta <= alpha:
+                    self.move_orderer.record_cutoff(move, ply, depth, len(capture_moves) > 0)
+                    if self.stats is not None:
+                        self.stats.record_cutoff(all_moves.index(move))
                     break
-            return max_value
+            result = max_value
         else:
             min_value = math.inf
-            capture_moves, standard_moves = board.generate_moves()
-            all_moves = capture_moves + standard_moves
             for move in all_moves:
-                board_copy = copy.deepcopy(board)
-                board_copy.make_move(move)
-                value = self.minimax(board_copy, depth - 1, alpha, beta, True)
+                self._following_pv = pv_move is not None and move == pv_move
+                undo = board.make_move(move)
+                value = self.minimax(board, depth - 1, alpha, beta, True, ply + 1)
+                board.unmake_move(undo)
+                if self._stopped:
+                    return 0
+                if value < min_value or best_move is None:
+                    best_move = move
                 min_value = min(min_value, value)
                 beta = min(beta, value)
                 if beta <= alpha:
+                    self.move_orderer.record_cutoff(move, ply, depth, len(capture_moves) > 0)
+                    if self.stats is not None:
+                        self.stats.record_cutoff(all_moves.index(move))
                     break
-            return min_value
+            result = min_value
+        if result <= original_alpha:
+            bound = Bound.UPPER
+        elif result >= original_beta:
+            bound = Bound.LOWER
+        else:
+            bound = Bound.EXACT
+        self.store_transposition_table(board, depth, result, bound, best_move)
+        return result
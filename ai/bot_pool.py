@@ -0,0 +1,263 @@
+"""Bot moves for the game server, searched by a pool of worker processes so handlers never block the event loop.
+
+Finished searches are queued and a byte is written to a wakeup pipe. The server watches its read end like a
+client socket and calls `BotPool.handle_wakeup`, so results are handled in the event loop thread. Every search
+takes one of `max_searches` slots until its result is handled, which bounds the searches queued behind busy
+workers. A slot has a flag in shared memory, set to cancel its search, which the worker checks like its time
+limit.
+
+Every worker is a process of its own. A worker keeps an `EngineSession` for each of its recent games, so the
+searches of a game go to the worker of its previous search, unless another worker has less to do.
+"""
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional
+from ai.ai import AI
+from ai.session import EngineSession
+from board.bitboard import create_board
+from board.fen import parse_fen
+from board.piece import PieceColor
+
+MIN_BOT_DIFFICULTY = 1
+MAX_BOT_DIFFICULTY = 8
+DEFAULT_BOT_TIME_LIMIT_MS = 1000  # longest search of one bot move, also for the highest difficulty
+PARENT_CHECK_INTERVAL = 1.0  # seconds between checks of a worker whether the server process still runs
+MAX_WORKER_SESSIONS = 16  # games whose search state a worker keeps, the least recently searched one is dropped
+
+# gets the found move in notation, or None if the search failed
+BotMoveCallback = Callable[[Optional[str]], None]
+
+
+class BotSearchTask:
+    def __init__(self, slot: int, game_id: str, fen: str, ply: int, difficulty: int, time_limit_ms: int,
+                 use_bitboard: bool):
+        self.slot = slot
+        self.game_id = game_id
+        self.fen = fen
+        self.ply = ply  # moves made in the game, ages the move ordering data of its session
+        self.difficulty = difficulty
+        self.time_limit_ms = time_limit_ms
+        self.use_bitboard = use_bitboard
+
+
+class BotAI(AI):
+    """AI of a pool worker, also stops when the slot of its search is cancelled"""
+
+    def __init__(self, cancelled: Any):
+        super().__init__(PieceColor.WHITE, MIN_BOT_DIFFICULTY)
+        self.cancelled = cancelled
+        self.slot = 0
+
+    def _check_limits(self) -> None:
+        super()._check_limits()
+        if self.cancelled[self.slot]:
+            self._stopped = True
+
+
+_worker_ai: Optional[BotAI] = None
+_worker_sessions: 'OrderedDict[str, EngineSession]' = OrderedDict()  # game id -> session, least recent first
+
+
+def _initialize_worker(cancelled: Any, server_pid: int) -> None:
+    global _worker_ai
+    _worker_ai = BotAI(cancelled)
+    # CTRL + c in the terminal of the server stops the server, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    threading.Thread(target=_exit_with_server, args=(server_pid,), daemon=True).start()
+
+
+def _exit_with_server(server_pid: int) -> None:
+    # a killed server cannot shut the pool down, its workers are adopted by another process then
+    while os.getppid() == server_pid:
+        time.sleep(PARENT_CHECK_INTERVAL)
+    os._exit(0)
+
+
+def _search_bot_move(task: BotSearchTask) -> Optional[str]:
+    """best move in the position, None if the search was cancelled"""
+    assert _worker_ai is not None, 'worker not initialized'
+    board = create_board(task.use_bitboard)
+    board.set_position(*parse_fen(task.fen))
+    board.ply = task.ply
+    session = _worker_sessions.pop(task.game_id, None)
+    if session is None:
+        session = _worker_ai.create_session()
+        if len(_worker_sessions) >= MAX_WORKER_SESSIONS:
+            _worker_sessions.popitem(last=False)
+    _worker_sessions[task.game_id] = session
+    _worker_ai.slot = task.slot
+    _worker_ai.set_color(board.moving_side)
+    _worker_ai.set_difficulty(task.difficulty)
+    _worker_ai.set_search_limits(task.time_limit_ms)
+    move = _worker_ai.get_best_move(board, session)
+    if _worker_ai.cancelled[task.slot]:
+        return None
+    return str(move)
+
+
+def _drop_session(game_id: str) -> None:
+    # game ids are reused by later games
+    _worker_sessions.pop(game_id, None)
+
+
+class _Search:
+    __slots__ = ('game_id', 'worker', 'callback', 'future', 'is_cancelled')
+
+    def __init__(self, game_id: str, worker: int, callback: BotMoveCallback):
+        self.game_id = game_id
+        self.worker = worker
+        self.callback = callback
+        self.future: Optional[Future] = None
+        self.is_cancelled = False
+
+
+class BotPool:
+    def __init__(self, workers: int = multiprocessing.cpu_count(), max_searches: Optional[int] = None,
+                 time_limit_ms: int = DEFAULT_BOT_TIME_LIMIT_MS, use_bitboard: bool = False):
+        self.workers = workers
+        self.max_searches = 4 * workers if max_searches is None else max_searches
+        self.time_limit_ms = time_limit_ms
+        self.use_bitboard = use_bitboard
+        # spawned workers do not inherit the sockets of the server, a client closed by the server sees it at once
+        self._context = multiprocessing.get_context('spawn')
+        self._cancelled = self._context.Array('b', self.max_searches, lock=False)
+        self._executors: List[Optional[ProcessPoolExecutor]] = [None] * workers  # one process each
+        self._worker_searches = [0] * workers  # searches submitted to each worker and not handled yet
+        self._game_workers: Dict[str, int] = {}  # game id -> worker keeping the session of the game
+        self._free_slots: List[int] = list(reversed(range(self.max_searches)))
+        self._searches: Dict[int, _Search] = {}  # slot -> search, until its result is handled
+        self._game_slots: Dict[str, int] = {}  # game id -> slot of its search
+        self._finished_slots: 'queue.SimpleQueue[int]' = queue.SimpleQueue()
+        self._is_closed = False
+        self._wakeup_reader, self._wakeup_writer = os.pipe()
+        os.set_blocking(self._wakeup_reader, False)
+        os.set_blocking(self._wakeup_writer, False)
+
+    def get_wakeup_file_descriptor(self) -> int:
+        """readable when results wait for `handle_wakeup`"""
+        return self._wakeup_reader
+
+    def is_full(self) -> bool:
+        return len(self._free_slots) == 0
+
+    def submit(self, game_id: str, fen: str, ply: int, difficulty: int, callback: BotMoveCallback) -> bool:
+        """searches the bot move of a game, `callback` is called by `handle_wakeup` unless the search is cancelled.
+        False if all slots are taken or the game is already searched."""
+        if self.is_full() or game_id in self._game_slots:
+            return False
+        # the worker keeping the session of the game, unless another one is less busy
+        previous_worker = self._game_workers.get(game_id)
+        worker = min(range(self.workers), key=lambda index: (self._worker_searches[index], index != previous_worker))
+        self._game_workers[game_id] = worker
+        self._worker_searches[worker] += 1
+        slot = self._free_slots.pop()
+        search = _Search(game_id, worker, callback)
+        self._searches[slot] = search
+        self._game_slots[game_id] = slot
+        task = BotSearchTask(slot, game_id, fen, ply, difficulty, self.time_limit_ms, self.use_bitboard)
+        try:
+            search.future = self._get_executor(worker).submit(_search_bot_move, task)
+        except BrokenProcessPool:
+            # the worker died, it is started again
+            self._executors[worker] = None
+            search.future = self._get_executor(worker).submit(_search_bot_move, task)
+        search.future.add_done_callback(lambda _: self._post_result(slot))
+        return True
+
+    def end_game(self, game_id: str) -> None:
+        """cancels the search of the game and drops its session"""
+        self.cancel(game_id)
+        worker = self._game_workers.pop(game_id, None)
+        executor = None if worker is None else self._executors[worker]
+        if executor is not None:
+            try:
+                executor.submit(_drop_session, game_id)
+            except BrokenProcessPool:
+                # the worker died together with its sessions
+                self._executors[worker] = None
+
+    def cancel(self, game_id: str) -> None:
+        """drops the search of the game, a running one stops at its next limits check"""
+        slot = self._game_slots.pop(game_id, None)
+        if slot is None:
+            return
+        search = self._searches[slot]
+        search.is_cancelled = True
+        self._cancelled[slot] = 1
+        assert search.future is not None
+        search.future.cancel()
+
+    def handle_wakeup(self) -> None:
+        """calls the callbacks of the finished searches, in the thread of the event loop"""
+        try:
+            while os.read(self._wakeup_reader, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        while True:
+            try:
+                slot = self._finished_slots.get_nowait()
+            except queue.Empty:
+                return
+            search = self._searches.pop(slot)
+            # the flag of a cancelled search is cleared only now, when no worker can read it anymore
+            self._cancelled[slot] = 0
+            self._free_slots.append(slot)
+            self._worker_searches[search.worker] -= 1
+            if search.is_cancelled:
+                continue
+            del self._game_slots[search.game_id]
+            assert search.future is not None
+            move: Optional[str] = None
+            try:
+                move = search.future.result()
+            except BrokenProcessPool:
+                self._executors[search.worker] = None
+                traceback.print_exc()
+            except Exception:
+                traceback.print_exc()
+            try:
+                search.callback(move)
+            except Exception:
+                traceback.print_exc()
+
+    def close(self) -> None:
+        if self._is_closed:
+            return
+        self._is_closed = True
+        for executor in self._executors:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        self._executors = [None] * self.workers
+        os.close(self._wakeup_reader)
+        os.close(self._wakeup_writer)
+
+    def _get_executor(self, worker: int) -> ProcessPoolExecutor:
+        executor = self._executors[worker]
+        if executor is None:
+            executor = ProcessPoolExecutor(1, mp_context=self._context, initializer=_initialize_worker,
+                                           initargs=(self._cancelled, os.getpid()))
+            self._executors[worker] = executor
+        return executor
+
+    def _post_result(self, slot: int) -> None:
+        # called by a thread of the executor, also for searches finishing while the pool is closed
+        self._finished_slots.put(slot)
+        if self._is_closed:
+            return
+        try:
+            os.write(self._wakeup_writer, b'\0')
+        except BlockingIOError:
+            # the pipe is full, the event loop is woken up already
+            pass
+        except OSError:
+            # the pipe was closed after the check above
+            pass
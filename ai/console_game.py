@@ -1,13 +1,16 @@
+import argparse
 from typing import List
 from ai.ai import AI
 from board.piece import PieceColor
-from board.board import Board, Coordinates
+from board.board import Coordinates
+from board.bitboard import create_board
 
 
 class Game:
-    def __init__(self):
-        self.board: Board = Board()
+    def __init__(self, use_bitboard: bool = False, show_stats: bool = False):
+        self.board = create_board(use_bitboard)
         self.difficulty = None
+        self.show_stats = show_stats
 
     def get_player_move(self):
         captures, standard = self.board.generate_moves()
@@ -80,14 +83,18 @@ class Game:
                 exit()
             else:
                 print("Illegal input!")
+        ai.set_collect_stats(self.show_stats)
+        session = ai.create_session()
         while True:
             print(self.board)
             if self.board.moving_side == ai.color:
                 print("Opponent's turn:")
-                move = ai.get_best_move(self.board)
+                move = ai.get_best_move(self.board, session)
                 if move is None:
                     print("YOU WON!")
                     exit()
+                if ai.stats is not None:
+                    print(ai.stats)
                 self.board.make_move(move)
             else:
                 print("Your turn:")
@@ -96,3 +103,11 @@ class Game:
                     print("YOU LOST!")
                     exit()
                 self.board.make_move(move)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plays a game against the AI in the console.')
+    parser.add_argument('--stats', action='store_true', help='print search statistics after every AI move')
+    parser.add_argument('--bitboard', action='store_true', help='use BitBoard instead of Board')
+    arguments = parser.parse_args()
+    Game(arguments.bitboard, arguments.stats).start()
@@ -0,0 +1,65 @@
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+from board.move import Move
+
+if TYPE_CHECKING:
+    from board.board import Coordinates
+
+KILLERS_PER_PLY = 2
+
+# sort keys of quiet moves, lower goes first
+KILLER_MOVE_RANK = 0
+QUIET_MOVE_RANK = 1
+
+
+class MoveOrderer:
+    """Orders moves so alpha-beta cutoffs come early: principal variation move, then transposition table move,
+    then captures by length, killer moves of the ply and the remaining moves by history score."""
+
+    def __init__(self):
+        self.killers: List[List[Move]] = []
+        self.history: Dict[Tuple['Coordinates', 'Coordinates'], int] = {}
+
+    def clear(self) -> None:
+        self.killers = []
+        self.history = {}
+
+    def age(self, plies: int) -> None:
+        """prepares for a search starting `plies` moves later in the same game, killers move to the plies they
+        now belong to and history scores lose half of their weight"""
+        self.killers = self.killers[plies:] if plies > 0 else []
+        self.history = {key: score // 2 for key, score in self.history.items() if score > 1}
+
+    def order_moves(self, captures: List[Move], standard: List[Move], ply: int, hash_move: Optional[Move],
+                    pv_move: Optional[Move]) -> List[Move]:
+        """returns legal moves (captures are compulsory) in search order"""
+        if len(captures):
+            # longer captures take more pieces, so they are searched first
+            ordered = sorted(captures, key=lambda move: -len(move.squares))
+        else:
+            killers = self.killers[ply] if ply < len(self.killers) else []
+            history = self.history
+
+            def quiet_move_key(move: Move):
+                if move in killers:
+                    return KILLER_MOVE_RANK, 0
+                return QUIET_MOVE_RANK, -history.get((move.squares[0], move.squares[-1]), 0)
+
+            ordered = sorted(standard, key=quiet_move_key)
+        for first_move in (hash_move, pv_move):
+            if first_move is not None and first_move in ordered:
+                ordered.remove(first_move)
+                ordered.insert(0, first_move)
+        return ordered
+
+    def record_cutoff(self, move: Move, ply: int, depth: int, is_capture: bool) -> None:
+        """remembers a quiet move that refuted the opponent's previous move"""
+        if is_capture:
+            return
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[KILLERS_PER_PLY:]
+        key = (move.squares[0], move.squares[-1])
+        self.history[key] = self.history.get(key, 0) + depth * depth
@@ -0,0 +1,158 @@
+"""Opening book: moves worth playing in positions near the start of the game, found by deep searches.
+
+Build it offline with `python -m ai.opening_book --depth 6 --output opening_book.bin` and pass
+`OpeningBook('opening_book.bin')` to `AI.set_opening_book`, both cover `DEFAULT_BOOK_PLY` moves by default.
+Records (position hash, move key, weight) are kept sorted by hash, so a position is found by bisection without
+loading the file.
+"""
+import argparse
+import math
+import mmap
+import random
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+from ai.ai import AI, DEFAULT_BOOK_PLY
+from board.bitboard import BitBoard
+from board.move import Move
+
+FILE_MAGIC = b'CKOB'
+FILE_VERSION = 1
+HEADER_FORMAT = '<4sBxxx'  # magic, version
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+RECORD_FORMAT = '<QQH'  # position hash, `Move.to_key`, weight
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+HASH_FORMAT = '<Q'
+# keys of captures of more than 11 pieces are longer, such moves are left out of the book. They cannot occur within
+# the first moves of a game, where books are used.
+MAX_RECORD_KEY_BITS = 64
+
+MAX_WEIGHT = 0xFFFF
+
+Record = Tuple[int, int, int]  # position hash, move key, weight
+
+
+class OpeningBook:
+    """Read-only access to a book file, the file is memory-mapped"""
+
+    def __init__(self, path: str, seed: Optional[int] = None):
+        self.path = path
+        self.random = random.Random(seed)
+        with open(path, 'rb') as file:
+            magic, version = struct.unpack(HEADER_FORMAT, file.read(HEADER_SIZE))
+            if magic != FILE_MAGIC or version != FILE_VERSION:
+                raise ValueError(f'{path} is not an opening book file')
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.records_count = (len(self._data) - HEADER_SIZE) // RECORD_SIZE
+
+    def close(self) -> None:
+        self._data.close()
+
+    def _get_hash(self, index: int) -> int:
+        return struct.unpack_from(HASH_FORMAT, self._data, HEADER_SIZE + index * RECORD_SIZE)[0]
+
+    def find_moves(self, position_hash: int) -> List[Tuple[Move, int]]:
+        """(move, weight) pairs stored for the position"""
+        low, high = 0, self.records_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_hash(middle) < position_hash:
+                low = middle + 1
+            else:
+                high = middle
+        moves = []
+        while low < self.records_count:
+            record_hash, move_key, weight = struct.unpack_from(RECORD_FORMAT, self._data,
+                                                               HEADER_SIZE + low * RECORD_SIZE)
+            if record_hash != position_hash:
+                break
+            moves.append((Move.from_key(move_key), weight))
+            low += 1
+        return moves
+
+    def get_move(self, board) -> Optional[Move]:
+        """one of the book moves of the position picked at random by weight, None if the position is not in the
+        book"""
+        capture_moves, standard_moves = board.generate_moves()
+        legal_moves = capture_moves if len(capture_moves) else standard_moves
+        # a different position with the same hash could have been stored, so moves are checked against legal ones
+        book_moves = [(move, weight) for move, weight in self.find_moves(board.hash) if move in legal_moves]
+        if len(book_moves) == 0:
+            return None
+        moves, weights = zip(*book_moves)
+        return self.random.choices(moves, weights)[0]
+
+
+def write_book(path: str, records: List[Record]) -> None:
+    if any(move_key.bit_length() > MAX_RECORD_KEY_BITS for _, move_key, _ in records):
+        raise ValueError(f'move keys of book records are limited to {MAX_RECORD_KEY_BITS} bits')
+    with open(path, 'wb') as file:
+        file.write(struct.pack(HEADER_FORMAT, FILE_MAGIC, FILE_VERSION))
+        for record in sorted(records):
+            file.write(struct.pack(RECORD_FORMAT, *record))
+
+
+class OpeningBookBuilder:
+    """Searches every book position to `depth` and keeps the moves scoring within `margin` of the best one,
+    at most `width` of them, weighted by how close they are to the best. Positions reached by the kept moves
+    are searched in turn, up to `max_ply` moves from the starting position."""
+
+    def __init__(self, depth: int, max_ply: int, margin: int, width: int):
+        self.depth = depth
+        self.max_ply = max_ply
+        self.margin = margin
+        self.width = width
+        self.records: Dict[int, List[Tuple[int, int]]] = {}  # position hash -> (move key, weight)
+
+    def get_book_moves(self, board: BitBoard) -> List[Tuple[Move, int]]:
+        ai = AI(board.moving_side, self.depth)
+        move_values = ai.evaluate_root_moves(board, self.depth)
+        best_value = max(value for _, value in move_values)
+        book_moves = []
+        for move, value in sorted(move_values, key=lambda move_value: -move_value[1])[:self.width]:
+            if value == best_value:
+                weight = MAX_WEIGHT
+            elif math.isinf(value) or best_value - value > self.margin:
+                continue
+            else:
+                weight = max(1, int(MAX_WEIGHT * (1 - (best_value - value) / (self.margin + 1))))
+            if move.to_key().bit_length() <= MAX_RECORD_KEY_BITS:
+                book_moves.append((move, weight))
+        return book_moves
+
+    def build(self) -> List[Record]:
+        board = BitBoard()
+        positions = [board]
+        while len(positions):
+            board = positions.pop()
+            if board.hash in self.records or board.ply >= self.max_ply:
+                continue
+            capture_moves, standard_moves = board.generate_moves()
+            if len(capture_moves) + len(standard_moves) == 0:
+                continue
+            book_moves = self.get_book_moves(board)
+            self.records[board.hash] = [(move.to_key(), weight) for move, weight in book_moves]
+            print(f'ply {board.ply}: {", ".join(str(move) for move, _ in book_moves)}')
+            for move, _ in book_moves:
+                child = BitBoard()
+                child.set_position(board.white, board.black, board.kings, board.moving_side)
+                child.ply = board.ply
+                child.make_move(move)
+                positions.append(child)
+        return [(position_hash, move_key, weight) for position_hash, moves in self.records.items()
+                for move_key, weight in moves]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Builds an opening book from deep searches of the starting '
+                                                 'position and the positions following it.')
+    parser.add_argument('--depth', type=int, default=6, help='search depth of every book position')
+    parser.add_argument('--plies', type=int, default=DEFAULT_BOOK_PLY, help='number of moves covered by the book')
+    parser.add_argument('--margin', type=int, default=10, help='largest score difference from the best move')
+    parser.add_argument('--width', type=int, default=3, help='largest number of moves kept per position')
+    parser.add_argument('--output', default='opening_book.bin', help='path of the book file')
+    arguments = parser.parse_args()
+    start = time.perf_counter()
+    book_records = OpeningBookBuilder(arguments.depth, arguments.plies, arguments.margin, arguments.width).build()
+    write_book(arguments.output, book_records)
+    print(f'{len(book_records)} moves written to {arguments.output} in {time.perf_counter() - start:.1f}s')
@@ -0,0 +1,289 @@
+import math
+import os
+import sys
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional, Tuple
+from ai.ai import AI
+from ai.search_stats import SearchStats
+from ai.session import EngineSession
+from ai.tablebase import Tablebase
+from board.board import Board
+from board.move import Move
+from board.piece import PieceColor
+
+STOP_POLL_INTERVAL = 0.05  # seconds between checks of the main process whether the search was stopped
+
+
+class SharedSearchState:
+    """Values shared by the main process and all workers of a pool. Workers read `alpha` (the best root score
+    found so far, lowered by one) to narrow their windows and add their node counts to `nodes`."""
+
+    def __init__(self):
+        self.alpha = multiprocessing.Value('d', -math.inf, lock=False)
+        self.nodes = multiprocessing.Value('q', 0)
+        self.stopped = multiprocessing.Value('b', 0, lock=False)
+
+    def reset(self) -> None:
+        self.alpha.value = -math.inf
+        self.stopped.value = 0
+        with self.nodes.get_lock():
+            self.nodes.value = 0
+
+
+class RootMoveTask:
+    def __init__(self, search_id: int, board: Board, move: Move, depth: int, color: PieceColor,
+                 principal_variation: List[Move], deadline: float, node_limit: float, keep_tables: bool,
+                 quiescence_node_limit: int, collect_stats: bool):
+        self.search_id = search_id
+        self.board = board
+        self.move = move
+        self.depth = depth
+        self.color = color
+        self.principal_variation = principal_variation
+        self.deadline = deadline  # `time.time()` based, comparable between processes
+        self.node_limit = node_limit
+        self.keep_tables = keep_tables  # searched with a session, state of the previous search is still useful
+        # search settings of the main process AI, see `AI.set_quiescence_node_limit` and `AI.set_collect_stats`
+        self.quiescence_node_limit = quiescence_node_limit
+        self.collect_stats = collect_stats
+
+
+class RootMoveResult:
+    def __init__(self, value: float, stopped: bool, variation: List[Move], worker_ai: AI):
+        self.value = value
+        self.stopped = stopped
+        self.variation = variation  # expected reply line
+        self.nodes = worker_ai.nodes
+        self.quiescence_nodes = worker_ai.quiescence_nodes
+        self.quiescence_limit_hits = worker_ai.quiescence_limit_hits
+        self.max_quiescence_ply = worker_ai.max_quiescence_ply
+        self.stats = worker_ai.stats
+
+
+class WorkerAI(AI):
+    """AI running in a pool worker, searches the subtree of a single root move"""
+
+    def __init__(self, shared: SharedSearchState, transposition_table_size: int,
+                 tablebase_directory: Optional[str]):
+        super().__init__(PieceColor.WHITE, 0, transposition_table_size)
+        if tablebase_directory is not None:
+            self.set_tablebase(Tablebase(tablebase_directory))
+        self.shared = shared
+        self.search_id = -1
+        self._reported_nodes = 0
+        self._shared_node_limit = math.inf
+
+    def _check_limits(self) -> None:
+        with self.shared.nodes.get_lock():
+            self.shared.nodes.value += self.nodes - self._reported_nodes
+            total_nodes = self.shared.nodes.value
+        self._reported_nodes = self.nodes
+        if self.shared.stopped.value or total_nodes >= self._shared_node_limit or \
+                time.perf_counter() >= self._deadline:
+            self._stopped = True
+
+    def search_root_move(self, task: RootMoveTask) -> RootMoveResult:
+        if task.search_id != self.search_id:
+            # transposition table is kept between iterations of one search, as in the serial search
+            self.search_id = task.search_id
+            if task.keep_tables:
+                self.transposition_table.new_search()
+                self.move_orderer.age(0)
+            else:
+                self.transposition_table.clear()
+                self.move_orderer.clear()
+        self.color = task.color
+        self.quiescence_node_limit = task.quiescence_node_limit
+        self.stats = SearchStats() if task.collect_stats else None
+        if self.stats is not None:
+            self.stats.reset()
+        probes, hits = self.transposition_table.probes, self.transposition_table.hits
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.quiescence_limit_hits = 0
+        self.max_quiescence_ply = 0
+        self._reported_nodes = 0
+        self._stopped = False
+        self._max_nodes = math.inf
+        self._shared_node_limit = task.node_limit
+        self._deadline = math.inf if task.deadline == math.inf else \
+            time.perf_counter() + task.deadline - time.time()
+        self._principal_variation = task.principal_variation
+        board = task.board
+        board.make_move(task.move)
+        value, best_reply = self._search_opponent_node(board, task.depth)
+        self._check_limits()
+        variation: List[Move] = []
+        if best_reply is not None and not self._stopped:
+            board.make_move(best_reply)
+            variation = [best_reply] + self.get_principal_variation(board, task.depth)
+        if self.stats is not None:
+            self.stats.finish(self.nodes, self.quiescence_nodes, self.transposition_table.probes - probes,
+                              self.transposition_table.hits - hits)
+        return RootMoveResult(value, self._stopped, variation, self)
+
+    def _search_opponent_node(self, board: Board, depth: int) -> Tuple[float, Optional[Move]]:
+        """same as `minimax` at ply 1, but alpha is refreshed from the other workers before every child"""
+        self.nodes += 1
+        table_value = self.probe_tablebase(board)
+        if table_value is not None:
+            return table_value, None
+        if depth == 0:
+            return self.evaluate_leaf(board, self.shared.alpha.value, math.inf, False, 1), None
+        capture_moves, standard_moves = board.generate_moves()
+        pv_move = self._principal_variation[1] if len(self._principal_variation) > 1 else None
+        all_moves = self.move_orderer.order_moves(capture_moves, standard_moves, 1, None, pv_move)
+        alpha = -math.inf
+        min_value = math.inf
+        best_reply = None
+        for move in all_moves:
+            alpha = max(alpha, self.shared.alpha.value)
+            if min_value <= alpha:
+                break
+            self._following_pv = pv_move is not None and move == pv_move
+            undo = board.make_move(move)
+            value = self.minimax(board, depth - 1, alpha, min_value, True, 2)
+            board.unmake_move(undo)
+            if self._stopped:
+                return 0, None
+            if value < min_value or best_reply is None:
+                best_reply = move
+            min_value = min(min_value, value)
+        return min_value, best_reply
+
+
+_worker_ai: Optional[WorkerAI] = None
+
+
+def _initialize_worker(shared: SharedSearchState, transposition_table_size: int,
+                       tablebase_directory: Optional[str]) -> None:
+    global _worker_ai
+    _worker_ai = WorkerAI(shared, transposition_table_size, tablebase_directory)
+
+
+def _search_root_move(task: RootMoveTask) -> RootMoveResult:
+    assert _worker_ai is not None, 'worker not initialized'
+    return _worker_ai.search_root_move(task)
+
+
+class ParallelAI(AI):
+    """AI that searches root moves in parallel on a pool of worker processes. Workers share the best root score,
+    so a move that cannot beat it is refuted quickly. Scores are integers, so narrowing the window to
+    `best - 1` keeps equal scores exact and the chosen move is the same as the one of the serial search.
+    Without `workers` there is one per CPU core."""
+
+    def __init__(self, color: PieceColor, difficulty: int, workers: Optional[int] = None,
+                 transposition_table_size: int = 1 << 18):
+        super().__init__(color, difficulty, transposition_table_size)
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self._transposition_table_size = transposition_table_size
+        self._shared: Optional[SharedSearchState] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._search_id = 0
+        self._best_variation: List[Move] = []
+
+    def set_tablebase(self, tablebase: Optional[Tablebase]):
+        """memory maps cannot be sent to the workers, they open the tablebase directory themselves"""
+        if self.tablebase is not None or tablebase is not None:
+            self.close()
+        super().set_tablebase(tablebase)
+
+    def set_workers(self, workers: int) -> None:
+        if workers != self.workers:
+            self.close()
+        self.workers = workers
+
+    def stop(self) -> None:
+        """also stops the root moves being searched by the workers"""
+        super().stop()
+        if self._shared is not None:
+            self._shared.stopped.value = 1
+
+    def close(self) -> None:
+        """shuts the worker processes down, they are started again by the next search"""
+        if self._pool is not None:
+            self._pool.shutdown()
+        self._pool = None
+        self._shared = None
+
+    def _get_pool(self) -> Tuple[ProcessPoolExecutor, SharedSearchState]:
+        if self._pool is None or self._shared is None:
+            self._shared = SharedSearchState()
+            self._pool = ProcessPoolExecutor(self.workers, initializer=_initialize_worker,
+                                             initargs=(self._shared, self._transposition_table_size,
+                                                       None if self.tablebase is None else self.tablebase.directory))
+        return self._pool, self._shared
+
+    def get_best_move(self, board: Board, session: Optional[EngineSession] = None):
+        """with `session` the workers keep their transposition tables between searches, the tables are shared by
+        all sessions using this AI"""
+        _, shared = self._get_pool()
+        shared.reset()
+        if self._stop_requested:
+            shared.stopped.value = 1
+        self._search_id += 1
+        return super().get_best_move(board, session)
+
+    def search_root(self, board: Board, depth: int) -> Tuple[Optional[Move], float]:
+        pool, shared = self._get_pool()
+        shared.alpha.value = -math.inf
+        all_moves = self.get_root_moves(board)
+        pv_move = self._principal_variation[0] if len(self._principal_variation) else None
+        deadline = math.inf if self._deadline == math.inf else time.time() + self._deadline - time.perf_counter()
+        futures: Dict[Future, int] = {}
+        for index, move in enumerate(all_moves):
+            principal_variation = self._principal_variation if move == pv_move else []
+            task = RootMoveTask(self._search_id, board, move, depth, self.color, principal_variation, deadline,
+                                self._max_nodes, self._session is not None, self.quiescence_node_limit,
+                                self.stats is not None)
+            futures[pool.submit(_search_root_move, task)] = index
+        values: Dict[int, float] = {}
+        variations: Dict[int, List[Move]] = {}
+        pending = set(futures)
+        while pending:
+            if self._stopped or time.time() >= deadline:
+                # stopped from another thread or deadline passed, workers stop at their next limits check
+                shared.stopped.value = 1
+            timeout = min(STOP_POLL_INTERVAL, max(0.0, deadline - time.time()))
+            done, pending = wait(pending, timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                self._add_worker_counters(result)
+                if result.stopped:
+                    self._stopped = True
+                    shared.stopped.value = 1
+                    continue
+                value = result.value
+                values[futures[future]] = value
+                variations[futures[future]] = result.variation
+                if value > shared.alpha.value + 1:
+                    # a won root move still has to be exact for the moves searched before it
+                    shared.alpha.value = sys.float_info.max if value == math.inf else value - 1
+        if len(values) == 0:
+            return None, -math.inf
+        # first of the best moves in search order, as in the serial search
+        best_index = min(values, key=lambda index: (-values[index], index))
+        self._best_variation = [all_moves[best_index]] + variations[best_index]
+        return all_moves[best_index], values[best_index]
+
+    def _add_worker_counters(self, result: RootMoveResult) -> None:
+        self.nodes += result.nodes
+        self.quiescence_nodes += result.quiescence_nodes
+        self.quiescence_limit_hits += result.quiescence_limit_hits
+        self.max_quiescence_ply = max(self.max_quiescence_ply, result.max_quiescence_ply)
+        if self.stats is not None and result.stats is not None:
+            self.stats.add(result.stats)
+
+    def _finish_search(self) -> None:
+        # transposition tables of the workers are probed, their counts were added by `_add_worker_counters`
+        if self.stats is not None:
+            self.stats.finish(self.nodes, self.quiescence_nodes,
+                              self.stats.transposition_probes + self.transposition_table.probes,
+                              self.stats.transposition_hits + self.transposition_table.hits)
+
+    def get_principal_variation(self, board: Board, max_length: int) -> List[Move]:
+        """transposition tables live in the workers, so this is the line reported for the best move of the last
+        root search"""
+        return self._best_variation[:max_length]
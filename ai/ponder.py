@@ -0,0 +1,87 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+from ai.ai import AI
+from ai.session import EngineSession
+from board.move import Move
+
+
+class Ponderer:
+    """Searches the positions after the opponent's possible replies in a background thread, while the opponent
+    thinks. The reply the last search expected goes first, then the others in move generation order.
+
+    Replies are searched to the full difficulty of `ai` without time limits, so a finished result is at least as
+    good as the search that would follow the reply, and is played right away. Unfinished searches still leave
+    their transposition entries in the session."""
+
+    def __init__(self, ai: AI, session: EngineSession):
+        self.ai = ai
+        self.session = session
+        self.hits = 0  # replies answered with a pondered move
+        self.misses = 0  # replies searched again after pondering
+        self._thread: Optional[threading.Thread] = None
+        self._search_ai: Optional[AI] = None
+        self._stop_event = threading.Event()
+        # position hash after a reply -> (best move, principal variation)
+        self._results: Dict[int, Tuple[Move, List[Move]]] = {}
+
+    def is_pondering(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, board) -> None:
+        """starts pondering `board`, the position with the opponent to move, `board` itself is not used by the
+        background thread"""
+        self.stop()
+        self._results = {}
+        self._stop_event.clear()
+        self._search_ai = self.ai.clone()
+        self._search_ai.set_search_limits(None)
+        self._thread = threading.Thread(target=self._ponder, args=(board.copy(), self._search_ai), daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """stops pondering and waits for the background thread"""
+        self._stop_event.set()
+        if self._search_ai is not None:
+            self._search_ai.stop()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+        self._search_ai = None
+
+    def get_move(self, board) -> Optional[Move]:
+        """stops pondering and returns the move found for `board`, the position after the opponent's reply, or None
+        if it was not searched to the end"""
+        self.stop()
+        result = self._results.get(board.hash)
+        self._results = {}
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        move, variation = result
+        # later replies overwrote the expectations of the session
+        self.session.finish_search(board, variation)
+        return move
+
+    def _ponder(self, board, search_ai: AI) -> None:
+        capture_moves, standard_moves = board.generate_moves()
+        replies = capture_moves if len(capture_moves) else standard_moves
+        expected_reply = self.session.expected_reply
+        if expected_reply is not None and expected_reply in replies:
+            replies.remove(expected_reply)
+            replies.insert(0, expected_reply)
+        search_ai.set_color(self.ai.color)
+        for reply in replies:
+            if self._stop_event.is_set():
+                return
+            undo = board.make_move(reply)
+            capture_moves, standard_moves = board.generate_moves()
+            if len(capture_moves) + len(standard_moves):
+                move = search_ai.get_best_move(board, self.session)
+                if move is None or search_ai.is_stopped():
+                    return
+                variation = search_ai.get_principal_variation(board, self.ai.difficulty + 1)
+                if len(variation) == 0 or variation[0] != move:
+                    variation = [move]
+                self._results[board.hash] = (move, variation)
+            board.unmake_move(undo)
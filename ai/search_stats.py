@@ -0,0 +1,80 @@
+import time
+from typing import List, Tuple
+
+
+class SearchStats:
+    """Counters of a single search, filled by `AI` when enabled with `AI.set_collect_stats`"""
+
+    def __init__(self):
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.leaf_evaluations = 0  # positions scored by the evaluation function
+        self.cutoffs = 0
+        # cutoffs caused by the move at each index of the ordered moves, the first ones show good move ordering
+        self.cutoff_move_indices: List[int] = []
+        self.transposition_probes = 0
+        self.transposition_hits = 0
+        self.transposition_cutoffs = 0  # nodes answered from the transposition table without searching
+        self.tablebase_hits = 0
+        self.depth_times: List[Tuple[int, float, int]] = []  # completed iterations: depth, seconds, nodes
+        self.elapsed = 0.0  # seconds
+        self._start = 0.0
+
+    def reset(self) -> None:
+        self.__init__()
+        self._start = time.perf_counter()
+
+    def record_cutoff(self, move_index: int) -> None:
+        self.cutoffs += 1
+        if move_index >= len(self.cutoff_move_indices):
+            self.cutoff_move_indices.extend([0] * (move_index + 1 - len(self.cutoff_move_indices)))
+        self.cutoff_move_indices[move_index] += 1
+
+    def add(self, other: 'SearchStats') -> None:
+        """adds the counters of a search of a part of the tree, made by a worker of `ParallelAI`. Nodes and
+        times are not added, they are set by `finish` and `record_depth` of the whole search."""
+        self.leaf_evaluations += other.leaf_evaluations
+        self.cutoffs += other.cutoffs
+        if len(other.cutoff_move_indices) > len(self.cutoff_move_indices):
+            self.cutoff_move_indices.extend([0] * (len(other.cutoff_move_indices) - len(self.cutoff_move_indices)))
+        for move_index, count in enumerate(other.cutoff_move_indices):
+            self.cutoff_move_indices[move_index] += count
+        self.transposition_probes += other.transposition_probes
+        self.transposition_hits += other.transposition_hits
+        self.transposition_cutoffs += other.transposition_cutoffs
+        self.tablebase_hits += other.tablebase_hits
+
+    def record_depth(self, depth: int, nodes: int) -> None:
+        """called after each completed iteration with the nodes of the whole search so far"""
+        self.depth_times.append((depth, time.perf_counter() - self._start, nodes))
+
+    def finish(self, nodes: int, quiescence_nodes: int, transposition_probes: int, transposition_hits: int) -> None:
+        self.elapsed = time.perf_counter() - self._start
+        self.nodes = nodes
+        self.quiescence_nodes = quiescence_nodes
+        self.transposition_probes = transposition_probes
+        self.transposition_hits = transposition_hits
+
+    def get_nodes_per_second(self) -> float:
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def get_first_move_cutoff_rate(self) -> float:
+        """fraction of cutoffs caused by the first move searched"""
+        return self.cutoff_move_indices[0] / self.cutoffs if self.cutoffs else 0.0
+
+    def get_transposition_hit_rate(self) -> float:
+        return self.transposition_hits / self.transposition_probes if self.transposition_probes else 0.0
+
+    def __str__(self):
+        lines = [f'nodes: {self.nodes} ({self.quiescence_nodes} quiescence), {self.get_nodes_per_second():.0f} '
+                 f'nodes/s in {self.elapsed * 1000:.1f}ms',
+                 f'leaf evaluations: {self.leaf_evaluations}, tablebase hits: {self.tablebase_hits}',
+                 f'cutoffs: {self.cutoffs}, {self.get_first_move_cutoff_rate():.1%} by the first move, by move '
+                 f'index: {self.cutoff_move_indices[:8]}',
+                 f'transposition table: {self.transposition_hits}/{self.transposition_probes} hits '
+                 f'({self.get_transposition_hit_rate():.1%}), {self.transposition_cutoffs} cutoffs']
+        previous_time, previous_nodes = 0.0, 0
+        for depth, seconds, nodes in self.depth_times:
+            lines.append(f'depth {depth}: {(seconds - previous_time) * 1000:.1f}ms, {nodes - previous_nodes} nodes')
+            previous_time, previous_nodes = seconds, nodes
+        return '\n'.join(lines)
@@ -0,0 +1,60 @@
+from typing import List, Optional
+from ai.move_ordering import MoveOrderer
+from ai.transposition import TranspositionTable
+from board.move import Move
+
+
+class EngineSession:
+    """Search state of one game, kept between the moves of the AI. Create it with `AI.create_session`, pass it to
+    `AI.get_best_move` and call `reset` when a new game starts.
+
+    The transposition table and move ordering data of the previous search are reused, entries are aged instead
+    of cleared. When the opponent plays the expected reply, the rest of the previous principal variation is
+    searched first."""
+
+    def __init__(self, transposition_table_size: int = 1 << 18):
+        self.transposition_table = TranspositionTable(transposition_table_size)
+        self.move_orderer = MoveOrderer()
+        self.expected_reply: Optional[Move] = None  # opponent's move the last search expected
+        self.searches = 0
+        self.predicted_replies = 0  # searches that started after the expected reply
+        self._expected_hash: Optional[int] = None  # position after the AI's move and the expected reply
+        self._expected_variation: List[Move] = []  # principal variation from that position on
+        self._last_ply: Optional[int] = None
+
+    def reset(self) -> None:
+        self.transposition_table.clear()
+        self.move_orderer.clear()
+        self.expected_reply = None
+        self.searches = 0
+        self.predicted_replies = 0
+        self._expected_hash = None
+        self._expected_variation = []
+        self._last_ply = None
+
+    def start_search(self, board) -> List[Move]:
+        """ages the kept state and returns the principal variation to search first in `board`"""
+        self.searches += 1
+        self.transposition_table.new_search()
+        if self._last_ply is not None and board.ply != self._last_ply:
+            # searches of the same ply, like pondering of different replies, share the ordering data
+            self.move_orderer.age(board.ply - self._last_ply)
+        self._last_ply = board.ply
+        if self._expected_hash is not None and board.hash == self._expected_hash:
+            self.predicted_replies += 1
+            return self._expected_variation
+        return []
+
+    def finish_search(self, board, principal_variation: List[Move]) -> None:
+        """remembers the reply expected to the first move of `principal_variation`, played from `board`"""
+        self.expected_reply = principal_variation[1] if len(principal_variation) > 1 else None
+        self._expected_hash = None
+        self._expected_variation = []
+        if self.expected_reply is None:
+            return
+        first_undo = board.make_move(principal_variation[0])
+        second_undo = board.make_move(self.expected_reply)
+        self._expected_hash = board.hash
+        board.unmake_move(second_undo)
+        board.unmake_move(first_undo)
+        self._expected_variation = principal_variation[2:]
@@ -0,0 +1,366 @@
+"""Endgame tablebases: win/loss/draw and distance to the end of the game for every position with few pieces.
+
+Build them offline with `python -m ai.tablebase --pieces 4 --output tablebases` and pass
+`Tablebase('tablebases')` to `AI.set_tablebase`. Each material signature (white pawns, white kings,
+black pawns, black kings) is stored in its own file, one byte per position, and probed through `mmap`.
+"""
+import argparse
+import mmap
+import os
+import struct
+import time
+from array import array
+from enum import Enum
+from typing import Dict, List, Optional, Tuple, BinaryIO
+from board.piece import PieceColor
+from board.squares import SQUARES_COUNT, FULL_MASK, JUMPS, DIRECTION_SHIFTS, JUMP_SHIFTS, WHITE_PAWN_DIRECTIONS, \
+    BLACK_PAWN_DIRECTIONS, WHITE_PROMOTION_MASK, BLACK_PROMOTION_MASK, shift, pop_count, iterate_squares
+
+Signature = Tuple[int, int, int, int]  # white pawns, white kings, black pawns, black kings
+Masks = Tuple[int, int, int]  # white pieces, black pieces, kings
+
+FILE_MAGIC = b'CKTB'
+FILE_VERSION = 1
+HEADER_FORMAT = '<4sBBBBBxx'  # magic, version, signature
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+FILE_EXTENSION = '.ctb'
+
+# value byte of a position, always from the side to move point of view
+DRAW = 0
+WIN = 0  # WIN + distance, distance is 1-127 plies
+LOSS = 128  # LOSS + distance, distance is 0-127 plies
+MAX_DISTANCE = 127
+
+# tablebase scores are below the engine's infinite scores, but above any evaluation
+TABLEBASE_WIN_SCORE = 100000
+
+BINOMIAL = [[0] * (SQUARES_COUNT + 1) for _ in range(SQUARES_COUNT + 1)]
+for _n in range(SQUARES_COUNT + 1):
+    BINOMIAL[_n][0] = 1
+    for _k in range(1, _n + 1):
+        BINOMIAL[_n][_k] = BINOMIAL[_n - 1][_k - 1] + BINOMIAL[_n - 1][_k]
+
+# squares between the start and the landing square of a jump
+JUMPED_SQUARE: Dict[Tuple[int, int], int] = {
+    (square, landing_square): jumped_square
+    for square in range(SQUARES_COUNT) for jumped_square, landing_square in JUMPS[square]
+}
+
+
+class TablebaseOutcome(Enum):
+    WIN = 'WIN'
+    LOSS = 'LOSS'
+    DRAW = 'DRAW'
+
+
+def get_signature(white: int, black: int, kings: int) -> Signature:
+    return pop_count(white & ~kings), pop_count(white & kings), pop_count(black & ~kings), pop_count(black & kings)
+
+
+def get_file_name(signature: Signature) -> str:
+    return ''.join(map(str, signature)) + FILE_EXTENSION
+
+
+def get_table_size(signature: Signature) -> int:
+    """positions of one side to move"""
+    size = 1
+    for pieces_count in signature:
+        size *= BINOMIAL[SQUARES_COUNT][pieces_count]
+    return size
+
+
+def _rank(mask: int) -> int:
+    """index of the set of squares among all sets of the same size (combinatorial number system)"""
+    result = 0
+    for index, square in enumerate(iterate_squares(mask)):
+        result += BINOMIAL[square][index + 1]
+    return result
+
+
+def _unrank(rank: int, pieces_count: int) -> int:
+    mask = 0
+    for index in range(pieces_count, 0, -1):
+        square = index - 1
+        while BINOMIAL[square + 1][index] <= rank:
+            square += 1
+        rank -= BINOMIAL[square][index]
+        mask |= 1 << square
+    return mask
+
+
+def get_position_index(signature: Signature, white: int, black: int, kings: int, moving_side: PieceColor) -> int:
+    index = 0 if moving_side == PieceColor.WHITE else 1
+    for pieces_count, mask in zip(signature, (white & ~kings, white & kings, black & ~kings, black & kings)):
+        index = index * BINOMIAL[SQUARES_COUNT][pieces_count] + _rank(mask)
+    return index
+
+
+def get_position(signature: Signature, index: int) -> Tuple[Masks, PieceColor]:
+    """inverse of `get_position_index`, pieces of different groups may overlap in the returned masks"""
+    groups = []
+    for pieces_count in reversed(signature):
+        size = BINOMIAL[SQUARES_COUNT][pieces_count]
+        groups.append(_unrank(index % size, pieces_count))
+        index //= size
+    black_kings, black_pawns, white_kings, white_pawns = groups
+    moving_side = PieceColor.WHITE if index == 0 else PieceColor.BLACK
+    return (white_pawns | white_kings, black_pawns | black_kings, white_kings | black_kings), moving_side
+
+
+def is_valid_position(signature: Signature, white: int, black: int, kings: int) -> bool:
+    if white & black or get_signature(white, black, kings) != signature:
+        # pieces overlap
+        return False
+    # pawns standing on their promotion row would already be kings
+    return not (white & ~kings & WHITE_PROMOTION_MASK or black & ~kings & BLACK_PROMOTION_MASK)
+
+
+def get_successors(white: int, black: int, kings: int, moving_side: PieceColor) -> List[Masks]:
+    """positions after every legal move, captures are compulsory"""
+    if moving_side == PieceColor.WHITE:
+        own, opponent, promotion_mask = white, black, WHITE_PROMOTION_MASK
+        forward, backward = WHITE_PAWN_DIRECTIONS, BLACK_PAWN_DIRECTIONS
+    else:
+        own, opponent, promotion_mask = black, white, BLACK_PROMOTION_MASK
+        forward, backward = BLACK_PAWN_DIRECTIONS, WHITE_PAWN_DIRECTIONS
+    occupied = white | black
+    empty = FULL_MASK & ~occupied
+    results: List[Tuple[int, int, int]] = []  # own pieces, opponent pieces, kings
+
+    capturing = 0
+    for mask, jumped_delta, landing_delta in JUMP_SHIFTS:
+        capturing |= own & mask & shift(opponent, -jumped_delta) & shift(empty, -landing_delta)
+
+    def add_captures(start: int, square: int, captured: int) -> bool:
+        found = False
+        for jumped_square, landing_square in JUMPS[square]:
+            jumped_bit = 1 << jumped_square
+            if not opponent & jumped_bit or captured & jumped_bit or occupied >> landing_square & 1:
+                continue
+            found = True
+            if not add_captures(start, landing_square, captured | jumped_bit):
+                add_move(start, landing_square, captured | jumped_bit)
+        return found
+
+    def add_move(start: int, final: int, captured: int) -> None:
+        start_bit, final_bit = 1 << start, 1 << final
+        new_kings = kings & ~captured
+        if new_kings & start_bit:
+            new_kings ^= start_bit | final_bit
+        elif final_bit & promotion_mask:
+            new_kings |= final_bit
+        results.append((own ^ start_bit ^ final_bit, opponent & ~captured, new_kings))
+
+    if capturing:
+        for square in iterate_squares(capturing):
+            add_captures(square, square, 0)
+    else:
+        for directions, movers in ((forward, own), (backward, own & kings)):
+            for direction in directions:
+                for mask, delta in DIRECTION_SHIFTS[direction]:
+                    for target in iterate_squares(shift(movers & mask, delta) & empty):
+                        add_move(target - delta, target, 0)
+    if moving_side == PieceColor.WHITE:
+        return results
+    return [(new_opponent, new_own, new_kings) for new_own, new_opponent, new_kings in results]
+
+
+def _encode(outcome: TablebaseOutcome, distance: int) -> int:
+    if distance > MAX_DISTANCE:
+        raise ValueError(f'distance {distance} does not fit the tablebase format')
+    return WIN + distance if outcome == TablebaseOutcome.WIN else LOSS + distance
+
+
+def _decode(value: int) -> Tuple[TablebaseOutcome, int]:
+    if value == DRAW:
+        return TablebaseOutcome.DRAW, 0
+    if value >= LOSS:
+        return TablebaseOutcome.LOSS, value - LOSS
+    return TablebaseOutcome.WIN, value - WIN
+
+
+def _read_header(file: BinaryIO) -> Signature:
+    magic, version, *signature = struct.unpack(HEADER_FORMAT, file.read(HEADER_SIZE))
+    if magic != FILE_MAGIC or version != FILE_VERSION:
+        raise ValueError(f'{file.name} is not a tablebase file')
+    return signature[0], signature[1], signature[2], signature[3]
+
+
+class Tablebase:
+    """Read-only access to the tablebase files of a directory, files are memory-mapped on first use"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._paths: Dict[Signature, str] = {}
+        self._tables: Dict[Signature, mmap.mmap] = {}
+        self.max_pieces = 0
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.endswith(FILE_EXTENSION):
+                continue
+            path = os.path.join(directory, file_name)
+            with open(path, 'rb') as file:
+                signature = _read_header(file)
+            self._paths[signature] = path
+            self.max_pieces = max(self.max_pieces, sum(signature))
+
+    def close(self) -> None:
+        for table in self._tables.values():
+            table.close()
+        self._tables = {}
+
+    def _get_table(self, signature: Signature) -> Optional[mmap.mmap]:
+        table = self._tables.get(signature)
+        if table is None and signature in self._paths:
+            with open(self._paths[signature], 'rb') as file:
+                table = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._tables[signature] = table
+        return table
+
+    def probe_masks(self, white: int, black: int, kings: int,
+                    moving_side: PieceColor) -> Optional[Tuple[TablebaseOutcome, int]]:
+        """(outcome for the side to move, plies to the end of the game) or None if the position is not covered"""
+        signature = get_signature(white, black, kings)
+        moving_pieces = white if moving_side == PieceColor.WHITE else black
+        if moving_pieces == 0:
+            return TablebaseOutcome.LOSS, 0
+        table = self._get_table(signature)
+        if table is None:
+            return None
+        return _decode(table[HEADER_SIZE + get_position_index(signature, white, black, kings, moving_side)])
+
+    def probe(self, board) -> Optional[Tuple[TablebaseOutcome, int]]:
+        if board.count_pieces() > self.max_pieces:
+            return None
+        white, black, kings = board.get_masks()
+        return self.probe_masks(white, black, kings, board.moving_side)
+
+    def probe_score(self, board) -> Optional[int]:
+        """score for the side to move, faster wins and slower losses score higher"""
+        result = self.probe(board)
+        if result is None:
+            return None
+        outcome, distance = result
+        if outcome == TablebaseOutcome.WIN:
+            return TABLEBASE_WIN_SCORE - distance
+        if outcome == TablebaseOutcome.LOSS:
+            return distance - TABLEBASE_WIN_SCORE
+        return 0
+
+
+def get_build_order(max_pieces: int) -> List[Signature]:
+    """captures and promotions only lead to signatures that come earlier in the list"""
+    signatures = []
+    for white_pawns in range(max_pieces + 1):
+        for white_kings in range(max_pieces + 1):
+            for black_pawns in range(max_pieces + 1):
+                for black_kings in range(max_pieces + 1):
+                    signature = (white_pawns, white_kings, black_pawns, black_kings)
+                    if sum(signature) <= max_pieces and white_pawns + white_kings and black_pawns + black_kings:
+                        signatures.append(signature)
+    return sorted(signatures, key=lambda s: (sum(s), s[0] + s[2], s))
+
+
+class TablebaseBuilder:
+    """Retrograde analysis of one signature after another, positions are resolved in order of their distance to
+    the end of the game, so every distance stored is the shortest win or the longest loss"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._finished: Dict[Signature, bytes] = {}
+
+    def _lookup_finished(self, white: int, black: int, kings: int, moving_side: PieceColor) -> int:
+        if (white if moving_side == PieceColor.WHITE else black) == 0:
+            return LOSS
+        signature = get_signature(white, black, kings)
+        return self._finished[signature][get_position_index(signature, white, black, kings, moving_side)]
+
+    def build(self, signature: Signature) -> bytearray:
+        half_size = get_table_size(signature)
+        size = 2 * half_size
+        values = bytearray(size)
+        resolved = bytearray(size)
+        remaining = array('i', [0] * size)  # children not known to be won for the opponent yet
+        escapes = bytearray(size)  # a child outside of this table is not won by the opponent, so no loss here
+        longest_win = array('i', [0] * size)  # longest of the opponent's wins among resolved children
+        parents: List[List[int]] = [[] for _ in range(size)]
+        buckets: Dict[int, List[Tuple[int, int]]] = {}  # distance -> (position, value) candidates
+
+        def schedule(distance: int, position: int, value: int) -> None:
+            buckets.setdefault(distance, []).append((position, value))
+
+        for index in range(size):
+            (white, black, kings), moving_side = get_position(signature, index)
+            if not is_valid_position(signature, white, black, kings):
+                resolved[index] = 1
+                continue
+            successors = get_successors(white, black, kings, moving_side)
+            if len(successors) == 0:
+                schedule(0, index, LOSS)
+                continue
+            child_side = PieceColor.BLACK if moving_side == PieceColor.WHITE else PieceColor.WHITE
+            for child_white, child_black, child_kings in successors:
+                if get_signature(child_white, child_black, child_kings) == signature:
+                    remaining[index] += 1
+                    child = get_position_index(signature, child_white, child_black, child_kings, child_side)
+                    parents[child].append(index)
+                    continue
+                child_outcome, child_distance = _decode(
+                    self._lookup_finished(child_white, child_black, child_kings, child_side))
+                if child_outcome == TablebaseOutcome.WIN:
+                    longest_win[index] = max(longest_win[index], child_distance)
+                    continue
+                escapes[index] = 1
+                if child_outcome == TablebaseOutcome.LOSS:
+                    schedule(child_distance + 1, index, WIN)
+            if remaining[index] == 0 and not escapes[index]:
+                # every move leaves this table and wins for the opponent
+                schedule(longest_win[index] + 1, index, LOSS)
+
+        distance = 0
+        while len(buckets):
+            for position, outcome in buckets.pop(distance, []):
+                if resolved[position]:
+                    continue
+                resolved[position] = 1
+                if outcome == WIN:
+                    values[position] = _encode(TablebaseOutcome.WIN, distance)
+                    for parent in parents[position]:
+                        if resolved[parent]:
+                            continue
+                        remaining[parent] -= 1
+                        longest_win[parent] = max(longest_win[parent], distance)
+                        if remaining[parent] == 0 and not escapes[parent]:
+                            schedule(longest_win[parent] + 1, parent, LOSS)
+                else:
+                    values[position] = _encode(TablebaseOutcome.LOSS, distance)
+                    for parent in parents[position]:
+                        if not resolved[parent]:
+                            schedule(distance + 1, parent, WIN)
+            distance += 1
+        # positions never resolved are draws, `values` already holds DRAW for them
+        self._finished[signature] = bytes(values)
+        return values
+
+    def write(self, signature: Signature, values: bytes) -> None:
+        with open(os.path.join(self.directory, get_file_name(signature)), 'wb') as file:
+            file.write(struct.pack(HEADER_FORMAT, FILE_MAGIC, FILE_VERSION, *signature))
+            file.write(values)
+
+    def build_all(self, max_pieces: int) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        for signature in get_build_order(max_pieces):
+            start = time.perf_counter()
+            values = self.build(signature)
+            self.write(signature, values)
+            wins = sum(1 for value in values if WIN < value < LOSS)
+            losses = sum(1 for value in values if value >= LOSS)
+            print(f'{get_file_name(signature)}: {len(values)} positions, {wins} won, {losses} lost, '
+                  f'{time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Builds endgame tablebases by retrograde analysis.')
+    parser.add_argument('--pieces', type=int, default=3, help='maximum number of pieces on the board')
+    parser.add_argument('--output', default='tablebases', help='directory for the tablebase files')
+    arguments = parser.parse_args()
+    TablebaseBuilder(arguments.output).build_all(arguments.pieces)
@@ -0,0 +1,275 @@
+"""Engine against engine tournaments, played headless on all CPU cores, for catching strength and speed
+regressions. Every pair of engines plays every opening, once with each colour unless `--no-swap` is given.
+
+    python -m ai.tournament --engines 4 6 --opening-plies 2
+    python -m ai.tournament --engines 6/200 8/200 --openings openings.txt --output games.pdn
+
+Engines are given as `DIFFICULTY` or `DIFFICULTY/TIME_LIMIT_MS`, openings as FEN positions, one per line.
+"""
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from ai.ai import AI
+from board.bitboard import AnyBoard, create_board
+from board.fen import STARTING_FEN, get_fen, parse_fen
+from board.piece import PieceColor
+
+DEFAULT_MAX_PLIES = 200
+REPETITIONS_FOR_DRAW = 3
+
+WHITE_WIN = '1-0'
+BLACK_WIN = '0-1'
+DRAW = '1/2-1/2'
+
+
+class EngineConfig:
+    def __init__(self, difficulty: int, time_limit_ms: Optional[int] = None):
+        self.difficulty = difficulty
+        self.time_limit_ms = time_limit_ms
+
+    @staticmethod
+    def from_string(config_string: str) -> 'EngineConfig':
+        """parses `DIFFICULTY` or `DIFFICULTY/TIME_LIMIT_MS`"""
+        fields = config_string.split('/')
+        if len(fields) > 2 or not all(field.isdigit() for field in fields):
+            raise ValueError(f'invalid engine: {config_string}')
+        return EngineConfig(int(fields[0]), int(fields[1]) if len(fields) == 2 else None)
+
+    def create_ai(self, color: PieceColor) -> AI:
+        ai = AI(color, self.difficulty)
+        ai.set_search_limits(self.time_limit_ms)
+        return ai
+
+    def __str__(self):
+        if self.time_limit_ms is None:
+            return f'depth {self.difficulty}'
+        return f'depth {self.difficulty} {self.time_limit_ms}ms'
+
+
+class GameTask:
+    def __init__(self, game_round: int, white: EngineConfig, black: EngineConfig, opening: str, max_plies: int,
+                 use_bitboard: bool):
+        self.round = game_round
+        self.white = white
+        self.black = black
+        self.opening = opening  # FEN of the starting position
+        self.max_plies = max_plies
+        self.use_bitboard = use_bitboard
+
+
+class GameResult:
+    def __init__(self, task: GameTask):
+        self.task = task
+        self.result = DRAW
+        self.termination = ''
+        self.moves: List[str] = []
+        # per colour: moves played, seconds spent searching, nodes searched
+        self.move_counts = {PieceColor.WHITE: 0, PieceColor.BLACK: 0}
+        self.search_times = {PieceColor.WHITE: 0.0, PieceColor.BLACK: 0.0}
+        self.nodes = {PieceColor.WHITE: 0, PieceColor.BLACK: 0}
+
+
+def play_game(task: GameTask) -> GameResult:
+    board = create_board(task.use_bitboard)
+    board.set_position(*parse_fen(task.opening))
+    engines = {PieceColor.WHITE: task.white.create_ai(PieceColor.WHITE),
+               PieceColor.BLACK: task.black.create_ai(PieceColor.BLACK)}
+    sessions = {color: ai.create_session() for color, ai in engines.items()}
+    game = GameResult(task)
+    repetitions: Dict[int, int] = {}
+    while True:
+        repetitions[board.hash] = repetitions.get(board.hash, 0) + 1
+        capture_moves, standard_moves = board.generate_moves()
+        if len(capture_moves) + len(standard_moves) == 0:
+            game.result = BLACK_WIN if board.moving_side == PieceColor.WHITE else WHITE_WIN
+            game.termination = 'no moves'
+            return game
+        if repetitions[board.hash] >= REPETITIONS_FOR_DRAW:
+            game.termination = 'repetition'
+            return game
+        if len(game.moves) >= task.max_plies:
+            game.termination = 'move limit'
+            return game
+        color = board.moving_side
+        start = time.perf_counter()
+        move = engines[color].get_best_move(board, sessions[color])
+        game.search_times[color] += time.perf_counter() - start
+        game.nodes[color] += engines[color].nodes
+        game.move_counts[color] += 1
+        game.moves.append(str(move))
+        board.make_move(move)
+
+
+class EngineStats:
+    def __init__(self):
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+        self.moves = 0
+        self.search_time = 0.0
+        self.nodes = 0
+
+    def get_games(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    def get_score(self) -> float:
+        """fraction of the points won"""
+        return (self.wins + self.draws / 2) / max(1, self.get_games())
+
+    def get_elo_difference(self) -> float:
+        """rating difference to the average opponent implied by the score"""
+        score = self.get_score()
+        if score <= 0 or score >= 1:
+            return math.copysign(math.inf, score - 0.5)
+        return -400 * math.log10(1 / score - 1)
+
+
+class Tournament:
+    def __init__(self, engines: List[EngineConfig], openings: List[str], swap_colors: bool = True,
+                 max_plies: int = DEFAULT_MAX_PLIES, use_bitboard: bool = False):
+        self.engines = engines
+        self.openings = openings
+        self.swap_colors = swap_colors
+        self.max_plies = max_plies
+        self.use_bitboard = use_bitboard
+        self.games: List[GameResult] = []
+        self.stats: Dict[int, EngineStats] = {index: EngineStats() for index in range(len(engines))}
+
+    def get_tasks(self) -> List[Tuple[GameTask, int, int]]:
+        """(game, index of the white engine, index of the black engine) of every game of the tournament"""
+        tasks = []
+        for first in range(len(self.engines)):
+            for second in range(first + 1, len(self.engines)):
+                for opening in self.openings:
+                    pairings = [(first, second), (second, first)] if self.swap_colors else [(first, second)]
+                    for white, black in pairings:
+                        task = GameTask(len(tasks) + 1, self.engines[white], self.engines[black], opening,
+                                        self.max_plies, self.use_bitboard)
+                        tasks.append((task, white, black))
+        return tasks
+
+    def add_result(self, game: GameResult, white: int, black: int) -> None:
+        self.games.append(game)
+        for index, color in ((white, PieceColor.WHITE), (black, PieceColor.BLACK)):
+            stats = self.stats[index]
+            if game.result == DRAW:
+                stats.draws += 1
+            elif (game.result == WHITE_WIN) == (color == PieceColor.WHITE):
+                stats.wins += 1
+            else:
+                stats.losses += 1
+            stats.moves += game.move_counts[color]
+            stats.search_time += game.search_times[color]
+            stats.nodes += game.nodes[color]
+
+    def run(self, workers: int) -> None:
+        tasks = self.get_tasks()
+        with ProcessPoolExecutor(workers) as pool:
+            futures = {pool.submit(play_game, task): (white, black) for task, white, black in tasks}
+            for future in as_completed(futures):
+                game = future.result()
+                self.add_result(game, *futures[future])
+                print(f'{len(self.games)}/{len(tasks)} round {game.task.round}: {game.task.white} - '
+                      f'{game.task.black} {game.result} ({game.termination}, {len(game.moves)} moves)')
+        self.games.sort(key=lambda result: result.task.round)
+
+    def get_summary(self) -> str:
+        lines = [f'{"engine":<20}{"games":>6}{"+":>5}{"=":>5}{"-":>5}{"score":>8}{"elo":>7}{"ms/move":>10}'
+                 f'{"nodes/s":>10}']
+        for index, engine in enumerate(self.engines):
+            stats = self.stats[index]
+            lines.append(f'{str(engine):<20}{stats.get_games():>6}{stats.wins:>5}{stats.draws:>5}{stats.losses:>5}'
+                         f'{stats.get_score():>8.3f}{stats.get_elo_difference():>7.0f}'
+                         f'{1000 * stats.search_time / max(1, stats.moves):>10.1f}'
+                         f'{stats.nodes / max(stats.search_time, 1e-9):>10.0f}')
+        return '\n'.join(lines)
+
+
+def get_pdn(game: GameResult, event: str = 'Engine tournament') -> str:
+    """the game in Portable Draughts Notation, moves written by `Move.__str__`"""
+    task = game.task
+    tags = [('Event', event), ('Date', date.today().strftime('%Y.%m.%d')), ('Round', str(task.round)),
+            ('White', str(task.white)), ('Black', str(task.black)), ('Result', game.result),
+            ('GameType', '21'), ('FEN', task.opening), ('Termination', game.termination)]
+    lines = [f'[{name} "{value}"]' for name, value in tags]
+    # moves are numbered from the start of the game, with white moving first
+    white_to_move = parse_fen(task.opening)[3] == PieceColor.WHITE
+    tokens = [] if white_to_move else ['1...']
+    for index, move in enumerate(game.moves):
+        if (index % 2 == 0) == white_to_move:
+            tokens.append(f'{(index + (0 if white_to_move else 1)) // 2 + 1}.')
+        tokens.append(move)
+    tokens.append(game.result)
+    line = ''
+    movetext = []
+    for token in tokens:
+        if len(line) + len(token) + 1 > 79:
+            movetext.append(line)
+            line = ''
+        line = f'{line} {token}' if len(line) else token
+    movetext.append(line)
+    return '\n'.join(lines) + '\n\n' + '\n'.join(movetext) + '\n'
+
+
+def write_pdn(path: str, games: List[GameResult]) -> None:
+    with open(path, 'w') as file:
+        file.write('\n'.join(get_pdn(game) for game in games))
+
+
+def get_openings(plies: int) -> List[str]:
+    """every distinct position `plies` moves after the starting one"""
+    positions: Dict[int, str] = {}
+
+    def visit(board: AnyBoard, depth: int):
+        if depth == 0:
+            positions.setdefault(board.hash, get_fen(board))
+            return
+        capture_moves, standard_moves = board.generate_moves()
+        for move in capture_moves if len(capture_moves) else standard_moves:
+            undo = board.make_move(move)
+            visit(board, depth - 1)
+            board.unmake_move(undo)
+
+    visit(create_board(True), plies)
+    return sorted(positions.values())
+
+
+def read_openings(path: str) -> List[str]:
+    with open(path) as file:
+        openings = [line.strip() for line in file if len(line.strip()) and not line.startswith('#')]
+    for opening in openings:
+        parse_fen(opening)
+    return openings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plays engines against each other from a set of openings.')
+    parser.add_argument('--engines', nargs='+', default=['4', '6'],
+                        help='engines as DIFFICULTY or DIFFICULTY/TIME_LIMIT_MS, at least two')
+    parser.add_argument('--openings', help='file with one FEN position per line')
+    parser.add_argument('--opening-plies', type=int, default=2,
+                        help='without --openings, all positions this many moves after the start are played')
+    parser.add_argument('--no-swap', action='store_true', help='play every opening once instead of with both colours')
+    parser.add_argument('--max-plies', type=int, default=DEFAULT_MAX_PLIES, help='games longer than this are drawn')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='games played at the same time')
+    parser.add_argument('--bitboard', action='store_true', help='use BitBoard instead of Board')
+    parser.add_argument('--output', help='path of the PDN file the games are written to')
+    arguments = parser.parse_args()
+    engine_configs = [EngineConfig.from_string(engine) for engine in arguments.engines]
+    if len(engine_configs) < 2:
+        parser.error('at least two engines are needed')
+    opening_positions = read_openings(arguments.openings) if arguments.openings else \
+        get_openings(arguments.opening_plies) if arguments.opening_plies else [STARTING_FEN]
+    tournament = Tournament(engine_configs, opening_positions, not arguments.no_swap, arguments.max_plies,
+                            arguments.bitboard)
+    start_time = time.perf_counter()
+    tournament.run(arguments.workers)
+    print(f'{len(tournament.games)} games in {time.perf_counter() - start_time:.1f}s')
+    print(tournament.get_summary())
+    if arguments.output:
+        write_pdn(arguments.output, tournament.games)
+        print(f'games written to {arguments.output}')
@@ -0,0 +1,63 @@
+from enum import Enum
+from typing import List, Optional
+from board.move import Move
+
+
+class Bound(Enum):
+    EXACT = 'EXACT'
+    LOWER = 'LOWER'  # search failed high, real score is at least `score`
+    UPPER = 'UPPER'  # search failed low, real score is at most `score`
+
+
+class TranspositionEntry:
+    __slots__ = ('key', 'depth', 'score', 'bound', 'best_move', 'age')
+
+    def __init__(self, key: int, depth: int, score: float, bound: Bound, best_move: Optional[Move], age: int):
+        self.key = key
+        self.depth = depth
+        self.score = score
+        self.bound = bound
+        self.best_move = best_move
+        self.age = age  # search that stored the entry
+
+
+class TranspositionTable:
+    """Fixed size hash table of search results indexed by zobrist hash. Scores are stored from the point of view
+    of the side to move. Each hash maps to a single slot, a deeper search result replaces a shallower one and any
+    result replaces one stored by an earlier search."""
+
+    def __init__(self, size: int = 1 << 18):
+        self.size = size
+        self._entries: List[Optional[TranspositionEntry]] = [None] * size
+        self.probes = 0
+        self.hits = 0
+        self.age = 0
+
+    def clear(self) -> None:
+        self._entries = [None] * self.size
+        self.probes = 0
+        self.hits = 0
+        self.age = 0
+
+    def new_search(self) -> None:
+        """keeps the entries for the next search, but lets it overwrite them regardless of depth"""
+        self.probes = 0
+        self.hits = 0
+        self.age += 1
+
+    def probe(self, key: int) -> Optional[TranspositionEntry]:
+        self.probes += 1
+        entry = self._entries[key % self.size]
+        if entry is None or entry.key != key:
+            return None
+        self.hits += 1
+        return entry
+
+    def store(self, key: int, depth: int, score: float, bound: Bound, best_move: Optional[Move]) -> None:
+        index = key % self.size
+        entry = self._entries[index]
+        if entry is None or entry.key == key or depth >= entry.depth or entry.age != self.age:
+            self._entries[index] = TranspositionEntry(key, depth, score, bound, best_move, self.age)
+
+    def get_hit_rate(self) -> float:
+        return self.hits / self.probes if self.probes else 0.0
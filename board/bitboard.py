@@ -0,0 +1,361 @@
+from typing import Dict, List, Set, Optional, Union, TYPE_CHECKING
+from board.board import Board
+from board.move import Move, MoveType, SIMPLE_MOVES, KEY_LENGTH_SHIFT, KEY_LENGTH_MASK, KEY_SQUARES_SHIFT, \
+    KEY_SQUARE_BITS, KEY_SQUARE_MASK
+from board.piece import Piece, PieceColor, PieceType, PIECE_TO_CHAR
+from board.squares import SQUARES_COUNT, FULL_MASK, NEIGHBOURS, JUMPS, DIRECTION_SHIFTS, JUMP_SHIFTS, \
+    SQUARE_COORDINATES, COORDINATES_SQUARE, WHITE_PAWN_DIRECTIONS, BLACK_PAWN_DIRECTIONS, WHITE_PROMOTION_MASK, \
+    BLACK_PROMOTION_MASK, pop_count, iterate_squares
+from board.zobrist import WHITE_PAWN_KEYS, WHITE_KING_KEYS, BLACK_PAWN_KEYS, BLACK_KING_KEYS, BLACK_TO_MOVE_KEY, \
+    hash_masks
+from board.evaluation import PAWN_VALUE, KING_VALUE, MOBILITY_VALUE, WHITE_PAWN_SQUARE_VALUES, \
+    BLACK_PAWN_SQUARE_VALUES, KING_SQUARE_VALUES
+
+if TYPE_CHECKING:
+    from board.board import Coordinates, MovesTuple
+
+WHITE_STARTING_MASK = 0xFFF00000  # squares 21-32
+BLACK_STARTING_MASK = 0x00000FFF  # squares 1-12
+
+# STEP_SHIFTS[color] - (source mask, shift) pairs of the steps of pawns of `color`, kings also step like the pawns
+# of the other color. In the order of `DIRECTION_SHIFTS`, so moves are generated in the same order as before.
+STEP_SHIFTS = {
+    color: [step_shift for direction in directions for step_shift in DIRECTION_SHIFTS[direction]]
+    for color, directions in ((PieceColor.WHITE, WHITE_PAWN_DIRECTIONS), (PieceColor.BLACK, BLACK_PAWN_DIRECTIONS))
+}
+# `JUMP_SHIFTS` split by the sign of the shifts, which is the same for the jumped and the landing square
+HIGHER_SQUARE_JUMP_SHIFTS = [(mask, jumped, landing) for mask, jumped, landing in JUMP_SHIFTS if jumped > 0]
+LOWER_SQUARE_JUMP_SHIFTS = [(mask, -jumped, -landing) for mask, jumped, landing in JUMP_SHIFTS if jumped < 0]
+# JUMPED_SQUARES[square][landing square] - square captured by the jump, -1 for squares that are not a jump apart
+JUMPED_SQUARES = [[-1] * SQUARES_COUNT for _ in range(SQUARES_COUNT)]
+for _square, _jumps in enumerate(JUMPS):
+    for _jumped_square, _landing_square in _jumps:
+        JUMPED_SQUARES[_square][_landing_square] = _jumped_square
+
+
+class BitBoardUndo:
+    """Everything `BitBoard.unmake_move` needs to take back a move, captured pieces are kept as masks"""
+
+    def __init__(self, from_bit: int, to_bit: int, captured: int, captured_kings: int, promoted: bool,
+                 moving_side: PieceColor, position_hash: int, material: int, positional: int):
+        self.from_bit = from_bit
+        self.to_bit = to_bit
+        self.captured = captured
+        self.captured_kings = captured_kings
+        self.promoted = promoted
+        self.moving_side = moving_side
+        self.hash = position_hash
+        self.material = material
+        self.positional = positional
+
+
+class BitBoard:
+    """Board keeping the position as three 32-bit masks (white pieces, black pieces and kings) over the
+    playable squares. Exposes the same interface as `Board`, so it can be used in its place."""
+
+    def __init__(self):
+        self.white: int = 0
+        self.black: int = 0
+        self.kings: int = 0
+        self.moving_side: PieceColor = PieceColor.WHITE
+        self.ply: int = 0  # moves made since the starting position
+        self.hash: int = 0  # zobrist hash of the position, updated by `make_move`
+        # evaluation terms from white's point of view, updated by `make_move`
+        self.material: int = 0
+        self.positional: int = 0
+        self.piece_square_weight: int = 0  # positional bonuses are not counted by default
+        self._pieces_view: Optional[Dict['Coordinates', Piece]] = None
+        self.set_starting_position()
+
+    def set_starting_position(self):
+        self.white = WHITE_STARTING_MASK
+        self.black = BLACK_STARTING_MASK
+        self.kings = 0
+        self.moving_side = PieceColor.WHITE
+        self.ply = 0
+        self.hash = hash_masks(self.white, self.black, self.kings, self.moving_side)
+        self.material, self.positional = self._compute_evaluation_terms()
+        self._pieces_view = None
+
+    def set_position(self, white: int, black: int, kings: int, moving_side: PieceColor):
+        self.white = white
+        self.black = black
+        self.kings = kings
+        self.moving_side = moving_side
+        self.ply = 0
+        self.hash = hash_masks(self.white, self.black, self.kings, self.moving_side)
+        self.material, self.positional = self._compute_evaluation_terms()
+        self._pieces_view = None
+
+    def copy(self) -> 'BitBoard':
+        """independent board with the same position"""
+        board = BitBoard()
+        board.set_position(*self.get_masks(), self.moving_side)
+        board.ply = self.ply
+        board.piece_square_weight = self.piece_square_weight
+        return board
+
+    def get_masks(self):
+        """returns (white pieces, black pieces, kings) masks"""
+        return self.white, self.black, self.kings
+
+    def count_pieces(self) -> int:
+        return pop_count(self.white | self.black)
+
+    def _compute_evaluation_terms(self):
+        """material and positional balance counted from scratch"""
+        material = 0
+        positional = 0
+        for square in iterate_squares(self.white):
+            is_king = self.kings >> square & 1
+            material += KING_VALUE if is_king else PAWN_VALUE
+            positional += KING_SQUARE_VALUES[square] if is_king else WHITE_PAWN_SQUARE_VALUES[square]
+        for square in iterate_squares(self.black):
+            is_king = self.kings >> square & 1
+            material -= KING_VALUE if is_king else PAWN_VALUE
+            positional -= KING_SQUARE_VALUES[square] if is_king else BLACK_PAWN_SQUARE_VALUES[square]
+        return material, positional
+
+    @property
+    def board(self) -> Dict['Coordinates', Piece]:
+        """`Board.board` compatible view of the position, rebuilt only after the position changes"""
+        if self._pieces_view is None:
+            self._pieces_view = {}
+            for color, mask in ((PieceColor.WHITE, self.white), (PieceColor.BLACK, self.black)):
+                for square in iterate_squares(mask):
+                    piece_type = PieceType.KING if self.kings >> square & 1 else PieceType.PAWN
+                    coordinates = SQUARE_COORDINATES[square]
+                    self._pieces_view[coordinates] = Piece(piece_type, color, coordinates)
+        return self._pieces_view
+
+    @property
+    def white_pieces(self) -> Set[Piece]:
+        return {piece for piece in self.board.values() if piece.color == PieceColor.WHITE}
+
+    @property
+    def black_pieces(self) -> Set[Piece]:
+        return {piece for piece in self.board.values() if piece.color == PieceColor.BLACK}
+
+    def _get_masks(self, color: PieceColor):
+        """returns (own pieces, opponent pieces) masks for `color`"""
+        if color == PieceColor.WHITE:
+            return self.white, self.black
+        return self.black, self.white
+
+    def _find_capture_paths(self, square: int, opponent: int, occupied: int, captured: int) -> List[List[int]]:
+        """finds all capture sequences starting at `square`, the moving piece keeps occupying its starting square"""
+        found_paths: List[List[int]] = []
+        for jumped_square, landing_square in JUMPS[square]:
+            jumped_bit = 1 << jumped_square
+            if not opponent & jumped_bit or captured & jumped_bit or occupied >> landing_square & 1:
+                continue
+            next_paths = self._find_capture_paths(landing_square, opponent, occupied, captured | jumped_bit)
+            if len(next_paths) == 0:
+                found_paths.append([square, landing_square])
+            for path in next_paths:
+                path.insert(0, square)
+                found_paths.append(path)
+        return found_paths
+
+    def _get_capturing_pieces(self, own: int, opponent: int) -> int:
+        """mask of own pieces that have at least one capture available"""
+        # shifts are written out instead of calling `shift`, this runs for every node of the search
+        empty = FULL_MASK & ~(self.white | self.black)
+        capturing = 0
+        for mask, jumped_delta, landing_delta in HIGHER_SQUARE_JUMP_SHIFTS:
+            capturing |= mask & (opponent >> jumped_delta) & (empty >> landing_delta)
+        for mask, jumped_delta, landing_delta in LOWER_SQUARE_JUMP_SHIFTS:
+            capturing |= mask & (opponent << jumped_delta) & (empty << landing_delta)
+        return own & capturing
+
+    def _get_captures(self, own: int, opponent: int) -> List[Move]:
+        capturing = self._get_capturing_pieces(own, opponent)
+        if not capturing:
+            return []
+        occupied = self.white | self.black
+        captures: List[Move] = []
+        for square in iterate_squares(capturing):
+            for path in self._find_capture_paths(square, opponent, occupied, 0):
+                captures.append(Move.from_squares(MoveType.CAPTURE, path))
+        return captures
+
+    def _get_step_shifts(self, color: PieceColor):
+        """returns ((pieces, their step shifts), (kings, their backward step shifts)) of `color`"""
+        if color == PieceColor.WHITE:
+            return (self.white, STEP_SHIFTS[PieceColor.WHITE]), (self.white & self.kings, STEP_SHIFTS[PieceColor.BLACK])
+        return (self.black, STEP_SHIFTS[PieceColor.BLACK]), (self.black & self.kings, STEP_SHIFTS[PieceColor.WHITE])
+
+    def _get_standard_moves(self, color: PieceColor) -> List[Move]:
+        empty = FULL_MASK & ~(self.white | self.black)
+        standard: List[Move] = []
+        for movers, step_shifts in self._get_step_shifts(color):
+            if not movers:
+                continue
+            for mask, delta in step_shifts:
+                targets = ((movers & mask) << delta if delta > 0 else (movers & mask) >> -delta) & empty
+                while targets:
+                    target_bit = targets & -targets
+                    target = target_bit.bit_length() - 1
+                    standard.append(SIMPLE_MOVES[target - delta][target])
+                    targets ^= target_bit
+        return standard
+
+    def count_standard_moves(self, color: PieceColor) -> int:
+        empty = FULL_MASK & ~(self.white | self.black)
+        count = 0
+        for movers, step_shifts in self._get_step_shifts(color):
+            if not movers:
+                continue
+            for mask, delta in step_shifts:
+                targets = ((movers & mask) << delta if delta > 0 else (movers & mask) >> -delta) & empty
+                if targets:
+                    count += bin(targets).count('1')
+        return count
+
+    def generate_moves(self) -> 'MovesTuple':
+        own, opponent = self._get_masks(self.moving_side)
+        return self._get_captures(own, opponent), self._get_standard_moves(self.moving_side)
+
+    def generate_captures(self) -> List[Move]:
+        """capture moves of the side to move, without generating the other moves"""
+        own, opponent = self._get_masks(self.moving_side)
+        return self._get_captures(own, opponent)
+
+    def find_all_captures(self, position: 'Coordinates', piece_color: PieceColor) -> List[Move]:
+        """finds all captures that piece placed at `position` can make"""
+        _, opponent = self._get_masks(piece_color)
+        paths = self._find_capture_paths(COORDINATES_SQUARE[position], opponent, self.white | self.black, 0)
+        return [Move.from_squares(MoveType.CAPTURE, path) for path in paths]
+
+    def get_piece_moves(self, piece: Piece) -> 'MovesTuple':
+        square = COORDINATES_SQUARE[piece.position]
+        captures = self.find_all_captures(piece.position, piece.color)
+        if self.kings >> square & 1:
+            directions = WHITE_PAWN_DIRECTIONS + BLACK_PAWN_DIRECTIONS
+        else:
+            directions = WHITE_PAWN_DIRECTIONS if piece.color == PieceColor.WHITE else BLACK_PAWN_DIRECTIONS
+        occupied = self.white | self.black
+        standard: List[Move] = []  # non-capture moves
+        for direction in directions:
+            target = NEIGHBOURS[square][direction]
+            if target is None or occupied >> target & 1:
+                continue
+            standard.append(SIMPLE_MOVES[square][target])
+        return captures, standard
+
+    def make_move(self, move: Move) -> BitBoardUndo:
+        # squares are read from the move key, without looking coordinates up
+        key = move.key
+        last_square_shift = KEY_SQUARES_SHIFT + ((key >> KEY_LENGTH_SHIFT & KEY_LENGTH_MASK) - 1) * KEY_SQUARE_BITS
+        from_square = key >> KEY_SQUARES_SHIFT & KEY_SQUARE_MASK
+        to_square = key >> last_square_shift & KEY_SQUARE_MASK
+        from_bit = 1 << from_square
+        to_bit = 1 << to_square
+        previous_hash, previous_material, previous_positional = self.hash, self.material, self.positional
+        if self.moving_side == PieceColor.WHITE:
+            self.white ^= from_bit | to_bit
+            promotion_mask = WHITE_PROMOTION_MASK
+            pawn_keys, king_keys, opponent_pawn_keys, opponent_king_keys = \
+                WHITE_PAWN_KEYS, WHITE_KING_KEYS, BLACK_PAWN_KEYS, BLACK_KING_KEYS
+            pawn_square_values, opponent_pawn_square_values = WHITE_PAWN_SQUARE_VALUES, BLACK_PAWN_SQUARE_VALUES
+            sign = 1
+        else:
+            self.black ^= from_bit | to_bit
+            promotion_mask = BLACK_PROMOTION_MASK
+            pawn_keys, king_keys, opponent_pawn_keys, opponent_king_keys = \
+                BLACK_PAWN_KEYS, BLACK_KING_KEYS, WHITE_PAWN_KEYS, WHITE_KING_KEYS
+            pawn_square_values, opponent_pawn_square_values = BLACK_PAWN_SQUARE_VALUES, WHITE_PAWN_SQUARE_VALUES
+            sign = -1
+        if self.kings & from_bit:
+            self.kings ^= from_bit | to_bit
+            self.hash ^= king_keys[from_square] ^ king_keys[to_square]
+            self.positional += sign * (KING_SQUARE_VALUES[to_square] - KING_SQUARE_VALUES[from_square])
+        else:
+            self.hash ^= pawn_keys[from_square] ^ pawn_keys[to_square]
+            self.positional += sign * (pawn_square_values[to_square] - pawn_square_values[from_square])
+        captured = 0
+        captured_kings = 0
+        if key & 1:
+            # remove captured pieces from the board
+            square = from_square
+            for square_shift in range(KEY_SQUARES_SHIFT + KEY_SQUARE_BITS, last_square_shift + 1, KEY_SQUARE_BITS):
+                landing_square = key >> square_shift & KEY_SQUARE_MASK
+                captured_square = JUMPED_SQUARES[square][landing_square]
+                square = landing_square
+                captured |= 1 << captured_square
+                if self.kings >> captured_square & 1:
+                    self.hash ^= opponent_king_keys[captured_square]
+                    self.material += sign * KING_VALUE
+                    self.positional += sign * KING_SQUARE_VALUES[captured_square]
+                else:
+                    self.hash ^= opponent_pawn_keys[captured_square]
+                    self.material += sign * PAWN_VALUE
+                    self.positional += sign * opponent_pawn_square_values[captured_square]
+            if self.moving_side == PieceColor.WHITE:
+                self.black ^= captured
+            else:
+                self.white ^= captured
+            captured_kings = self.kings & captured
+            self.kings ^= captured_kings
+        promoted = bool(to_bit & promotion_mask and not self.kings & to_bit)
+        if promoted:
+            self.kings |= to_bit
+            self.hash ^= pawn_keys[to_square] ^ king_keys[to_square]
+            self.material += sign * (KING_VALUE - PAWN_VALUE)
+            self.positional += sign * (KING_SQUARE_VALUES[to_square] - pawn_square_values[to_square])
+        undo = BitBoardUndo(from_bit, to_bit, captured, captured_kings, promoted, self.moving_side, previous_hash,
+                            previous_material, previous_positional)
+        self.hash ^= BLACK_TO_MOVE_KEY
+        self.moving_side = PieceColor.BLACK if self.moving_side == PieceColor.WHITE else PieceColor.WHITE
+        self.ply += 1
+        self._pieces_view = None
+        return undo
+
+    def unmake_move(self, undo: 'BitBoardUndo'):
+        """restores the position from before the move that returned `undo`"""
+        self.moving_side = undo.moving_side
+        self.ply -= 1
+        self.hash = undo.hash
+        self.material = undo.material
+        self.positional = undo.positional
+        if undo.promoted:
+            self.kings ^= undo.to_bit
+        if self.kings & undo.to_bit:
+            self.kings ^= undo.from_bit | undo.to_bit
+        if self.moving_side == PieceColor.WHITE:
+            self.white ^= undo.from_bit | undo.to_bit
+            self.black |= undo.captured
+        else:
+            self.black ^= undo.from_bit | undo.to_bit
+            self.white |= undo.captured
+        self.kings |= undo.captured_kings
+        self._pieces_view = None
+
+    def evaluate_position(self, color: PieceColor):
+        result = self.material + self.piece_square_weight * self.positional
+        if color == PieceColor.BLACK:
+            result = -result
+        mobility = MOBILITY_VALUE * self.count_standard_moves(self.moving_side)
+        return result + mobility if self.moving_side == color else result - mobility
+
+    def __str__(self):
+        result = ''
+        for row in range(7, -1, -1):
+            result += '\n'
+            for column in range(8):
+                square = COORDINATES_SQUARE.get((column, row))
+                if square is None or not (self.white | self.black) >> square & 1:
+                    result += '·' + '  '
+                    continue
+                color = PieceColor.WHITE if self.white >> square & 1 else PieceColor.BLACK
+                piece_type = PieceType.KING if self.kings >> square & 1 else PieceType.PAWN
+                result += PIECE_TO_CHAR[color][piece_type] + '  '
+        return result
+
+
+# used for python type hinting
+AnyBoard = Union[Board, BitBoard]
+
+
+def create_board(use_bitboard: bool = False) -> AnyBoard:
+    return BitBoard() if use_bitboard else Board()
@@ -1,7 +1,10 @@
 from typing import Tuple, Dict, List, Set
 from itertools import product
-from board.move import Move, MoveType
-from board.piece import Piece, PieceColor, PieceType, MOVE_DIRECTIONS
+from board.move import Move, MoveType, STEP_MOVES
+from board.piece import Piece, PieceColor, PieceType
+from board.zobrist import BLACK_TO_MOVE_KEY, get_piece_key, hash_pieces
+from board.squares import SQUARES_COUNT, SQUARE_COORDINATES, COORDINATES_SQUARE, STEPS, CAPTURE_JUMPS
+from board.evaluation import PIECE_VALUES, PIECE_SQUARE_VALUES, MOBILITY_VALUE
 
 # used for python type hinting
 Coordinates = Tuple[int, int]
@@ -9,12 +12,43 @@ MoveDirections = List[Coordinates]
 MovesTuple = Tuple[List['Move'], List['Move']]
 
 
+class MoveUndo:
+    """Everything `Board.unmake_move` needs to take back a move made with `Board.make_move`"""
+
+    def __init__(self, moved_piece: Piece, start_position: Coordinates, captured_pieces: List[Piece], promoted: bool,
+                 moving_side: PieceColor, position_hash: int, material: int, positional: int):
+        self.moved_piece = moved_piece
+        self.start_position = start_position
+        self.captured_pieces = captured_pieces
+        self.promoted = promoted
+        self.moving_side = moving_side
+        self.hash = position_hash
+        self.material = material
+        self.positional = positional
+
+
+def get_piece_value(piece: Piece) -> int:
+    value = PIECE_VALUES[piece.type]
+    return value if piece.color == PieceColor.WHITE else -value
+
+
+def get_piece_square_value(piece: Piece) -> int:
+    value = PIECE_SQUARE_VALUES[piece.color][piece.type][COORDINATES_SQUARE[piece.position]]
+    return value if piece.color == PieceColor.WHITE else -value
+
+
 class Board:
     def __init__(self):
         self.board: Dict[Coordinates, Piece] = {}
         self.moving_side: PieceColor = PieceColor.WHITE
+        self.ply: int = 0  # moves made since the starting position
         self.white_pieces: Set[Piece] = set()
         self.black_pieces: Set[Piece] = set()
+        self.hash: int = 0  # zobrist hash of the position, updated by `make_move`
+        # evaluation terms from white's point of view, updated by `make_move`
+        self.material: int = 0
+        self.positional: int = 0
+        self.piece_square_weight: int = 0  # positional bonuses are not counted by default
         self.set_starting_position()
 
     @staticmethod
@@ -24,59 +58,102 @@ class Board:
     def get_piece_moves(self, piece: Piece) -> MovesTuple:
         captures = self.find_all_captures(piece.position, piece.color)
         standard: List[Move] = []  # non-capture moves
-        for direction in piece.get_move_directions():
-            new_coordinates = Board.get_new_position(piece.position, direction, 1)
-            if not self.is_in_board(new_coordinates) or self.board.get(new_coordinates) is not None:
-                continue
-            standard.append(Move(MoveType.NORMAL, [piece.position, new_coordinates]))
+        board = self.board
+        for new_coordinates, move in STEP_MOVES[piece.color][piece.type][piece.position]:
+            if new_coordinates not in board:
+                standard.append(move)
         return captures, standard
 
     def find_all_captures(self, position: Coordinates, piece_color: PieceColor, captured_pieces: Set[Piece] = set()) -> \
     List[Move]:
         """finds all captures that piece placed at `position` can make"""
-        found_moves: List[Move] = []
+        return [Move(MoveType.CAPTURE, move_squares)
+                for move_squares in self._find_capture_paths(position, piece_color, set(captured_pieces))]
+
+    def _find_capture_paths(self, position: Coordinates, piece_color: PieceColor,
+                            captured_pieces: Set[Piece]) -> List[List[Coordinates]]:
+        """squares visited by every capture starting at `position`, `captured_pieces` is restored before returning"""
+        found_paths: List[List[Coordinates]] = []
+        board = self.board
         # captures can be made in any direction
-        for direction in MOVE_DIRECTIONS[PieceType.KING]:
-            captured_piece_position = Board.get_new_position(position, direction, 1)
-            captured_piece = self.board.get(captured_piece_position)
-            if captured_piece in captured_pieces:
-                # cannot capture the same piece twice in one move
-                continue
+        for captured_piece_position, jump_square in CAPTURE_JUMPS[position]:
+            captured_piece = board.get(captured_piece_position)
             if captured_piece is None or captured_piece.color == piece_color:
                 # piece that was about to be captured has the same color as moving piece
                 continue
-            jump_square = Board.get_new_position(position, direction, 2)  # square where piece will land after capture
-            if self.board.get(jump_square) is None and self.is_in_board(jump_square):
-                captured_pieces.add(captured_piece)
-                next_captures = self.find_all_captures(jump_square, piece_color, captured_pieces)
-                if len(next_captures) == 0:
-                    found_moves.append(Move(MoveType.CAPTURE, [position, jump_square]))
-                for move in next_captures:
-                    found_moves.append(Move(MoveType.CAPTURE, [position]) + move)
-                captured_pieces.remove(captured_piece)
-        return found_moves
-
-    def make_move(self, move: Move):
-        moved_piece = self.board[move.move_squares[0]]
-        final_square = move.move_squares[-1]
+            if captured_piece in captured_pieces or jump_square in board:
+                # cannot capture the same piece twice in one move or land on an occupied square
+                continue
+            captured_pieces.add(captured_piece)
+            next_paths = self._find_capture_paths(jump_square, piece_color, captured_pieces)
+            captured_pieces.remove(captured_piece)
+            if len(next_paths) == 0:
+                found_paths.append([position, jump_square])
+            for path in next_paths:
+                path.insert(0, position)
+                found_paths.append(path)
+        return found_paths
+
+    def make_move(self, move: Move) -> MoveUndo:
+        moved_piece = self.board[move.squares[0]]
+        start_position = moved_piece.position
+        previous_hash, previous_material, previous_positional = self.hash, self.material, self.positional
+        self.hash ^= get_piece_key(moved_piece) ^ BLACK_TO_MOVE_KEY
+        self.material -= get_piece_value(moved_piece)
+        self.positional -= get_piece_square_value(moved_piece)
+        final_square = move.squares[-1]
         self.board.pop(moved_piece.position)
         self.board[final_square] = moved_piece
         moved_piece.position = final_square
+        captured_pieces: List[Piece] = []
         if move.move_type == MoveType.CAPTURE:
             # remove captured pieces from the board
-            for moved_from, moved_to in zip(move.move_squares, move.move_squares[1:]):
+            for moved_from, moved_to in zip(move.squares, move.squares[1:]):
                 captured_piece_pos = ((moved_from[0] + moved_to[0]) // 2, (moved_from[1] + moved_to[1]) // 2)
                 captured_piece = self.board[captured_piece_pos]
                 waiting_pieces = self.white_pieces if self.moving_side == PieceColor.BLACK else self.black_pieces
                 waiting_pieces.remove(captured_piece)
                 self.board.pop(captured_piece_pos)
-        if final_square[1] == 7 and moved_piece.color == PieceColor.WHITE:
-            # promotion
-            moved_piece.type = PieceType.KING
-        if final_square[1] == 0 and moved_piece.color == PieceColor.BLACK:
-            # promotion
-            moved_piece.type = PieceType.KING
+                captured_pieces.append(captured_piece)
+                self.hash ^= get_piece_key(captured_piece)
+                self.material -= get_piece_value(captured_piece)
+                self.positional -= get_piece_square_value(captured_piece)
+        promoted = False
+        if moved_piece.type == PieceType.PAWN:
+            if final_square[1] == 7 and moved_piece.color == PieceColor.WHITE:
+                # promotion
+                moved_piece.type = PieceType.KING
+                promoted = True
+            if final_square[1] == 0 and moved_piece.color == PieceColor.BLACK:
+                # promotion
+                moved_piece.type = PieceType.KING
+                promoted = True
+        self.hash ^= get_piece_key(moved_piece)
+        self.material += get_piece_value(moved_piece)
+        self.positional += get_piece_square_value(moved_piece)
+        undo = MoveUndo(moved_piece, start_position, captured_pieces, promoted, self.moving_side, previous_hash,
+                        previous_material, previous_positional)
         self.moving_side = PieceColor.BLACK if self.moving_side == PieceColor.WHITE else PieceColor.WHITE
+        self.ply += 1
+        return undo
+
+    def unmake_move(self, undo: MoveUndo):
+        """restores the position from before the move that returned `undo`"""
+        self.moving_side = undo.moving_side
+        self.ply -= 1
+        self.hash = undo.hash
+        self.material = undo.material
+        self.positional = undo.positional
+        moved_piece = undo.moved_piece
+        self.board.pop(moved_piece.position)
+        self.board[undo.start_position] = moved_piece
+        moved_piece.position = undo.start_position
+        if undo.promoted:
+            moved_piece.type = PieceType.PAWN
+        waiting_pieces = self.white_pieces if self.moving_side == PieceColor.BLACK else self.black_pieces
+        for captured_piece in undo.captured_pieces:
+            self.board[captured_piece.position] = captured_piece
+            waiting_pieces.add(captured_piece)
 
     def generate_moves(self) -> MovesTuple:
         moving_pieces = self.white_pieces if self.moving_side == PieceColor.WHITE else self.black_pieces
@@ -88,6 +165,13 @@ class Board:
             standard_moves += piece_standard_moves
         return capture_moves, standard_moves
 
+    def generate_captures(self) -> List[Move]:
+        """capture moves of the side to move, without generating the other moves"""
+        capture_moves: List[Move] = []
+        for piece in self.white_pieces if self.moving_side == PieceColor.WHITE else self.black_pieces:
+            capture_moves += self.find_all_captures(piece.position, piece.color)
+        return capture_moves
+
     def is_move_valid(self, piece: Piece, direction: Coordinates, new_coordinates: Coordinates):
         if not self.is_in_board(new_coordinates):
             # outside of the board
@@ -111,6 +195,53 @@ class Board:
                 created_piece = Piece(PieceType.PAWN, PieceColor.BLACK, (column, row))
                 self.board[column, row] = created_piece
                 self.black_pieces.add(created_piece)
+        self.ply = 0
+        self.hash = hash_pieces(self.board.values(), self.moving_side)
+        self.material = sum(get_piece_value(piece) for piece in self.board.values())
+        self.positional = sum(get_piece_square_value(piece) for piece in self.board.values())
+
+    def set_position(self, white: int, black: int, kings: int, moving_side: PieceColor):
+        """sets up the position given as masks over squares, as kept by `BitBoard`"""
+        self.board = {}
+        self.white_pieces = set()
+        self.black_pieces = set()
+        for color, mask, pieces in ((PieceColor.WHITE, white, self.white_pieces),
+                                    (PieceColor.BLACK, black, self.black_pieces)):
+            for square in range(SQUARES_COUNT):
+                if mask >> square & 1:
+                    piece_type = PieceType.KING if kings >> square & 1 else PieceType.PAWN
+                    created_piece = Piece(piece_type, color, SQUARE_COORDINATES[square])
+                    self.board[created_piece.position] = created_piece
+                    pieces.add(created_piece)
+        self.moving_side = moving_side
+        self.ply = 0
+        self.hash = hash_pieces(self.board.values(), self.moving_side)
+        self.material = sum(get_piece_value(piece) for piece in self.board.values())
+        self.positional = sum(get_piece_square_value(piece) for piece in self.board.values())
+
+    def copy(self) -> 'Board':
+        """independent board with the same position"""
+        board = Board()
+        board.set_position(*self.get_masks(), self.moving_side)
+        board.ply = self.ply
+        board.piece_square_weight = self.piece_square_weight
+        return board
+
+    def get_masks(self) -> Tuple[int, int, int]:
+        """returns (white pieces, black pieces, kings) masks over squares"""
+        white = black = kings = 0
+        for position, piece in self.board.items():
+            bit = 1 << COORDINATES_SQUARE[position]
+            if piece.color == PieceColor.WHITE:
+                white |= bit
+            else:
+                black |= bit
+            if piece.type == PieceType.KING:
+                kings |= bit
+        return white, black, kings
+
+    def count_pieces(self) -> int:
+        return len(self.board)
 
     def __str__(self):
         result = ''
@@ -124,27 +255,19 @@ class Board:
                     result += str(piece) + '  '
         return result
 
+    def count_standard_moves(self, color: PieceColor) -> int:
+        count = 0
+        board = self.board
+        steps = STEPS[color]
+        for piece in self.white_pieces if color == PieceColor.WHITE else self.black_pieces:
+            for target in steps[piece.type][piece.position]:
+                if target not in board:
+                    count += 1
+        return count
+
     def evaluate_position(self, color: PieceColor):
-        result = 0
-        own_pieces = len(self.black_pieces) if color == PieceColor.BLACK else len(self.white_pieces)
-        opponent_pieces = len(self.white_pieces) if color == PieceColor.BLACK else len(self.black_pieces)
-        for coordinates in self.board:
-            piece = self.board[coordinates]
-            if piece.color == color:
-                if piece.type == PieceType.KING:
-                    result += 10
-                else:
-                    result += 5
-            else:
-                if piece.type == PieceType.KING:
-                    result -= 10
-                else:
-                    result -= 5
-        _, captures = self.generate_moves()
-        for move in captures:
-            piece = self.board[move.move_squares[0]]
-            if piece.color == color:
-                result += 3 * (len(move.move_squares) - 1)
-            else:
-                result -= 3 * (len(move.move_squares) - 1)
-        return result + (own_pieces - opponent_pieces) * 1000
+        result = self.material + self.piece_square_weight * self.positional
+        if color == PieceColor.BLACK:
+            result = -result
+        mobility = MOBILITY_VALUE * self.count_standard_moves(self.moving_side)
+        return result + mobility if self.moving_side == color else result - mobility
@@ -0,0 +1,45 @@
+from typing import Dict, List
+from board.piece import PieceColor, PieceType
+from board.squares import SQUARES_COUNT, SQUARE_COORDINATES
+
+# every piece is worth much more than anything else, so the engine never gives material away for position
+PIECE_VALUE = 1000
+PAWN_VALUE = PIECE_VALUE + 5
+KING_VALUE = PIECE_VALUE + 10
+MOBILITY_VALUE = 3  # for each non-capture move of the side to move
+
+PIECE_VALUES: Dict[PieceType, int] = {
+    PieceType.PAWN: PAWN_VALUE,
+    PieceType.KING: KING_VALUE,
+}
+
+
+def _pawn_advancement(color: PieceColor) -> List[int]:
+    """rows moved forward from the pawn's back rank"""
+    rows = [SQUARE_COORDINATES[square][1] for square in range(SQUARES_COUNT)]
+    return rows if color == PieceColor.WHITE else [7 - row for row in rows]
+
+
+def _king_centralization() -> List[int]:
+    result = []
+    for x, y in SQUARE_COORDINATES:
+        distance_from_center = max(abs(2 * x - 7), abs(2 * y - 7)) // 2
+        result.append(3 - distance_from_center)
+    return result
+
+
+# optional positional bonuses, counted only when the board's `piece_square_weight` is not 0
+WHITE_PAWN_SQUARE_VALUES = _pawn_advancement(PieceColor.WHITE)
+BLACK_PAWN_SQUARE_VALUES = _pawn_advancement(PieceColor.BLACK)
+KING_SQUARE_VALUES = _king_centralization()
+
+PIECE_SQUARE_VALUES: Dict[PieceColor, Dict[PieceType, List[int]]] = {
+    PieceColor.WHITE: {
+        PieceType.PAWN: WHITE_PAWN_SQUARE_VALUES,
+        PieceType.KING: KING_SQUARE_VALUES,
+    },
+    PieceColor.BLACK: {
+        PieceType.PAWN: BLACK_PAWN_SQUARE_VALUES,
+        PieceType.KING: KING_SQUARE_VALUES,
+    },
+}
@@ -0,0 +1,47 @@
+from typing import Tuple
+from board.piece import PieceColor
+from board.squares import SQUARES_COUNT
+
+# Positions are written as in PDN: side to move, then the squares of white and black pieces in the 1-32 notation
+# of `Move.__str__`, kings prefixed with K. Ex. the starting position is
+# W:W21,22,23,24,25,26,27,28,29,30,31,32:B1,2,3,4,5,6,7,8,9,10,11,12
+STARTING_FEN = 'W:W' + ','.join(str(square) for square in range(21, 33)) + \
+               ':B' + ','.join(str(square) for square in range(1, 13))
+
+COLOR_TO_CHAR = {PieceColor.WHITE: 'W', PieceColor.BLACK: 'B'}
+CHAR_TO_COLOR = {char: color for color, char in COLOR_TO_CHAR.items()}
+
+
+def parse_fen(fen: str) -> Tuple[int, int, int, PieceColor]:
+    """returns (white pieces, black pieces, kings, side to move), raises ValueError for malformed positions"""
+    fields = fen.strip().rstrip('.').split(':')
+    if len(fields) != 3 or fields[0] not in CHAR_TO_COLOR:
+        raise ValueError(f'invalid FEN: {fen}')
+    masks = {PieceColor.WHITE: 0, PieceColor.BLACK: 0}
+    kings = 0
+    for field in fields[1:]:
+        if len(field) == 0 or field[0] not in CHAR_TO_COLOR:
+            raise ValueError(f'invalid FEN: {fen}')
+        color = CHAR_TO_COLOR[field[0]]
+        for square_string in filter(None, field[1:].split(',')):
+            is_king = square_string.startswith('K')
+            square_string = square_string[1:] if is_king else square_string
+            if not square_string.isdigit() or not 1 <= int(square_string) <= SQUARES_COUNT:
+                raise ValueError(f'invalid FEN: {fen}')
+            bit = 1 << int(square_string) - 1
+            masks[color] |= bit
+            if is_king:
+                kings |= bit
+    if masks[PieceColor.WHITE] & masks[PieceColor.BLACK]:
+        raise ValueError(f'invalid FEN: {fen}')
+    return masks[PieceColor.WHITE], masks[PieceColor.BLACK], kings, CHAR_TO_COLOR[fields[0]]
+
+
+def get_fen(board) -> str:
+    white, black, kings = board.get_masks()
+    fields = [COLOR_TO_CHAR[board.moving_side]]
+    for color, mask in ((PieceColor.WHITE, white), (PieceColor.BLACK, black)):
+        squares = [('K' if kings >> square & 1 else '') + str(square + 1)
+                   for square in range(SQUARES_COUNT) if mask >> square & 1]
+        fields.append(COLOR_TO_CHAR[color] + ','.join(squares))
+    return ':'.join(fields)
@@ -1,9 +1,28 @@
 import re
 from enum import Enum
-from typing import List, TYPE_CHECKING
+from typing import Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+from board.squares import SQUARES_COUNT, SQUARE_COORDINATES, COORDINATES_SQUARE, NEIGHBOURS, STEPS
 
 if TYPE_CHECKING:
     from board.board import Coordinates
+    from board.piece import PieceColor, PieceType
+
+# layout of `Move.key`: capture flag, number of squares, then 5 bits for every square
+KEY_LENGTH_SHIFT = 1
+KEY_SQUARES_SHIFT = 5
+KEY_SQUARE_BITS = 5
+KEY_SQUARE_MASK = (1 << KEY_SQUARE_BITS) - 1
+KEY_LENGTH_MASK = 0xF
+# a capture takes at most the 12 opposing pieces, so a move has at most 13 squares and its key at most 70 bits
+MAX_MOVE_SQUARES = 13
+MAX_KEY_BITS = KEY_SQUARES_SHIFT + MAX_MOVE_SQUARES * KEY_SQUARE_BITS
+
+
+def pack_squares(is_capture: bool, squares: Sequence[int]) -> int:
+    key = len(squares) << KEY_LENGTH_SHIFT | is_capture
+    for index, square in enumerate(squares):
+        key |= square << KEY_SQUARES_SHIFT + index * KEY_SQUARE_BITS
+    return key
 
 
 class MoveType(Enum):
@@ -12,9 +31,27 @@ class MoveType(Enum):
 
 
 class Move:
-    def __init__(self, move_type: MoveType, move_squares: List['Coordinates']):
-        self.move_squares = move_squares
+    """Immutable move, compared and hashed by `key`, the move packed into a single integer"""
+    __slots__ = ('move_type', 'squares', 'key')
+
+    def __init__(self, move_type: MoveType, move_squares: Sequence['Coordinates']):
         self.move_type = move_type
+        self.squares: Tuple['Coordinates', ...] = tuple(move_squares)
+        self.key = pack_squares(move_type == MoveType.CAPTURE,
+                                [COORDINATES_SQUARE[square] for square in move_squares])
+
+    @classmethod
+    def from_squares(cls, move_type: MoveType, squares: Sequence[int]) -> 'Move':
+        """creates the move from square indices, without looking coordinates up"""
+        move = cls.__new__(cls)
+        move.move_type = move_type
+        move.squares = tuple([SQUARE_COORDINATES[square] for square in squares])
+        move.key = pack_squares(move_type == MoveType.CAPTURE, squares)
+        return move
+
+    @property
+    def move_squares(self) -> List['Coordinates']:
+        return list(self.squares)
 
     @staticmethod
     def is_valid_move_string(move_string: str) -> bool:
@@ -43,12 +80,25 @@ class Move:
             moves_list = list(map(square_id_to_coordinates, move_squares))
             return cls(MoveType.CAPTURE, moves_list)
 
+    def to_key(self) -> int:
+        """packed move, 5 header bits and 5 bits for every square, at most `MAX_KEY_BITS` (70) bits for legal
+        moves. Captures of more than 11 pieces do not fit in 64 bits."""
+        assert self.key.bit_length() <= MAX_KEY_BITS, 'move has too many squares'
+        return self.key
+
+    @classmethod
+    def from_key(cls, key: int) -> 'Move':
+        move_type = MoveType.CAPTURE if key & 1 else MoveType.NORMAL
+        length = key >> KEY_LENGTH_SHIFT & KEY_LENGTH_MASK
+        return cls.from_squares(move_type, [key >> KEY_SQUARES_SHIFT + index * KEY_SQUARE_BITS & KEY_SQUARE_MASK
+                                            for index in range(length)])
+
     def __str__(self) -> str:
         # Standard checkers move notation, each reachable square has number from 1-32 assigned to it,
         # starting from top left. Move is written as numbers of squares that moving piece has reached 
         # separated by `-` if move was a normal move and with `x` for captures. Ex. 9-14 or 22x15x24.
         move_str = ''
-        for square in self.move_squares:
+        for square in self.squares:
             square_id = (-square[1] + 7) * 4 + (square[0] // 2) + 1
             move_str += str(square_id)
             move_str += 'x' if self.move_type == MoveType.CAPTURE else '-'
@@ -57,18 +107,42 @@ class Move:
 
     def __add__(self, other: object) -> 'Move':
         if isinstance(other, self.__class__):
-            self.move_squares += other.move_squares
+            return self.__class__(self.move_type, self.squares + other.squares)
         return self
 
     def __hash__(self) -> int:
-        return hash((tuple(self.move_squares), self.move_type))
+        return self.key
 
     def __eq__(self, move: object) -> bool:
+        if move is self:
+            return True
         if not isinstance(move, Move):
             return False
-        return move.move_squares == self.move_squares and move.move_type == self.move_type
+        return move.key == self.key
 
     def __ne__(self, move: object) -> bool:
         if not isinstance(move, Move):
             return True
-        return move.move_squares != self.move_squares or move.move_type != self.move_type
+        return move.key != self.key
+
+
+# Moves are immutable, so every non-capture move is created once and shared by the move generators.
+# SIMPLE_MOVES[square][target square] - move between neighbouring squares, None for other pairs
+SIMPLE_MOVES: List[List[Optional[Move]]] = [[None] * SQUARES_COUNT for _ in range(SQUARES_COUNT)]
+for _square in range(SQUARES_COUNT):
+    for _target in NEIGHBOURS[_square]:
+        if _target is not None:
+            SIMPLE_MOVES[_square][_target] = Move.from_squares(MoveType.NORMAL, (_square, _target))
+
+# STEP_MOVES[color][piece type][coordinates] - (target coordinates, move) pairs in the order of `STEPS`
+STEP_MOVES: Dict['PieceColor', Dict['PieceType', Dict['Coordinates', List[Tuple['Coordinates', Move]]]]] = {
+    color: {
+        piece_type: {
+            coordinates: [(target, SIMPLE_MOVES[COORDINATES_SQUARE[coordinates]][COORDINATES_SQUARE[target]])
+                          for target in targets]  # type: ignore
+            for coordinates, targets in steps.items()
+        }
+        for piece_type, steps in color_steps.items()
+    }
+    for color, color_steps in STEPS.items()
+}
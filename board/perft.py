@@ -0,0 +1,151 @@
+"""Counts the positions reached after every sequence of legal moves of a given length, the baseline for checking
+and timing move generation.
+
+    python -m board.perft --depth 8
+    python -m board.perft --depth 5 --fen W:WK10,K19,23,27:B5,K14,K21,26 --divide
+    python -m board.perft --verify
+
+`--verify` is the regression check of both board implementations, it exits with a non-zero status on any mismatch.
+"""
+import argparse
+import random
+import time
+from typing import Any, Dict, List, Tuple
+from board.bitboard import AnyBoard, create_board
+from board.fen import STARTING_FEN, parse_fen
+from board.move import Move
+
+# leaf counts of positions, checked by `--verify` against both board implementations
+REFERENCE_COUNTS: Dict[str, List[int]] = {
+    STARTING_FEN: [1, 7, 49, 302, 1469, 7482, 37986, 190146, 929902],
+    # kings, compulsory captures
+    'W:WK10,K19,23,27:B5,K14,K21,26': [1, 2, 2, 9, 55, 327, 1857, 10869, 67156],
+    # multi-jump captures and promotion
+    'B:W14,15,18,22,23,26:B6,7,9,10,11,K30': [1, 2, 4, 21, 51, 206, 700, 2681, 9626],
+}
+REPLAY_MAX_PLIES = 150  # random games checked by `check_random_replay` are cut off after this many moves
+
+
+def perft(board: AnyBoard, depth: int) -> int:
+    capture_moves, standard_moves = board.generate_moves()
+    all_moves = capture_moves if len(capture_moves) else standard_moves
+    if depth <= 1:
+        # leaves are counted without making their moves
+        return len(all_moves) if depth == 1 else 1
+    nodes = 0
+    for move in all_moves:
+        undo = board.make_move(move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move(undo)
+    return nodes
+
+
+def divide(board: AnyBoard, depth: int) -> List[Tuple[Move, int]]:
+    """leaf counts below every legal move of the position"""
+    capture_moves, standard_moves = board.generate_moves()
+    results = []
+    for move in sorted(capture_moves if len(capture_moves) else standard_moves, key=lambda m: m.squares):
+        undo = board.make_move(move)
+        results.append((move, perft(board, depth - 1)))
+        board.unmake_move(undo)
+    return results
+
+
+def create_position(fen: str, use_bitboard: bool) -> AnyBoard:
+    board = create_board(use_bitboard)
+    board.set_position(*parse_fen(fen))
+    return board
+
+
+def check_round_trip(board: AnyBoard, depth: int) -> bool:
+    """every move taken back with `unmake_move` restores the position, its hash and evaluation terms"""
+    state = (board.get_masks(), board.moving_side, board.hash, board.material, board.positional, board.ply)
+    if depth == 0:
+        return True
+    capture_moves, standard_moves = board.generate_moves()
+    for move in capture_moves if len(capture_moves) else standard_moves:
+        undo = board.make_move(move)
+        result = check_round_trip(board, depth - 1)
+        board.unmake_move(undo)
+        if not result or state != (board.get_masks(), board.moving_side, board.hash, board.material,
+                                   board.positional, board.ply):
+            return False
+    return True
+
+
+def get_state(board: AnyBoard) -> Tuple[Any, ...]:
+    return board.get_masks(), board.moving_side, board.hash, board.material, board.positional, board.ply
+
+
+def check_random_replay(use_bitboard: bool, games: int, seed: int = 0) -> bool:
+    """plays random games forward and takes every move back, the position, its hash and evaluation terms have to
+    be restored at every ply, and the incrementally updated ones have to equal those computed from scratch"""
+    generator = random.Random(seed)
+    for _ in range(games):
+        board = create_board(use_bitboard)
+        states = []
+        undos = []
+        for _ in range(REPLAY_MAX_PLIES):
+            capture_moves, standard_moves = board.generate_moves()
+            all_moves = capture_moves if len(capture_moves) else standard_moves
+            if len(all_moves) == 0:
+                break
+            states.append(get_state(board))
+            undos.append(board.make_move(generator.choice(all_moves)))
+            recomputed = create_board(use_bitboard)
+            recomputed.set_position(*board.get_masks(), board.moving_side)
+            if (board.hash, board.material, board.positional) != \
+                    (recomputed.hash, recomputed.material, recomputed.positional):
+                return False
+        while len(undos):
+            board.unmake_move(undos.pop())
+            if get_state(board) != states.pop():
+                return False
+    return True
+
+
+def verify(max_depth: int, replay_games: int) -> bool:
+    """regression check of both board implementations: perft counts of the reference positions up to
+    `max_depth`, positions restored by `unmake_move` and `replay_games` random games replayed forward and back"""
+    passed = True
+    for fen, counts in REFERENCE_COUNTS.items():
+        for use_bitboard in (False, True):
+            name = 'BitBoard' if use_bitboard else 'Board'
+            for depth, expected in enumerate(counts[:max_depth + 1]):
+                nodes = perft(create_position(fen, use_bitboard), depth)
+                if nodes != expected:
+                    print(f'{name} {fen} depth {depth}: {nodes} nodes, expected {expected}')
+                    passed = False
+            if not check_round_trip(create_position(fen, use_bitboard), min(max_depth, 4)):
+                print(f'{name} {fen}: position not restored by unmake_move')
+                passed = False
+    for use_bitboard in (False, True):
+        if not check_random_replay(use_bitboard, replay_games):
+            print(f'{"BitBoard" if use_bitboard else "Board"}: random game not replayed back to its start')
+            passed = False
+    print('perft verification ' + ('passed' if passed else 'FAILED'))
+    return passed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Counts leaf nodes of the move tree to a fixed depth.')
+    parser.add_argument('--depth', type=int, default=6)
+    parser.add_argument('--fen', default=STARTING_FEN, help='position to start from, the starting one by default')
+    parser.add_argument('--divide', action='store_true', help='print leaf counts below every move')
+    parser.add_argument('--bitboard', action='store_true', help='use BitBoard instead of Board')
+    parser.add_argument('--verify', action='store_true', help='check reference counts up to --depth')
+    parser.add_argument('--replay-games', type=int, default=50, help='random games replayed back by --verify')
+    arguments = parser.parse_args()
+    if arguments.verify:
+        exit(0 if verify(arguments.depth, arguments.replay_games) else 1)
+    position = create_position(arguments.fen, arguments.bitboard)
+    start = time.perf_counter()
+    if arguments.divide:
+        move_counts = divide(position, arguments.depth)
+        for divided_move, count in move_counts:
+            print(f'{divided_move}: {count}')
+        total = sum(count for _, count in move_counts)
+    else:
+        total = perft(position, arguments.depth)
+    elapsed = time.perf_counter() - start
+    print(f'depth {arguments.depth}: {total} nodes in {elapsed:.3f}s, {total / max(elapsed, 1e-9):.0f} nodes/s')
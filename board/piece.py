@@ -20,6 +20,15 @@ MOVE_DIRECTIONS: Dict[PieceType, 'MoveDirections'] = {
     PieceType.KING: [(1, 1), (-1, 1), (-1, -1), (1, -1)],
 }
 
+PIECE_MOVE_DIRECTIONS: Dict[PieceColor, Dict[PieceType, 'MoveDirections']] = {
+    PieceColor.WHITE: MOVE_DIRECTIONS,
+    PieceColor.BLACK: {
+        # black pawns move towards row 0
+        PieceType.PAWN: [(direction[0], -direction[1]) for direction in MOVE_DIRECTIONS[PieceType.PAWN]],
+        PieceType.KING: MOVE_DIRECTIONS[PieceType.KING],
+    },
+}
+
 PIECE_TO_CHAR = {
     PieceColor.WHITE: {
         PieceType.PAWN: '⛂',
@@ -39,10 +48,7 @@ class Piece:
         self.position: 'Coordinates' = position
 
     def get_move_directions(self) -> 'MoveDirections':
-        if self.type == PieceType.PAWN and self.color == PieceColor.BLACK:
-            # revert direction of move for black pawns
-            return list(map(lambda direction: (direction[0], -direction[1]), MOVE_DIRECTIONS[self.type]))
-        return MOVE_DIRECTIONS[self.type]
+        return PIECE_MOVE_DIRECTIONS[self.color][self.type]
 
     def __str__(self):
         return PIECE_TO_CHAR[self.color][self.type]
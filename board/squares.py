@@ -0,0 +1,129 @@
+from typing import Dict, List, Tuple, Optional, TYPE_CHECKING
+from board.piece import MOVE_DIRECTIONS, PIECE_MOVE_DIRECTIONS, PieceType, PieceColor
+
+if TYPE_CHECKING:
+    from board.board import Coordinates
+
+# Playable squares are numbered 0-31, which is the standard 1-32 checkers notation minus one
+# (see `Move.__str__`). Square `n` is represented by bit `1 << n` in bitboard masks.
+SQUARES_COUNT = 32
+FULL_MASK = (1 << SQUARES_COUNT) - 1
+
+# directions in the same order as `MOVE_DIRECTIONS[PieceType.KING]`
+DIRECTIONS: List['Coordinates'] = MOVE_DIRECTIONS[PieceType.KING]
+WHITE_PAWN_DIRECTIONS = (0, 1)  # towards row 7
+BLACK_PAWN_DIRECTIONS = (2, 3)  # towards row 0
+
+# squares on which pawns are promoted
+WHITE_PROMOTION_MASK = 0x0000000F
+BLACK_PROMOTION_MASK = 0xF0000000
+
+
+def square_to_coordinates(square: int) -> 'Coordinates':
+    y = 7 - square // 4
+    x = square % 4 * 2 + (y % 2)
+    return x, y
+
+
+def coordinates_to_square(coordinates: 'Coordinates') -> int:
+    return (7 - coordinates[1]) * 4 + coordinates[0] // 2
+
+
+def _shifted_square(square: int, direction: 'Coordinates', length: int) -> Optional[int]:
+    x, y = square_to_coordinates(square)
+    x, y = x + direction[0] * length, y + direction[1] * length
+    if not (0 <= x < 8 and 0 <= y < 8):
+        return None
+    return coordinates_to_square((x, y))
+
+
+def _build_direction_shifts(delta_of: List[Optional[int]]) -> List[Tuple[int, int]]:
+    """groups squares by the index difference of a one-directional step, so a whole mask can be moved with shifts"""
+    groups: Dict[int, int] = {}
+    for square, delta in enumerate(delta_of):
+        if delta is not None:
+            groups[delta] = groups.get(delta, 0) | (1 << square)
+    return sorted((mask, delta) for delta, mask in groups.items())
+
+
+SQUARE_COORDINATES: List['Coordinates'] = [square_to_coordinates(square) for square in range(SQUARES_COUNT)]
+COORDINATES_SQUARE: Dict['Coordinates', int] = {
+    coordinates: square for square, coordinates in enumerate(SQUARE_COORDINATES)
+}
+
+# NEIGHBOURS[square][direction] - square reached after one step, or None outside of the board
+NEIGHBOURS: List[List[Optional[int]]] = [
+    [_shifted_square(square, direction, 1) for direction in DIRECTIONS] for square in range(SQUARES_COUNT)
+]
+# JUMPS[square] - (jumped square, landing square) pairs of every capture that fits on the board
+JUMPS: List[List[Tuple[int, int]]] = [
+    [(NEIGHBOURS[square][index], _shifted_square(square, direction, 2))  # type: ignore
+     for index, direction in enumerate(DIRECTIONS) if _shifted_square(square, direction, 2) is not None]
+    for square in range(SQUARES_COUNT)
+]
+# DIRECTION_SHIFTS[direction] - (source mask, shift) pairs, `step(bb) = shift(bb & mask, delta)` for each pair
+DIRECTION_SHIFTS: List[List[Tuple[int, int]]] = [
+    _build_direction_shifts([
+        None if NEIGHBOURS[square][direction] is None else NEIGHBOURS[square][direction] - square  # type: ignore
+        for square in range(SQUARES_COUNT)
+    ])
+    for direction in range(len(DIRECTIONS))
+]
+
+
+def _build_jump_shifts() -> List[Tuple[int, int, int]]:
+    groups: Dict[Tuple[int, int], int] = {}
+    for square in range(SQUARES_COUNT):
+        for jumped_square, landing_square in JUMPS[square]:
+            deltas = (jumped_square - square, landing_square - square)
+            groups[deltas] = groups.get(deltas, 0) | (1 << square)
+    return sorted((mask, jumped_delta, landing_delta) for (jumped_delta, landing_delta), mask in groups.items())
+
+
+# (source mask, jumped square shift, landing square shift) triples covering every capture in every direction
+JUMP_SHIFTS: List[Tuple[int, int, int]] = _build_jump_shifts()
+
+
+# tables keyed by coordinates, used by `Board`
+
+# indices into `DIRECTIONS` of non-capture moves, in the order of `Piece.get_move_directions`
+PIECE_STEP_DIRECTIONS: Dict[PieceColor, Dict[PieceType, List[int]]] = {
+    color: {piece_type: [DIRECTIONS.index(direction) for direction in directions]
+            for piece_type, directions in piece_directions.items()}
+    for color, piece_directions in PIECE_MOVE_DIRECTIONS.items()
+}
+# STEPS[color][piece type][coordinates] - squares reached with a non-capture move
+STEPS: Dict[PieceColor, Dict[PieceType, Dict['Coordinates', List['Coordinates']]]] = {
+    color: {
+        piece_type: {
+            SQUARE_COORDINATES[square]: [SQUARE_COORDINATES[NEIGHBOURS[square][direction]]  # type: ignore
+                                         for direction in directions if NEIGHBOURS[square][direction] is not None]
+            for square in range(SQUARES_COUNT)
+        }
+        for piece_type, directions in piece_directions.items()
+    }
+    for color, piece_directions in PIECE_STEP_DIRECTIONS.items()
+}
+# CAPTURE_JUMPS[coordinates] - (jumped square, landing square) pairs, every piece captures in all directions,
+# so the table is the same for every piece type and color
+CAPTURE_JUMPS: Dict['Coordinates', List[Tuple['Coordinates', 'Coordinates']]] = {
+    SQUARE_COORDINATES[square]: [(SQUARE_COORDINATES[jumped_square], SQUARE_COORDINATES[landing_square])
+                                 for jumped_square, landing_square in JUMPS[square]]
+    for square in range(SQUARES_COUNT)
+}
+
+
+def shift(mask: int, delta: int) -> int:
+    return (mask << delta) & FULL_MASK if delta > 0 else mask >> -delta
+
+
+def pop_count(mask: int) -> int:
+    return bin(mask).count('1')
+
+
+def iterate_squares(mask: int):
+    """yields indices of set bits, lowest first"""
+    while mask:
+        lowest_bit = mask & -mask
+        yield lowest_bit.bit_length() - 1
+        mask ^= lowest_bit
@@ -0,0 +1,49 @@
+import random
+from typing import Dict, List, Iterable
+from board.piece import Piece, PieceColor, PieceType
+from board.squares import SQUARES_COUNT, COORDINATES_SQUARE, iterate_squares
+
+# fixed seed, so hashes are the same in every process and can be stored in files
+_random = random.Random(0x636865636B657273)
+
+
+def _generate_keys() -> List[int]:
+    return [_random.getrandbits(64) for _ in range(SQUARES_COUNT)]
+
+
+WHITE_PAWN_KEYS = _generate_keys()
+WHITE_KING_KEYS = _generate_keys()
+BLACK_PAWN_KEYS = _generate_keys()
+BLACK_KING_KEYS = _generate_keys()
+BLACK_TO_MOVE_KEY = _random.getrandbits(64)
+
+PIECE_KEYS: Dict[PieceColor, Dict[PieceType, List[int]]] = {
+    PieceColor.WHITE: {
+        PieceType.PAWN: WHITE_PAWN_KEYS,
+        PieceType.KING: WHITE_KING_KEYS,
+    },
+    PieceColor.BLACK: {
+        PieceType.PAWN: BLACK_PAWN_KEYS,
+        PieceType.KING: BLACK_KING_KEYS,
+    },
+}
+
+
+def get_piece_key(piece: Piece) -> int:
+    return PIECE_KEYS[piece.color][piece.type][COORDINATES_SQUARE[piece.position]]
+
+
+def hash_pieces(pieces: Iterable[Piece], moving_side: PieceColor) -> int:
+    result = BLACK_TO_MOVE_KEY if moving_side == PieceColor.BLACK else 0
+    for piece in pieces:
+        result ^= get_piece_key(piece)
+    return result
+
+
+def hash_masks(white: int, black: int, kings: int, moving_side: PieceColor) -> int:
+    result = BLACK_TO_MOVE_KEY if moving_side == PieceColor.BLACK else 0
+    for square in iterate_squares(white):
+        result ^= WHITE_KING_KEYS[square] if kings >> square & 1 else WHITE_PAWN_KEYS[square]
+    for square in iterate_squares(black):
+        result ^= BLACK_KING_KEYS[square] if kings >> square & 1 else BLACK_PAWN_KEYS[square]
+    return result
@@ -1,9 +1,15 @@
+import os
 import pygame
-from typing import Tuple, Callable, Any, Optional, List
+from typing import Tuple, Callable, Any, Optional, List, Dict
 from ai.ai import AI
-from board.board import Board, Coordinates, Move
+from ai.opening_book import OpeningBook
+from ai.ponder import Ponderer
+from board.board import Coordinates, Move
+from board.bitboard import create_board
 from board.piece import PieceColor, PieceType
+from gui.move_cache import LegalMoveCache
 from gui.networking import NetworkThread
+from gui.search_thread import SearchThread, AI_MOVE_EVENT
 
 Color = Tuple[int, int, int]
 
@@ -17,17 +23,33 @@ timer_height = 25
 width = 550
 height = 550 + 2 * timer_height
 square_size = int(width / 8) + 1
+frames_per_second = 30
 font = 'freesansbold.ttf'
+ai_time_limit_ms = 2000  # per move, the whole game clock is 5 minutes
+opening_book_path = 'opening_book.bin'  # built with `python -m ai.opening_book`, used when present
+ai_pondering = True  # the AI searches the player's possible moves during the player's turn
 clock = pygame.time.Clock()
 
+# what is drawn on a square: piece color, piece type, selected, highlighted as a destination
+SquareContents = Tuple[Optional[PieceColor], Optional[PieceType], bool, bool]
+EMPTY_SQUARE: SquareContents = (None, None, False, False)
+
 
 class App:
-    def __init__(self, width: int, height: int):
-        self.board: Board = Board()
+    def __init__(self, width: int, height: int, use_bitboard: bool = False):
+        self.use_bitboard = use_bitboard
+        self.board = create_board(use_bitboard)
         self.player_side = PieceColor.WHITE
         self.piece = None
         self.moves = []
+        self.legal_moves = LegalMoveCache()
         self.ai = AI(PieceColor.BLACK, 1)
+        self.ai.set_search_limits(ai_time_limit_ms)
+        if os.path.exists(opening_book_path):
+            self.ai.set_opening_book(OpeningBook(opening_book_path))
+        self.ai_session = self.ai.create_session()
+        self.ponderer = Ponderer(self.ai, self.ai_session)
+        self.search_thread = SearchThread()
         self.window: Any = pygame.display.set_mode((width, height))
         self.set_window()
         self.draw_current_screen: Callable[[], None] = self.main_menu
@@ -43,11 +65,22 @@ class App:
         self.lobby_index = 0
         self.lobbies: List[str] = []
         self.has_created_game: bool = False
+        self.fonts: Dict[Tuple[str, int], Any] = {}
+        self.board_surface: Optional[Any] = None
+        # game screens are drawn incrementally, only the changed parts of the window are updated
+        self.dirty_rects: Optional[List[Any]] = None
+        self.drawn_squares: Dict[Coordinates, SquareContents] = {}
+        self.drawn_bars: Dict[int, Tuple[str, str]] = {}
 
     def restart(self):
         self.has_created_game = False
-        self.board = Board()
+        self.search_thread.cancel()
+        self.ponderer.stop()
+        self.board = create_board(self.use_bitboard)
+        self.legal_moves.invalidate()
+        self.ai_session.reset()
         self.piece = None
+        self.moves = []
         self.black_time_spent = 0
         self.white_time_spent = 0
         self.user_input = ''
@@ -59,7 +92,7 @@ class App:
         self.network_thread.disconnect()
 
     def update_time(self):
-        time = clock.tick(15)
+        time = clock.tick(frames_per_second)
         if self.draw_current_screen != self.singleplayer_game and self.draw_current_screen != self.multiplayer_game:  # type: ignore
             return
         if self.board.moving_side == PieceColor.WHITE:
@@ -90,7 +123,10 @@ class App:
         return [int(x * square_size + square_size / 2), int(y * square_size + square_size / 2) + timer_height]
 
     def format_text(self, message: str, text_font: str, text_size: int, text_color: Color):
-        new_font: Any = pygame.font.Font(text_font, text_size)
+        new_font = self.fonts.get((text_font, text_size))
+        if new_font is None:
+            new_font = pygame.font.Font(text_font, text_size)
+            self.fonts[(text_font, text_size)] = new_font
         new_text = new_font.render(message, False, text_color)
         return new_text
 
@@ -109,52 +145,100 @@ class App:
         text_rect.center = (int(x + (width / 2)), int(y + (height / 2)))
         self.window.blit(button_text, text_rect)
 
-    def draw_pieces(self):
+    def get_square_rect(self, position: Coordinates):
+        rect = pygame.Rect(0, 0, square_size, square_size)
+        rect.center = self.get_piece_position(position)
+        return rect
+
+    def get_board_surface(self):
+        """the board without pieces, drawn once"""
+        if self.board_surface is None:
+            self.board_surface = pygame.Surface((width, height))
+            self.board_surface.fill(DARK_BROWN)
+            for row in range(8):
+                for col in range(row % 2, 8, 2):
+                    pygame.draw.rect(self.board_surface, LIGHT_BROWN,
+                                     (row * square_size, col * square_size + timer_height, square_size, square_size))
+        return self.board_surface
+
+    def get_square_contents(self) -> Dict[Coordinates, SquareContents]:
+        contents = {}
+        selected_position = None
         if self.piece is not None and self.piece.position in self.board.board:
+            selected_position = self.piece.position
             piece_position = self.moves[-1] if len(self.moves) else self.piece.position
-            pygame.draw.circle(self.window, RED, self.get_piece_position(piece_position), int(square_size / 2))
+            contents[piece_position] = (None, None, True, False)
             if self.player_side == self.board.moving_side:
-                captures, standard = self.board.get_piece_moves(self.piece)
-                all_moves = captures if len(captures) else standard
-                # if there is a possible capture it has to be played
-                if len(self.board.generate_moves()[0]):
-                    all_moves = captures
-                all_moves = filter(lambda m: m.move_squares[:len(self.moves)] == self.moves, all_moves)
-                for move in all_moves:
-                    pygame.draw.circle(self.window, RED, self.get_piece_position(move.move_squares[len(self.moves)]),
-                                       square_size // 20)
-
-        for piece in self.board.white_pieces:
-            piece_position = self.moves[-1] if piece is self.piece and len(self.moves) else piece.position
-            x, y = self.get_piece_position(piece_position)
-            if piece.type == PieceType.KING:
-                pygame.draw.circle(self.window, WHITE, (x, y), int(square_size / 2) - 2)
-                pygame.draw.circle(self.window, RED, (x, y), int(square_size / 3) - 2)
-            else:
-                pygame.draw.circle(self.window, WHITE, (x, y), int(square_size / 2) - 2)
-        for piece in self.board.black_pieces:
-            piece_position = self.moves[-1] if piece is self.piece and len(self.moves) else piece.position
-            x, y = self.get_piece_position(piece_position)
-            if piece.type == PieceType.KING:
-                pygame.draw.circle(self.window, BLACK, (x, y), int(square_size / 2) - 2)
-                pygame.draw.circle(self.window, RED, (x, y), int(square_size / 3) - 2)
-            else:
-                pygame.draw.circle(self.window, BLACK, (x, y), int(square_size / 2) - 2)
+                self.legal_moves.update(self.board)
+                for square in self.legal_moves.get_next_squares(self.moves):
+                    contents[square] = (None, None, False, True)
+        for position, piece in self.board.board.items():
+            if position == selected_position and len(self.moves):
+                position = self.moves[-1]
+            _, _, is_selected, is_highlighted = contents.get(position, EMPTY_SQUARE)
+            contents[position] = (piece.color, piece.type, is_selected, is_highlighted)
+        return contents
+
+    def draw_square(self, position: Coordinates, contents: SquareContents):
+        rect = self.get_square_rect(position)
+        self.window.blit(self.get_board_surface(), rect, rect)
+        color, piece_type, is_selected, is_highlighted = contents
+        if is_selected:
+            pygame.draw.circle(self.window, RED, rect.center, int(square_size / 2))
+        if is_highlighted:
+            pygame.draw.circle(self.window, RED, rect.center, square_size // 20)
+        if color is not None:
+            pygame.draw.circle(self.window, WHITE if color == PieceColor.WHITE else BLACK, rect.center,
+                               int(square_size / 2) - 2)
+            if piece_type == PieceType.KING:
+                pygame.draw.circle(self.window, RED, rect.center, int(square_size / 3) - 2)
+        self.dirty_rects.append(rect)
 
     def draw_board(self):
-        self.window.fill(DARK_BROWN)
-        for row in range(8):
-            for col in range(row % 2, 8, 2):
-                pygame.draw.rect(self.window, LIGHT_BROWN,
-                                 (row * square_size, col * square_size + timer_height, square_size, square_size))
-        self.draw_pieces()
-        pygame.draw.rect(self.window, GREY, (0, 0, width, timer_height))
-        pygame.draw.rect(self.window, GREY, (0, height - timer_height, width, timer_height))
+        """redraws the squares whose contents changed since the last frame"""
+        self.dirty_rects = []
+        if len(self.drawn_squares) == 0:
+            self.window.blit(self.get_board_surface(), (0, 0))
+            self.dirty_rects.append(self.window.get_rect())
+        contents = self.get_square_contents()
+        self.window.set_clip((0, timer_height, width, height - 2 * timer_height))
+        for position in self.drawn_squares.keys() - contents.keys():
+            self.draw_square(position, EMPTY_SQUARE)
+        for position, square_contents in contents.items():
+            if self.drawn_squares.get(position) != square_contents:
+                self.draw_square(position, square_contents)
+        self.window.set_clip(None)
+        self.drawn_squares = contents
+
+    def draw_bar(self, y: int, center_text: str, left_text: str = ''):
+        """draws a timer bar if its texts changed since the last frame"""
+        if self.drawn_bars.get(y) == (center_text, left_text):
+            return
+        self.drawn_bars[y] = (center_text, left_text)
+        bar_rect = pygame.Rect(0, y, width, timer_height)
+        pygame.draw.rect(self.window, GREY, bar_rect)
+        center_surface = self.format_text(center_text, font, 20, WHITE)
+        text_rect = center_surface.get_rect()
+        text_rect.center = bar_rect.center
+        self.window.blit(center_surface, text_rect)
+        if len(left_text):
+            left_surface = self.format_text(left_text, font, 14, WHITE)
+            text_rect = left_surface.get_rect()
+            text_rect.midleft = (5, bar_rect.centery)
+            self.window.blit(left_surface, text_rect)
+        self.dirty_rects.append(bar_rect)
 
     def start(self):
         while not self.should_stop:
             self.draw_current_screen()
-            pygame.display.update()
+            if self.dirty_rects is None:
+                pygame.display.update()
+                # the next game screen frame is drawn from scratch
+                self.drawn_squares = {}
+                self.drawn_bars = {}
+            else:
+                pygame.display.update(self.dirty_rects)
+                self.dirty_rects = None
             self.update_time()
 
     def main_menu(self):
@@ -358,23 +442,18 @@ class App:
                 self.piece = self.board.board[(x, y)]
                 self.moves = [(x, y)]
         elif self.piece is not None:
-            captures, standard = self.board.get_piece_moves(self.piece)
-            all_moves = captures if len(captures) else standard
-            if len(self.board.generate_moves()[0]):
-                all_moves = captures
-            if (x, y) in map(lambda m: m.move_squares[len(self.moves)],
-                             filter(lambda m: len(m.move_squares) > len(self.moves), all_moves)):
+            self.legal_moves.update(self.board)
+            if (x, y) in self.legal_moves.get_next_squares(self.moves):
                 self.moves.append((x, y))
-                for i in range(len(all_moves)):
-                    if all_moves[i].move_squares == self.moves:
-                        if is_multiplayer:
-                            self.network_thread.send_request('move', [str(all_moves[i])])
-                            self.network_thread.wait_for_response('other_player_move')
-                        self.update_time()
-                        self.board.make_move(all_moves[i])
-                        self.piece = None
-                        self.moves = []
-                        break
+                move = self.legal_moves.get_move(self.moves)
+                if move is not None:
+                    if is_multiplayer:
+                        self.network_thread.send_request('move', [str(move)])
+                        self.network_thread.wait_for_response('other_player_move')
+                    self.update_time()
+                    self.board.make_move(move)
+                    self.piece = None
+                    self.moves = []
 
     def get_time(self, is_player: bool):
         time_spent = 0
@@ -397,35 +476,55 @@ class App:
             time_spent = self.black_time_spent if self.player_side == PieceColor.WHITE else self.white_time_spent
         return 5 * 60 * 1000 - time_spent <= 0
 
+    def make_ai_move(self, ai_move: Move):
+        self.update_time()
+        self.board.make_move(ai_move)
+        if ai_pondering:
+            self.ponderer.start(self.board)
+
     def singleplayer_game(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                self.search_thread.cancel()
+                self.ponderer.stop()
                 pygame.quit()
                 quit()
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     self.restart()
-        captures, standard = self.board.generate_moves()
-        if (len(captures) == 0 and len(standard) == 0) or self.is_out_of_time():
+                    return
+            if event.type == pygame.USEREVENT and event.name == AI_MOVE_EVENT:
+                ai_move = self.search_thread.get_move(event)
+                if ai_move is not None:
+                    self.make_ai_move(ai_move)
+        self.legal_moves.update(self.board)
+        if not self.legal_moves.has_moves() or self.is_out_of_time():
+            self.search_thread.cancel()
+            self.ponderer.stop()
             self.draw_current_screen = self.ending_screen
             return
         mouse = pygame.mouse.get_pos()
         click = pygame.mouse.get_pressed(5)
         if click[0] == 1 and self.board.moving_side == self.player_side:
             self.perform_player_action(mouse)
-        elif self.board.moving_side == self.ai.color:
-            ai_move = self.ai.get_best_move(self.board)
-            self.update_time()
-            self.board.make_move(ai_move)
+        elif self.board.moving_side == self.ai.color and not self.search_thread.is_pending():
+            ai_move = self.ponderer.get_move(self.board) if ai_pondering else None
+            if ai_move is not None:
+                self.make_ai_move(ai_move)
+            else:
+                self.search_thread.start(self.ai, self.board, self.ai_session)
         self.draw_board()
-        bot_timer = self.format_text(str(self.get_time(False)), font, 20, WHITE)
-        text_rect = bot_timer.get_rect()
-        text_rect.center = (width // 2, timer_height // 2)
-        self.window.blit(bot_timer, text_rect)
-        player_timer = self.format_text(str(self.get_time(True)), font, 20, WHITE)
-        text_rect = player_timer.get_rect()
-        text_rect.center = (width // 2, height - timer_height // 2)
-        self.window.blit(player_timer, text_rect)
+        self.draw_bar(0, self.get_time(False), self.get_thinking_message())
+        self.draw_bar(height - timer_height, self.get_time(True))
+
+    def get_thinking_message(self) -> str:
+        if not self.search_thread.is_pending():
+            return ''
+        depth, best_move = self.search_thread.get_progress()
+        message = 'thinking...'
+        if depth >= 0 and best_move is not None:
+            message += f' depth {depth} {best_move}'
+        return message
 
     def multiplayer_game(self):
         for event in pygame.event.get():
@@ -437,8 +536,8 @@ class App:
                     move = Move.from_string(event.data)
                     self.update_time()
                     self.board.make_move(move)
-        captures, standard = self.board.generate_moves()
-        if (len(captures) == 0 and len(standard) == 0) or self.is_out_of_time():
+        self.legal_moves.update(self.board)
+        if not self.legal_moves.has_moves() or self.is_out_of_time():
             self.draw_current_screen = self.ending_screen
             return
         mouse = pygame.mouse.get_pos()
@@ -446,14 +545,8 @@ class App:
         if click[0] == 1 and self.board.moving_side == self.player_side:
             self.perform_player_action(mouse, True)
         self.draw_board()
-        opponent_timer = self.format_text(str(self.get_time(False)), font, 20, WHITE)
-        text_rect = opponent_timer.get_rect()
-        text_rect.center = (width // 2, timer_height // 2)
-        self.window.blit(opponent_timer, text_rect)
-        player_timer = self.format_text(str(self.get_time(True)), font, 20, WHITE)
-        text_rect = player_timer.get_rect()
-        text_rect.center = (width // 2, height - timer_height // 2)
-        self.window.blit(player_timer, text_rect)
+        self.draw_bar(0, self.get_time(False))
+        self.draw_bar(height - timer_height, self.get_time(True))
 
     def ending_screen(self):
         for event in pygame.event.get():
@@ -0,0 +1,48 @@
+from typing import Dict, List, Optional, Set, Tuple
+from board.board import Coordinates
+from board.move import Move
+
+MovePath = Tuple[Coordinates, ...]
+
+
+class LegalMoveCache:
+    """Legal moves of the displayed position, generated once per position instead of every frame. The position is
+    identified by its hash and move counter, so any `make_move` on the board invalidates the cache."""
+
+    def __init__(self):
+        self._key: Optional[Tuple[int, int]] = None
+        self.moves: List[Move] = []
+        self.piece_moves: Dict[Coordinates, List[Move]] = {}  # start square -> legal moves of the piece on it
+        # squares the selected piece can go to next, for every path of squares it has been moved along
+        self.next_squares: Dict[MovePath, Set[Coordinates]] = {}
+        self._moves_by_path: Dict[MovePath, Move] = {}
+
+    def update(self, board) -> None:
+        key = (board.hash, board.ply)
+        if key == self._key:
+            return
+        self._key = key
+        capture_moves, standard_moves = board.generate_moves()
+        self.moves = capture_moves if len(capture_moves) else standard_moves
+        self.piece_moves = {}
+        self.next_squares = {}
+        self._moves_by_path = {}
+        for move in self.moves:
+            squares = move.squares
+            self.piece_moves.setdefault(squares[0], []).append(move)
+            for length in range(1, len(squares)):
+                self.next_squares.setdefault(squares[:length], set()).add(squares[length])
+            self._moves_by_path[squares] = move
+
+    def invalidate(self) -> None:
+        self._key = None
+
+    def has_moves(self) -> bool:
+        return len(self.moves) > 0
+
+    def get_next_squares(self, path: List[Coordinates]) -> Set[Coordinates]:
+        return self.next_squares.get(tuple(path), set())
+
+    def get_move(self, path: List[Coordinates]) -> Optional[Move]:
+        """legal move going along exactly `path`"""
+        return self._moves_by_path.get(tuple(path))
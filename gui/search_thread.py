@@ -0,0 +1,66 @@
+import threading
+from typing import Any, Optional, Tuple
+from pygame.constants import USEREVENT
+import pygame.event
+from ai.ai import AI
+from ai.session import EngineSession
+from board.move import Move
+
+AI_MOVE_EVENT = 'ai_move'
+
+
+class SearchThread:
+    """Runs AI searches in a background thread, so the window keeps handling events while the AI thinks. The chosen
+    move is posted as a USEREVENT named `AI_MOVE_EVENT`, events of cancelled searches are ignored by `get_move`."""
+
+    def __init__(self):
+        self.search_id = 0
+        self._thread: Optional[threading.Thread] = None
+        self._search_ai: Optional[AI] = None
+        self._pending = False
+
+    def start(self, ai: AI, board, session: Optional[EngineSession] = None):
+        """searches a copy of `board` with the settings of `ai`"""
+        self.cancel()
+        self._search_ai = ai.clone()
+        self._search_ai.set_always_deepen(True)
+        self._pending = True
+        self._thread = threading.Thread(target=self.thread_routine,
+                                        args=(self.search_id, self._search_ai, board.copy(), session), daemon=True)
+        self._thread.start()
+
+    def thread_routine(self, search_id: int, search_ai: AI, board, session: Optional[EngineSession]):
+        move = search_ai.get_best_move(board, session)
+        if search_id == self.search_id:
+            pygame.event.post(pygame.event.Event(USEREVENT, name=AI_MOVE_EVENT, data=move, search_id=search_id))
+
+    def cancel(self):
+        """stops the running search, its move is never delivered"""
+        self.search_id += 1
+        self._pending = False
+        if self._search_ai is not None:
+            self._search_ai.stop()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+        self._search_ai = None
+
+    def is_pending(self) -> bool:
+        """whether a search was started and its move was not taken with `get_move` yet"""
+        return self._pending
+
+    def get_move(self, event: Any) -> Optional[Move]:
+        """move of an `AI_MOVE_EVENT` event, None for events of cancelled searches"""
+        if event.search_id != self.search_id or not self._pending:
+            return None
+        self._pending = False
+        self._thread = None
+        self._search_ai = None
+        return event.data
+
+    def get_progress(self) -> Tuple[int, Optional[Move]]:
+        """(deepest completed iteration, its best move) of the running search"""
+        search_ai = self._search_ai
+        if search_ai is None:
+            return -1, None
+        return search_ai.get_search_progress()
@@ -5,6 +5,7 @@ if __name__ == '__main__':
     timer_height = 25
     width = 550
     height = 550 + 2 * timer_height
+    use_bitboard = False
 
-    app = App(width, height)
+    app = App(width, height, use_bitboard)
     app.start()
@@ -1,21 +1,45 @@
-from typing import List, Dict
-from board.board import Board, Move, PieceColor
-from server_core.server_core import Server
+import argparse
+import functools
+import os
+from typing import Any, List, Dict, Optional, Tuple
+from ai.bot_pool import MAX_BOT_DIFFICULTY, MIN_BOT_DIFFICULTY, BotPool
+from board.board import Move, PieceColor
+from board.bitboard import AnyBoard, create_board
+from board.fen import get_fen
 
-lobby: Dict[str, str] = {}
+from server_core.async_server import Server  # handlers are typed with it, the epoll server has the same API
+from server_core.server_core import Server as EpollServer
+from server_core.worker_pool import SharedLobby, WorkerServer, run_worker_pool
+
+USE_BITBOARD = False
+SERVER_CORES = {'asyncio': Server, 'epoll': EpollServer}  # names accepted by --server
+
+lobby: Dict[str, str] = {}  # games hosted by connections of this process: host file descriptor -> game name
 games: Dict[int, 'Game'] = {}
+games_by_id: Dict[str, 'Game'] = {}  # game id is the host id of its white player
+shared_lobby: Optional[SharedLobby] = None  # lobby of all workers, in worker pool mode
+game_server: Optional[Server] = None  # publishes the moves of each game to its spectators
+bot_pool: Optional[BotPool] = None  # searches the moves of bots, off the event loop
+BOT_FILE_DESCRIPTOR = -1  # player file descriptor of the bot in games against it
 
 
 class Game:
-    def __init__(self, white_file_descriptor: int, black_file_descriptor: int):
+    def __init__(self, game_id: str, white_file_descriptor: int, black_file_descriptor: int,
+                 bot_difficulty: Optional[int] = None):
+        self.game_id = game_id
         self.white_player_fd = white_file_descriptor
         self.black_player_fd = black_file_descriptor
-        self._board = Board()
+        self.bot_difficulty = bot_difficulty  # set in games against the bot, which plays black
+        self._board = create_board(USE_BITBOARD)
 
-    def make_move(self, move: Move) -> None:
-        self._board.make_move(move)
+    def make_move(self, move: Move) -> Any:
+        """returns the undo record of the move, for `unmake_move`"""
+        return self._board.make_move(move)
 
-    def get_board(self) -> Board:
+    def unmake_move(self, undo: Any) -> None:
+        self._board.unmake_move(undo)
+
+    def get_board(self) -> AnyBoard:
         return self._board
 
     def get_moving_player_fd(self) -> int:
@@ -27,6 +51,14 @@ class Game:
         captures, normal_moves = self._board.generate_moves()
         return move in captures or (len(captures) == 0 and move in normal_moves)
 
+    def has_legal_moves(self) -> bool:
+        """whether the moving side can move, otherwise it lost"""
+        captures, normal_moves = self._board.generate_moves()
+        return len(captures) > 0 or len(normal_moves) > 0
+
+    def get_topic(self) -> str:
+        return f'game:{self.game_id}'
+
 
 def handle_ping_request(args: List[str], res: Server.Response) -> None:
     res.send('pong')
@@ -37,27 +69,166 @@ def handle_host_game_request(args: List[str], res: Server.Response) -> None:
         res.reject_request()
         return
     lobby[str(res.get_file_descriptor())] = args[0]
+    if shared_lobby is not None:
+        shared_lobby.add(res.get_file_descriptor(), args[0])
     res.send('ok. Waiting in the lobby.')
 
 
+def get_host_id(file_descriptor: int) -> str:
+    return str(file_descriptor) if shared_lobby is None else shared_lobby.get_host_id(file_descriptor)
+
+
 def handle_join_game_request(args: List[str], res: Server.Response) -> None:
     if not len(args):
         res.reject_request()
         return
-    game_host_file_descriptor = args[0]
+    host_id = args[0]
+    if shared_lobby is None:
+        start_game(host_id, host_id, res)
+        return
+    current_lobby = shared_lobby
+    parsed_host_id = SharedLobby.parse_host_id(host_id)
+    if parsed_host_id is None:
+        res.send(f'Host with {host_id} id not found')
+        return
+
+    def on_claimed(entry: Optional[Tuple[int, str]]) -> None:
+        if entry is None:
+            res.send(f'Host with {host_id} id not found')
+            return
+        worker, game_name = entry
+        if worker == current_lobby.worker:
+            start_game(host_id, str(parsed_host_id[1]), res)
+        elif not current_lobby.hand_over(res, worker, ['join', host_id]):
+            # the host still waits, so others can join it
+            current_lobby.restore(host_id, game_name, worker)
+            res.send('Cannot join while other requests are pending')
+
+    current_lobby.claim(host_id, on_claimed)
+
+
+def handle_handed_over_request(args: List[str], res: Server.Response) -> None:
+    """join or spectate request for a game on this worker, by a client connected to another one"""
+    request_name, game_id = args
+    if request_name == 'spectate':
+        spectate_game(game_id, res)
+        return
+    parsed_host_id = SharedLobby.parse_host_id(game_id)
+    assert parsed_host_id is not None
+    start_game(game_id, str(parsed_host_id[1]), res)
+
+
+def start_game(host_id: str, game_host_file_descriptor: str, res: Server.Response) -> None:
     if game_host_file_descriptor not in lobby:
-        res.send(f'Host with {game_host_file_descriptor} id not found')
+        res.send(f'Host with {host_id} id not found')
         return
     lobby.pop(game_host_file_descriptor)
-    game = Game(int(game_host_file_descriptor), res.get_file_descriptor())
+    game = Game(host_id, int(game_host_file_descriptor), res.get_file_descriptor())
     games[res.get_file_descriptor()] = game
     games[int(game_host_file_descriptor)] = game
+    games_by_id[host_id] = game
     host_response = res.pair_with(int(game_host_file_descriptor))
-    res.send(f'starting game with {game_host_file_descriptor} \n {str(game.get_board())}')
-    host_response.send(f'starting game with {res.get_file_descriptor()} \n {str(game.get_board())}')
+    res.send(f'starting game with {host_id} \n {str(game.get_board())}')
+    host_response.send(f'starting game with {get_host_id(res.get_file_descriptor())} \n {str(game.get_board())}')
+
+
+def handle_spectate_request(args: List[str], res: Server.Response) -> None:
+    if not len(args):
+        res.reject_request()
+        return
+    game_id = args[0]
+    if shared_lobby is None:
+        spectate_game(game_id, res)
+        return
+    parsed_game_id = SharedLobby.parse_host_id(game_id)
+    if parsed_game_id is None or parsed_game_id[0] >= shared_lobby.workers:
+        res.send(f'Game with {game_id} id not found')
+    elif parsed_game_id[0] == shared_lobby.worker:
+        spectate_game(game_id, res)
+    elif not shared_lobby.hand_over(res, parsed_game_id[0], ['spectate', game_id]):
+        # games are played on the worker of their host, spectators are moved there
+        res.send('Cannot spectate while other requests are pending')
+
+
+def spectate_game(game_id: str, res: Server.Response) -> None:
+    game = games_by_id.get(game_id)
+    if game is None:
+        res.send(f'Game with {game_id} id not found')
+        return
+    res.subscribe(game.get_topic())
+    res.send(f'spectating game {game_id} \n {str(game.get_board())}')
+
+
+def handle_play_ai_request(args: List[str], res: Server.Response) -> None:
+    if not len(args) or not args[0].isdigit():
+        res.reject_request()
+        return
+    difficulty = int(args[0])
+    if not MIN_BOT_DIFFICULTY <= difficulty <= MAX_BOT_DIFFICULTY:
+        res.send(f'Difficulty has to be from {MIN_BOT_DIFFICULTY} to {MAX_BOT_DIFFICULTY}')
+        return
+    file_descriptor = res.get_file_descriptor()
+    if file_descriptor in games or str(file_descriptor) in lobby:
+        res.send('Already hosting or playing a game')
+        return
+    game_id = get_host_id(file_descriptor)
+    game = Game(game_id, file_descriptor, BOT_FILE_DESCRIPTOR, difficulty)
+    games[file_descriptor] = game
+    games_by_id[game_id] = game
+    res.send(f'starting game with bot {difficulty} \n {str(game.get_board())}')
+
+
+def request_bot_move(game: Game) -> bool:
+    """starts the search of the bot reply, False if the bot pool cannot take it"""
+    assert bot_pool is not None and game.bot_difficulty is not None
+    return bot_pool.submit(game.game_id, get_fen(game.get_board()), game.get_board().ply, game.bot_difficulty,
+                           lambda move_string: handle_bot_move(game, move_string))
+
+
+def handle_bot_move(game: Game, move_string: Optional[str]) -> None:
+    if games_by_id.get(game.game_id) is not game:
+        return
+    player_response = get_player_response(game.white_player_fd)
+    if move_string is None:
+        end_game(game)
+        player_response.send('Bot failed to move, game ended')
+        return
+    game.make_move(Move.from_string(move_string))
+    player_response.send(move_string)
+    publish_move(game, move_string, str(game.get_board()))
+    if not game.has_legal_moves():
+        end_game(game)
+        get_player_response(game.white_player_fd).send('game over, bot won')
+
+
+def get_player_response(file_descriptor: int) -> Server.Response:
+    """response for a message to a player that does not answer one of its requests"""
+    assert game_server is not None
+    return game_server.Response(file_descriptor, game_server, None)
+
+
+def publish_move(game: Game, move_string: str, board_string: str) -> None:
+    if game_server is not None:
+        # serialized once for all spectators
+        game_server.publish(game.get_topic(), f'{move_string} \n {board_string}')
+
+
+def end_game(game: Game) -> None:
+    games.pop(game.white_player_fd, None)
+    games.pop(game.black_player_fd, None)
+    games_by_id.pop(game.game_id, None)
+    if bot_pool is not None and game.bot_difficulty is not None:
+        bot_pool.end_game(game.game_id)
+    if game_server is not None:
+        game_server.publish(game.get_topic(), f'game {game.game_id} ended')
+        game_server.clear_topic(game.get_topic())
 
 
 def handle_search_lobby_request(args: List[str], res: Server.Response) -> None:
+    if shared_lobby is not None:
+        shared_lobby.get_entries(lambda entries: res.send('\n'.join(f'{host_id} {game_name}'
+                                                                     for host_id, game_name in entries)))
+        return
     response = '\n'.join(f'{host_id} {game_name}' for host_id, game_name in lobby.items())
     res.send(response)
 
@@ -80,31 +251,85 @@ def handle_make_move_request(args: List[str], res: Server.Response) -> None:
     if not game.is_move_legal(move):
         res.send('Move is illegal')
         return
-    game.make_move(move)
-    response = str(game.get_board())
-    print(response)
     paired_response = res.get_paired_response()
-    if paired_response is None:
+    if game.bot_difficulty is None and paired_response is None:
+        # every request is answered, a later response on the connection would wait behind this one
+        res.send('Game not found')
+        return
+    undo = game.make_move(move)
+    if game.bot_difficulty is not None:
+        bot_can_move = game.has_legal_moves()
+        if bot_can_move and not request_bot_move(game):
+            # taken back, so every move played is answered by the bot
+            game.unmake_move(undo)
+            res.send('Server busy, try again later')
+            return
+        response = str(game.get_board())
+        print(response)
+        res.send(response)
+        publish_move(game, args[0], response)
+        if not bot_can_move:
+            end_game(game)
+            get_player_response(game.white_player_fd).send('game over, you won')
         return
+    response = str(game.get_board())
+    print(response)
+    assert paired_response is not None
     paired_response.send(args[0])
     res.send(response)
+    publish_move(game, args[0], response)
 
 
 def handle_connection_close(file_descriptor: int) -> None:
     if str(file_descriptor) in lobby:
         lobby.pop(str(file_descriptor))
+        if shared_lobby is not None:
+            shared_lobby.remove(file_descriptor)
     if file_descriptor in games:
-        game: Game = games[file_descriptor]
-        first_player, second_player = game.black_player_fd, game.white_player_fd
-        del games[first_player]
-        del games[second_player]
-
-
-app = Server('0.0.0.0', 5000)
-app.register_handler('ping', handle_ping_request)
-app.register_handler('host', handle_host_game_request)
-app.register_handler('join', handle_join_game_request)
-app.register_handler('find_games', handle_search_lobby_request)
-app.register_handler('move', handle_make_move_request)
-app.set_connection_close_callback(handle_connection_close)
-app.start()
+        end_game(games[file_descriptor])
+
+
+def register_handlers(app: Server, bot_workers: int = os.cpu_count() or 1) -> None:
+    global game_server, bot_pool
+    game_server = app
+    bot_pool = BotPool(bot_workers, use_bitboard=USE_BITBOARD)
+    app.add_reader(bot_pool.get_wakeup_file_descriptor(), bot_pool.handle_wakeup)
+    app.set_stop_callback(bot_pool.close)
+    app.register_handler('ping', handle_ping_request)
+    app.register_handler('host', handle_host_game_request)
+    app.register_handler('join', handle_join_game_request)
+    app.register_handler('find_games', handle_search_lobby_request)
+    app.register_handler('move', handle_make_move_request)
+    app.register_handler('spectate', handle_spectate_request)
+    app.register_handler('play_ai', handle_play_ai_request)
+    app.set_connection_close_callback(handle_connection_close)
+
+
+def configure_worker(worker_server: WorkerServer, bot_workers: int = 1) -> None:
+    global shared_lobby
+    shared_lobby = worker_server.lobby
+    register_handlers(worker_server, bot_workers)
+    worker_server.set_handover_handler(handle_handed_over_request)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs the game server.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='server processes sharing the port and the lobby, 0 for one per CPU core')
+    parser.add_argument('--bot-workers', type=int, default=os.cpu_count() or 1,
+                        help='processes searching bot moves, split between the server processes')
+    parser.add_argument('--server', choices=SERVER_CORES, default='asyncio',
+                        help='server core, asyncio answers pipelined requests in order, epoll is the original one')
+    arguments = parser.parse_args()
+    workers = arguments.workers or os.cpu_count() or 1
+    if workers > 1:
+        if arguments.server != 'asyncio':
+            parser.error('more than one worker needs the asyncio server')
+        run_worker_pool(arguments.host, arguments.port, workers,
+                        functools.partial(configure_worker, bot_workers=max(1, arguments.bot_workers // workers)))
+    else:
+        server = SERVER_CORES[arguments.server](arguments.host, arguments.port)
+        register_handlers(server, arguments.bot_workers)
+        server.start()
@@ -0,0 +1,388 @@
+import asyncio
+import os
+import socket
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Callable, Set, Tuple
+from server_core.framing import FrameBuffer, MAX_REQUEST_SIZE
+
+# type hint
+RequestHandler = Callable[[List[str], 'Server.Response'], None]
+ConnectionCloseCallback = Callable[[int], None]
+
+RESPONSE_TERMINATION_SEQUENCE = b'\n\n'
+INVALID_REQUEST_MESSAGE = 'Invalid Request'
+LISTEN_BACKLOG = 4096
+# writes buffered for a connection above which its requests are no longer read, until it reads its responses
+WRITE_BUFFER_HIGH_WATER_MARK = 1 << 18
+
+
+class _PendingResponse:
+    """place of a response in the order of the requests of a connection"""
+    __slots__ = ('data', 'close_after')
+
+    def __init__(self):
+        self.data: Optional[bytes] = None
+        self.close_after = False
+
+
+class _Connection(asyncio.Protocol):
+    def __init__(self, server: 'Server', handed_over_request: Optional[Tuple[List[str], bytes]] = None):
+        self._server = server
+        # (arguments, unread requests) of a connection handed over by another server, see `Server.adopt_connection`
+        self._handed_over_request = handed_over_request
+        self.is_detached = False
+        self.transport: Optional[asyncio.Transport] = None
+        self.file_descriptor = -1
+        self._requests = FrameBuffer()
+        # responses of requests in flight, written in request order once the first ones are sent
+        self._pending: Deque[_PendingResponse] = deque()
+        self._is_closing = False
+        self._is_writing_paused = False
+
+    def connection_made(self, transport: Any) -> None:
+        self.transport = transport
+        self.file_descriptor = transport.get_extra_info('socket').fileno()
+        transport.set_write_buffer_limits(WRITE_BUFFER_HIGH_WATER_MARK)
+        self._server._connections[self.file_descriptor] = self
+        if self._handed_over_request is not None:
+            # handled before the transport starts reading, so its response goes first
+            args, unread = self._handed_over_request
+            self._handed_over_request = None
+            self._server._handle_handed_over_request(self, args)
+            self.data_received(unread)
+            return
+        print(f'client with file descriptor {self.file_descriptor} connected')
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self._is_closing = True
+        self._server._handle_connection_shutdown(self.file_descriptor, self)
+
+    def data_received(self, data: bytes) -> None:
+        self._requests.feed(data)
+        while not self._is_closing:
+            request = self._requests.next_frame()
+            if request is None:
+                if len(self._requests) > MAX_REQUEST_SIZE:
+                    self.close()
+                return
+            self._server._handle_completed_request(self, request)
+
+    def pause_writing(self) -> None:
+        # the client does not read its responses, so stop reading its requests
+        self._is_writing_paused = True
+        if self.transport is not None and not self._is_closing:
+            self.transport.pause_reading()
+
+    def resume_writing(self) -> None:
+        self._is_writing_paused = False
+        if self.transport is not None and not self._is_closing:
+            self.transport.resume_reading()
+
+    def add_pending_response(self) -> _PendingResponse:
+        pending = _PendingResponse()
+        self._pending.append(pending)
+        return pending
+
+    def complete(self, pending: _PendingResponse, message: bytes, close_after: bool = False) -> None:
+        pending.data = message + RESPONSE_TERMINATION_SEQUENCE
+        pending.close_after = close_after
+        self._flush()
+
+    def push(self, message: bytes, close_after: bool = False) -> None:
+        """writes a message which does not answer a request of this connection"""
+        self.write_payload(message + RESPONSE_TERMINATION_SEQUENCE, close_after)
+
+    def write_payload(self, payload: bytes, close_after: bool = False) -> None:
+        """writes an already terminated message, published ones are shared by all subscribers. It is queued behind
+        the responses of requests received before, which are not sent yet."""
+        if self._is_closing or self.transport is None:
+            return
+        if len(self._pending):
+            queued = _PendingResponse()
+            queued.data = payload
+            queued.close_after = close_after
+            self._pending.append(queued)
+            return
+        self.transport.write(payload)
+        if close_after:
+            self.close()
+
+    def _flush(self) -> None:
+        while len(self._pending) and self._pending[0].data is not None and not self._is_closing:
+            pending = self._pending.popleft()
+            assert self.transport is not None and pending.data is not None
+            self.transport.write(pending.data)
+            if pending.close_after:
+                self.close()
+
+    def detach(self, pending: _PendingResponse, max_unread: int) -> Optional[Tuple[int, bytes]]:
+        """stops serving the connection without closing the client socket, returns (duplicated socket file
+        descriptor, requests received but not handled yet). `pending` has to be the only response not sent yet and
+        at most `max_unread` bytes of requests may be received, otherwise None is returned and the connection is
+        kept."""
+        assert self.transport is not None
+        if self._is_closing or list(self._pending) != [pending] or self.transport.get_write_buffer_size() or \
+                len(self._requests) > max_unread:
+            return None
+        file_descriptor = os.dup(self.file_descriptor)
+        unread = self._requests.take_remaining()
+        self._pending.clear()
+        self.is_detached = True
+        self.close()
+        return file_descriptor, unread
+
+    def close(self) -> None:
+        """closes the connection once the responses written so far are sent"""
+        if not self._is_closing and self.transport is not None:
+            self._is_closing = True
+            self.transport.close()
+
+
+class Server:
+    """asyncio implementation of `server_core.server_core.Server` with the same handler API. Requests of one
+    connection can be sent without waiting for the responses, the responses are written in request order, also
+    when handlers answer them later. Reading from a client is paused while its unread responses exceed
+    `WRITE_BUFFER_HIGH_WATER_MARK`."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 3000, reuse_port: bool = False):
+        self._HOST = host
+        self._PORT = port
+        self._reuse_port = reuse_port  # several processes can listen on the port, the kernel spreads connections
+        self._connections: Dict[int, _Connection] = {}
+        self._request_handlers: Dict[str, RequestHandler] = {}
+        self._handover_handler: Optional[RequestHandler] = None
+        self._on_connection_close: Optional[ConnectionCloseCallback] = None
+        self._on_stop: Optional[Callable[[], None]] = None
+        self._responses_connections: Dict[int, int] = {}
+        self._subscribers: Dict[str, Set[int]] = {}  # topic -> file descriptors
+        self._subscriptions: Dict[int, Set[str]] = {}  # file descriptor -> topics
+        self._listening_server: Optional[asyncio.AbstractServer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._readers: Dict[int, Callable[[], None]] = {}  # file descriptors watched besides the sockets
+
+    def register_handler(self, request_name: str, handler: RequestHandler) -> None:
+        self._request_handlers[request_name] = handler
+
+    def set_connection_close_callback(self, callback: ConnectionCloseCallback) -> None:
+        self._on_connection_close = callback
+
+    def set_stop_callback(self, callback: Callable[[], None]) -> None:
+        """called once the server stopped, before `start` returns"""
+        self._on_stop = callback
+
+    def add_reader(self, file_descriptor: int, callback: Callable[[], None]) -> None:
+        """calls `callback` from the event loop whenever `file_descriptor` is readable, ex. a wakeup pipe written
+        by other threads"""
+        self._readers[file_descriptor] = callback
+        if self._loop is not None:
+            self._loop.add_reader(file_descriptor, callback)
+
+    def subscribe(self, topic: str, file_descriptor: int) -> None:
+        """the connection gets the messages published to `topic` until it unsubscribes or closes"""
+        if file_descriptor not in self._connections:
+            return
+        self._subscribers.setdefault(topic, set()).add(file_descriptor)
+        self._subscriptions.setdefault(file_descriptor, set()).add(topic)
+
+    def unsubscribe(self, topic: str, file_descriptor: int) -> None:
+        subscribers = self._subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(file_descriptor)
+            if len(subscribers) == 0:
+                del self._subscribers[topic]
+        topics = self._subscriptions.get(file_descriptor)
+        if topics is not None:
+            topics.discard(topic)
+            if len(topics) == 0:
+                del self._subscriptions[file_descriptor]
+
+    def clear_topic(self, topic: str) -> None:
+        """unsubscribes all subscribers of `topic`"""
+        for file_descriptor in list(self._subscribers.get(topic, ())):
+            self.unsubscribe(topic, file_descriptor)
+
+    def publish(self, topic: str, message: str) -> int:
+        """writes the message to every subscriber of `topic`, encoded once, returns the number of subscribers.
+        A subscriber gets it after the responses to its requests received before, like pushes to paired
+        connections."""
+        subscribers = self._subscribers.get(topic)
+        if not subscribers:
+            return 0
+        payload = message.encode('utf-8') + RESPONSE_TERMINATION_SEQUENCE
+        for file_descriptor in subscribers:
+            connection = self._connections.get(file_descriptor)
+            if connection is not None:
+                connection.write_payload(payload)
+        return len(subscribers)
+
+    def set_handover_handler(self, handler: RequestHandler) -> None:
+        """handles the requests of connections handed over by another server with `Response.detach`"""
+        self._handover_handler = handler
+
+    def adopt_connection(self, file_descriptor: int, args: List[str], unread: bytes) -> None:
+        """serves a connection detached from another server, `args` are passed to the handover handler, the
+        unread requests are handled after it"""
+        loop = asyncio.get_running_loop()
+        client_socket = socket.socket(fileno=file_descriptor)
+        loop.create_task(loop.connect_accepted_socket(lambda: _Connection(self, (args, unread)), client_socket))
+
+    def start(self) -> None:
+        """Runs the server until interrupted (CTRL + c)"""
+        try:
+            asyncio.run(self._serve())
+        except KeyboardInterrupt:
+            pass
+        if self._on_stop is not None:
+            self._on_stop()
+
+    async def _serve(self) -> None:
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(lambda: _Connection(self), self._HOST, self._PORT, reuse_address=True,
+                                          reuse_port=self._reuse_port or None, backlog=LISTEN_BACKLOG)
+        self._listening_server = server
+        self._loop = loop
+        for file_descriptor, callback in self._readers.items():
+            loop.add_reader(file_descriptor, callback)
+        await self._on_start()
+        async with server:
+            try:
+                await server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    def stop(self) -> None:
+        """stops accepting connections and returns from `start`"""
+        if self._listening_server is not None:
+            self._listening_server.close()
+
+    async def _on_start(self) -> None:
+        """called in the event loop once the server listens"""
+
+    def _handle_handed_over_request(self, connection: _Connection, args: List[str]) -> None:
+        response = Server.Response(connection.file_descriptor, self, None, connection.add_pending_response())
+        if self._handover_handler is None:
+            response.reject_request()
+            return
+        try:
+            self._handover_handler(args, response)
+        except Exception:
+            traceback.print_exc()
+            if not response._is_already_sent:
+                response.reject_request()
+
+    def _handle_completed_request(self, connection: _Connection, request: bytes) -> None:
+        file_descriptor = connection.file_descriptor
+        pending = connection.add_pending_response()
+        paired_response: Optional[Server.Response] = None
+        if file_descriptor in self._responses_connections:
+            paired_response = Server.Response(self._responses_connections[file_descriptor], self, None)
+        response = Server.Response(file_descriptor, self, paired_response, pending)
+        try:
+            lines: List[str] = request.decode('utf-8').splitlines()
+        except UnicodeDecodeError:
+            response.reject_request()
+            return
+        if not len(lines) > 0:
+            response.reject_request()
+            return
+        request_name = lines.pop(0).strip()
+        handler = self._request_handlers.get(request_name)
+        if handler is None:
+            response.reject_request()
+            return
+        try:
+            handler(lines, response)
+        except Exception:
+            traceback.print_exc()
+            if not response._is_already_sent:
+                response.reject_request()
+
+    def _handle_connection_shutdown(self, file_descriptor: int, connection: _Connection) -> None:
+        if self._connections.get(file_descriptor) is not connection:
+            return
+        del self._connections[file_descriptor]
+        if connection.is_detached:
+            print(f'connection {file_descriptor} handed over')
+        else:
+            print(f'connection {file_descriptor} closed')
+            if self._on_connection_close is not None:
+                self._on_connection_close(file_descriptor)
+        for topic in list(self._subscriptions.get(file_descriptor, ())):
+            self.unsubscribe(topic, file_descriptor)
+        paired_file_descriptor = self._responses_connections.pop(file_descriptor, None)
+        if paired_file_descriptor is not None and self._responses_connections.get(paired_file_descriptor) == \
+                file_descriptor:
+            del self._responses_connections[paired_file_descriptor]
+
+    def _create_responses_connection(self, first_file_descriptor: int, second_file_descriptor: int) -> None:
+        self._responses_connections[first_file_descriptor] = second_file_descriptor
+        self._responses_connections[second_file_descriptor] = first_file_descriptor
+
+    class Response:
+        def __init__(self, file_descriptor: int, server: 'Server', pair: Optional['Server.Response'],
+                     pending: Optional[_PendingResponse] = None):
+            self._server = server
+            self._file_descriptor = file_descriptor
+            self._is_already_sent = False
+            self._pair = pair
+            # responses to a request keep their place in the response order, the others are written right away
+            self._pending = pending
+
+        def _write(self, message: bytes, close_after: bool = False) -> None:
+            assert not self._is_already_sent, 'response already sent'
+            self._is_already_sent = True
+            connection = self._server._connections.get(self._file_descriptor)
+            if connection is None:
+                return
+            if self._pending is not None:
+                connection.complete(self._pending, message, close_after)
+            else:
+                connection.push(message, close_after)
+
+        def close(self) -> None:
+            assert not self._is_already_sent, 'response already sent'
+            self._is_already_sent = True
+            connection = self._server._connections.get(self._file_descriptor)
+            if connection is not None:
+                connection.close()
+
+        def send(self, message: str) -> None:
+            self._write(message.encode('utf-8'))
+
+        def send_and_close(self, message: str) -> None:
+            self._write(message.encode('utf-8'), True)
+
+        def reject_request(self) -> None:
+            self._write(INVALID_REQUEST_MESSAGE.encode('utf-8'))
+
+        def detach(self, max_unread: int) -> Optional[Tuple[int, bytes]]:
+            """stops serving the connection of this request, to hand it over to another server. Returns (duplicated
+            socket file descriptor, requests not handled yet) or None if earlier responses are not sent yet or more
+            than `max_unread` bytes of later requests are received. The request is answered by the server adopting
+            the connection."""
+            assert not self._is_already_sent, 'response already sent'
+            connection = self._server._connections.get(self._file_descriptor)
+            if connection is None or self._pending is None:
+                return None
+            detached = connection.detach(self._pending, max_unread)
+            if detached is not None:
+                self._is_already_sent = True
+            return detached
+
+        def pair_with(self, file_descriptor: int) -> 'Server.Response':
+            self._server._create_responses_connection(self._file_descriptor, file_descriptor)
+            return Server.Response(file_descriptor, self._server, None)
+
+        def get_paired_response(self) -> Optional['Server.Response']:
+            return self._pair
+
+        def subscribe(self, topic: str) -> None:
+            """the connection of this response gets the messages published to `topic`"""
+            self._server.subscribe(topic, self._file_descriptor)
+
+        def unsubscribe(self, topic: str) -> None:
+            self._server.unsubscribe(topic, self._file_descriptor)
+
+        def get_file_descriptor(self) -> int:
+            return self._file_descriptor
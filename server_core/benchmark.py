@@ -0,0 +1,126 @@
+"""Compares the epoll and asyncio servers: many clients send ping requests in batches and count the replies.
+
+    python -m server_core.benchmark --connections 1000 --requests 20 --pipeline 1
+    python -m server_core.benchmark --connections 200 --requests 100 --pipeline 10
+    python -m server_core.benchmark --implementations asyncio pool --workers 4
+
+With `--pipeline` above 1 a batch of requests is written before reading its replies. Replies not received within
+`--timeout` are reported as dropped.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from typing import Any, List, Tuple
+from server_core.worker_pool import run_worker_pool
+
+IMPLEMENTATIONS = {
+    'epoll': 'server_core.server_core',
+    'asyncio': 'server_core.async_server',
+    'pool': 'server_core.worker_pool',  # asyncio servers in `--workers` processes
+}
+REQUEST = b'ping\n\n'
+REPLY = b'pong\n\n'
+
+
+def register_ping_handler(server: Any) -> None:
+    server.register_handler('ping', lambda args, res: res.send('pong'))
+
+
+def run_server(module_name: str, port: int, workers: int) -> None:
+    # connection messages of thousands of clients would measure the terminal
+    sys.stdout = open(os.devnull, 'w')
+    if module_name == IMPLEMENTATIONS['pool']:
+        run_worker_pool('127.0.0.1', port, workers, register_ping_handler)
+        return
+    module = __import__(module_name, fromlist=['Server'])
+    server = module.Server('127.0.0.1', port)
+    register_ping_handler(server)
+    server.start()
+
+
+async def open_connection(port: int, timeout: float) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            return await asyncio.open_connection('127.0.0.1', port)
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+
+async def run_client(port: int, requests: int, pipeline: int, timeout: float, latencies: List[float]) -> int:
+    """returns the number of replies received"""
+    reader, writer = await open_connection(port, timeout)
+    replies = 0
+    try:
+        for batch_start in range(0, requests, pipeline):
+            batch = min(pipeline, requests - batch_start)
+            start = time.perf_counter()
+            writer.write(REQUEST * batch)
+            await writer.drain()
+            received = 0
+            try:
+                while received < batch:
+                    await asyncio.wait_for(reader.readuntil(REPLY), timeout)
+                    received += 1
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                replies += received
+                break
+            replies += received
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+    return replies
+
+
+async def run_clients(port: int, connections: int, requests: int, pipeline: int,
+                      timeout: float) -> Tuple[int, float, List[float]]:
+    latencies: List[float] = []
+    # the server has to be listening before thousands of clients connect at once
+    _, writer = await open_connection(port, timeout)
+    writer.close()
+    start = time.perf_counter()
+    replies = await asyncio.gather(*[run_client(port, requests, pipeline, timeout, latencies)
+                                     for _ in range(connections)], return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    return sum(reply for reply in replies if isinstance(reply, int)), elapsed, latencies
+
+
+def benchmark(implementation: str, port: int, connections: int, requests: int, pipeline: int, timeout: float,
+              workers: int) -> None:
+    server_process = multiprocessing.Process(target=run_server, args=(IMPLEMENTATIONS[implementation], port, workers))
+    server_process.start()
+    try:
+        replies, elapsed, latencies = asyncio.run(run_clients(port, connections, requests, pipeline, timeout))
+    finally:
+        server_process.terminate()
+        server_process.join()
+    expected = connections * requests
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000 if len(latencies) else 0.0
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if len(latencies) else 0.0
+    print(f'{implementation:<8} {replies}/{expected} replies, {expected - replies} dropped, {elapsed:.2f}s, '
+          f'{replies / elapsed:.0f} replies/s, batch latency p50 {p50:.1f}ms p99 {p99:.1f}ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures ping throughput of the server implementations.')
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=20, help='requests sent by each connection')
+    parser.add_argument('--pipeline', type=int, default=1, help='requests written before reading their replies')
+    parser.add_argument('--timeout', type=float, default=2.0, help='seconds a reply is waited for')
+    parser.add_argument('--port', type=int, default=5100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='server processes of the pool')
+    parser.add_argument('--implementations', nargs='+', choices=list(IMPLEMENTATIONS), default=list(IMPLEMENTATIONS))
+    arguments = parser.parse_args()
+    # every connection takes a file descriptor in the client and in the server
+    soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard_limit, hard_limit))
+    for index, name in enumerate(arguments.implementations):
+        benchmark(name, arguments.port + index, arguments.connections, arguments.requests, arguments.pipeline,
+                  arguments.timeout, arguments.workers)
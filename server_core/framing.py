@@ -0,0 +1,65 @@
+from typing import Optional
+
+# requests end with an empty line, written as b'\n\n' or b'\n\r\n'
+FRAME_END = ord('\n')
+CARRIAGE_RETURN = ord('\r')
+MAX_REQUEST_SIZE = 1 << 24  # connections sending longer requests are closed
+
+
+class FrameBuffer:
+    """Bytes received from a connection, split into requests. Each byte is scanned for terminators once, also when
+    a terminator arrives split between reads, and handled requests are dropped from the front of the buffer
+    without copying the rest on every request."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._start = 0  # beginning of the first request not returned yet
+        self._scanned = 0  # bytes before this index contain no terminator of the current request
+
+    def __len__(self) -> int:
+        return len(self._buffer) - self._start
+
+    def feed(self, data: bytes) -> None:
+        if self._start:
+            # deleting a prefix of a bytearray only moves its start
+            del self._buffer[:self._start]
+            self._scanned -= self._start
+            self._start = 0
+        self._buffer += data
+
+    def next_frame(self) -> Optional[bytes]:
+        """the next complete request without its terminator, or None if it is not received yet"""
+        buffer = self._buffer
+        index = self._scanned
+        while True:
+            index = buffer.find(FRAME_END, index)
+            if index < 0:
+                self._scanned = len(buffer)
+                return None
+            if index + 1 >= len(buffer):
+                break
+            if buffer[index + 1] == FRAME_END:
+                return self._take_frame(index, 2)
+            if buffer[index + 1] == CARRIAGE_RETURN:
+                if index + 2 >= len(buffer):
+                    break
+                if buffer[index + 2] == FRAME_END:
+                    return self._take_frame(index, 3)
+            index += 1
+        # the terminator may be completed by the next read
+        self._scanned = index
+        return None
+
+    def _take_frame(self, end: int, terminator_length: int) -> bytes:
+        frame = bytes(self._buffer[self._start:end])
+        self._start = end + terminator_length
+        self._scanned = self._start
+        return frame
+
+    def take_remaining(self) -> bytes:
+        """bytes of the requests not returned yet, the buffer is emptied"""
+        remaining = bytes(self._buffer[self._start:])
+        self._buffer = bytearray()
+        self._start = 0
+        self._scanned = 0
+        return remaining
@@ -0,0 +1,144 @@
+"""Sends random streams of tiny and very large pipelined requests, split at random points including inside
+terminators, and checks that every reply arrives in order. Reports the throughput of each server implementation.
+
+    python -m server_core.fuzz --messages 2000 --connections 4
+    python -m server_core.fuzz --implementations epoll --large-size 8000000 --seed 3
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import socket
+import string
+import sys
+import threading
+import time
+from typing import List, Tuple
+from server_core.benchmark import IMPLEMENTATIONS
+from server_core.framing import MAX_REQUEST_SIZE
+
+TERMINATORS = [b'\n\n', b'\n\r\n']
+REPLY_TERMINATOR = b'\n\n'
+LETTERS = string.ascii_letters.encode('ascii')
+
+
+def run_echo_server(module_name: str, port: int) -> None:
+    sys.stdout = open(os.devnull, 'w')
+    module = __import__(module_name, fromlist=['Server'])
+    server = module.Server('127.0.0.1', port)
+    server.register_handler('ping', lambda args, res: res.send('pong'))
+    server.register_handler('echo', lambda args, res: res.send('\n'.join(args)))
+    server.start()
+
+
+def create_messages(generator: random.Random, count: int, large_size: int) -> List[Tuple[bytes, bytes]]:
+    """(request, expected reply) pairs, mostly tiny, some small and a few very large"""
+    messages = []
+    for _ in range(count):
+        kind = generator.random()
+        if kind < 0.7:
+            messages.append((b'ping' + generator.choice(TERMINATORS), b'pong' + REPLY_TERMINATOR))
+            continue
+        size = generator.randint(1, 100) if kind < 0.97 else generator.randint(large_size // 2, large_size)
+        lines = []
+        while size > 0:
+            line_length = min(size, generator.randint(1, 4096))
+            lines.append(bytes(generator.choices(LETTERS, k=line_length)))
+            size -= line_length
+        payload = b'\n'.join(lines)
+        messages.append((b'echo\n' + payload + generator.choice(TERMINATORS), payload + REPLY_TERMINATOR))
+    return messages
+
+
+def send_stream(client_socket: socket.socket, stream: bytes, generator: random.Random) -> None:
+    view = memoryview(stream)
+    offset = 0
+    while offset < len(stream):
+        # mostly small writes, so terminators are often split between reads of the server
+        chunk = generator.choice([1, 2, 3, generator.randint(1, 1500), generator.randint(1, 1 << 17)])
+        client_socket.sendall(view[offset:offset + chunk])
+        offset += chunk
+
+
+def run_connection(port: int, messages: List[Tuple[bytes, bytes]], seed: int, errors: List[str]) -> int:
+    """sends all requests on one connection and returns the number of bytes received"""
+    client_socket = socket.create_connection(('127.0.0.1', port))
+    stream = b''.join(request for request, _ in messages)
+    # the replies are read while sending, large replies would otherwise fill both socket buffers
+    sender = threading.Thread(target=send_stream, args=(client_socket, stream, random.Random(seed)), daemon=True)
+    sender.start()
+    expected = b''.join(reply for _, reply in messages)
+    received = bytearray()
+    client_socket.settimeout(10)
+    try:
+        while len(received) < len(expected):
+            data = client_socket.recv(1 << 16)
+            if len(data) == 0:
+                break
+            received += data
+    except socket.timeout:
+        pass
+    sender.join()
+    client_socket.close()
+    if received != expected:
+        mismatch = next((index for index in range(min(len(received), len(expected)))
+                         if received[index] != expected[index]), min(len(received), len(expected)))
+        errors.append(f'received {len(received)} of {len(expected)} bytes, first difference at byte {mismatch}')
+    return len(received)
+
+
+def fuzz(implementation: str, port: int, connections: int, count: int, large_size: int, seed: int) -> bool:
+    server_process = multiprocessing.Process(target=run_echo_server, args=(IMPLEMENTATIONS[implementation], port))
+    server_process.start()
+    generator = random.Random(seed)
+    connection_messages = [create_messages(generator, count, large_size) for _ in range(connections)]
+    sent_bytes = sum(len(request) for messages in connection_messages for request, _ in messages)
+    errors: List[str] = []
+    received_bytes = []
+    try:
+        # waits until the server listens
+        deadline = time.perf_counter() + 5
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port)).close()
+                break
+            except OSError:
+                if time.perf_counter() > deadline:
+                    raise
+                time.sleep(0.05)
+        start = time.perf_counter()
+        threads = [threading.Thread(target=lambda index=index: received_bytes.append(
+            run_connection(port, connection_messages[index], seed + index, errors))) for index in range(connections)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        server_process.terminate()
+        server_process.join()
+    status = 'ok' if len(errors) == 0 else 'FAILED'
+    print(f'{implementation:<8} {status}: {connections * count} requests, {sent_bytes / 1e6:.1f}MB sent, '
+          f'{sum(received_bytes) / 1e6:.1f}MB received in {elapsed:.2f}s, '
+          f'{(sent_bytes + sum(received_bytes)) / 1e6 / elapsed:.1f}MB/s')
+    for error in errors:
+        print(f'    {error}')
+    return len(errors) == 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fuzzes request framing of the server implementations.')
+    parser.add_argument('--messages', type=int, default=1000, help='requests sent by each connection')
+    parser.add_argument('--connections', type=int, default=4)
+    parser.add_argument('--large-size', type=int, default=1 << 21, help='largest request in bytes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=5200)
+    parser.add_argument('--implementations', nargs='+', choices=['epoll', 'asyncio'], default=['epoll', 'asyncio'])
+    arguments = parser.parse_args()
+    if arguments.large_size > MAX_REQUEST_SIZE:
+        parser.error(f'requests longer than {MAX_REQUEST_SIZE} bytes are rejected by the servers')
+    passed = True
+    for implementation_index, name in enumerate(arguments.implementations):
+        passed &= fuzz(name, arguments.port + implementation_index, arguments.connections, arguments.messages,
+                       arguments.large_size, arguments.seed)
+    exit(0 if passed else 1)
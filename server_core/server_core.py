@@ -1,27 +1,40 @@
 import socket
 import select
 import traceback
-from typing import List, Dict, Callable, Set, Optional
+from collections import deque
+from itertools import islice
+from typing import List, Deque, Dict, Callable, Set, Optional
+from server_core.framing import FrameBuffer, MAX_REQUEST_SIZE
 
 # type hint
 RequestHandler = Callable[[List[str], 'Server.Response'], None]
 ConnectionCloseCallback = Callable[[int], None]
 
+RECEIVE_SIZE = 1 << 16
+RESPONSE_TERMINATION_SEQUENCE = b'\n\n'
+MAX_SEND_BUFFERS = 64  # queued messages passed to one sendmsg call
+
 
 class Server:
     def __init__(self, host: str = '127.0.0.1', port: int = 3000):
         self._HOST = host
         self._PORT = port
-        self._MESSAGE_TERMINAITON_SEQUENCES: List[bytes] = [b'\n\n', b'\n\r\n']
         self._server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self._epoll = select.epoll()
         self._client_sockets: Dict[int, socket.socket] = {}
         self._closing_sockets: Set[int] = set()
-        self._requests: Dict[int, bytes] = {}
-        self._responses: Dict[int, bytes] = {}
+        self._requests: Dict[int, FrameBuffer] = {}
+        # messages not sent yet, in sending order, and the number of bytes of the first one already sent.
+        # a published message is one bytes object shared by the queues of all subscribers
+        self._responses: Dict[int, Deque[bytes]] = {}
+        self._sent_response_bytes: Dict[int, int] = {}
+        self._subscribers: Dict[str, Set[int]] = {}  # topic -> file descriptors
+        self._subscriptions: Dict[int, Set[str]] = {}  # file descriptor -> topics
         self._request_handlers: Dict[str, RequestHandler] = {}
         self._on_connection_close: Optional[ConnectionCloseCallback] = None
+        self._on_stop: Optional[Callable[[], None]] = None
         self._responses_connections: Dict[int, int] = {}
+        self._readers: Dict[int, Callable[[], None]] = {}  # file descriptors watched besides the sockets
 
     def register_handler(self, request_name: str, handler: RequestHandler) -> None:
         self._request_handlers[request_name] = handler
@@ -29,6 +42,50 @@ class Server:
     def set_connection_close_callback(self, callback: ConnectionCloseCallback) -> None:
         self._on_connection_close = callback
 
+    def set_stop_callback(self, callback: Callable[[], None]) -> None:
+        """called once the server stopped, before `start` returns"""
+        self._on_stop = callback
+
+    def add_reader(self, file_descriptor: int, callback: Callable[[], None]) -> None:
+        """calls `callback` from the event loop whenever `file_descriptor` is readable, ex. a wakeup pipe written
+        by other threads"""
+        self._readers[file_descriptor] = callback
+        self._epoll.register(file_descriptor, select.EPOLLIN)
+
+    def subscribe(self, topic: str, file_descriptor: int) -> None:
+        """the connection gets the messages published to `topic` until it unsubscribes or closes"""
+        if file_descriptor not in self._client_sockets:
+            return
+        self._subscribers.setdefault(topic, set()).add(file_descriptor)
+        self._subscriptions.setdefault(file_descriptor, set()).add(topic)
+
+    def unsubscribe(self, topic: str, file_descriptor: int) -> None:
+        subscribers = self._subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(file_descriptor)
+            if len(subscribers) == 0:
+                del self._subscribers[topic]
+        topics = self._subscriptions.get(file_descriptor)
+        if topics is not None:
+            topics.discard(topic)
+            if len(topics) == 0:
+                del self._subscriptions[file_descriptor]
+
+    def clear_topic(self, topic: str) -> None:
+        """unsubscribes all subscribers of `topic`"""
+        for file_descriptor in list(self._subscribers.get(topic, ())):
+            self.unsubscribe(topic, file_descriptor)
+
+    def publish(self, topic: str, message: str) -> int:
+        """queues the message to every subscriber of `topic`, encoded once, returns the number of subscribers"""
+        subscribers = self._subscribers.get(topic)
+        if not subscribers:
+            return 0
+        payload = message.encode('utf-8') + RESPONSE_TERMINATION_SEQUENCE
+        for file_descriptor in subscribers:
+            self._queue_payload(file_descriptor, payload)
+        return len(subscribers)
+
     def start(self) -> None:
         """Runs the server """
         self._server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -44,6 +101,8 @@ class Server:
             self._epoll.unregister(self._server_socket.fileno())
             self._epoll.close()
             self._server_socket.close()
+        if self._on_stop is not None:
+            self._on_stop()
 
     def _start_event_loop(self) -> None:
         """Starts server infinite event loop in which it accepts new conections or reads client data.
@@ -57,11 +116,15 @@ class Server:
                 try:
                     if file_descriptor == self._server_socket.fileno():
                         self._accept_new_connection()
-                    elif event & select.EPOLLIN:
+                        continue
+                    if file_descriptor in self._readers:
+                        self._readers[file_descriptor]()
+                        continue
+                    if event & select.EPOLLIN:
                         self._read_client_socket(file_descriptor)
-                    elif event & select.EPOLLOUT:
+                    if event & select.EPOLLOUT and file_descriptor in self._client_sockets:
                         self._write_to_client_socket(file_descriptor)
-                    elif event & select.EPOLLHUP:
+                    if event & select.EPOLLHUP and file_descriptor in self._client_sockets:
                         self._handle_connection_shutdown(file_descriptor)
                 except ConnectionResetError:
                     self._handle_connection_shutdown(file_descriptor)
@@ -71,44 +134,67 @@ class Server:
         client_socket.setblocking(False)
         file_descriptor = client_socket.fileno()
         self._client_sockets[file_descriptor] = client_socket
-        self._requests[file_descriptor] = b''
-        self._responses[file_descriptor] = b''
+        self._requests[file_descriptor] = FrameBuffer()
+        self._responses[file_descriptor] = deque()
+        self._sent_response_bytes[file_descriptor] = 0
         self._epoll.register(file_descriptor, select.EPOLLIN)
         print(f'client with file descriptor {file_descriptor} connected')
 
     def _read_client_socket(self, file_descriptor: int) -> None:
         client_socket = self._client_sockets[file_descriptor]
-        buffer: bytes = client_socket.recv(1024)
+        buffer: bytes = client_socket.recv(RECEIVE_SIZE)
         if len(buffer) == 0:
             # after client sudden shutdown of socket EOF is reached and buffer is empty
             # if not handled epoll will keep reading empty bytes from this socket
             self._handle_connection_shutdown(file_descriptor)
             return
-        else:
-            self._requests[file_descriptor] += buffer
-        print(f'received message from socket with file descriptor: {client_socket.fileno()}: ')
-        print(buffer)
-        if any(seq in buffer for seq in self._MESSAGE_TERMINAITON_SEQUENCES):
-            self._handle_completed_request(file_descriptor)
+        requests = self._requests[file_descriptor]
+        requests.feed(buffer)
+        print(f'received {len(buffer)} bytes from socket with file descriptor: {file_descriptor}')
+        # a read can complete several pipelined requests
+        while file_descriptor in self._client_sockets and file_descriptor not in self._closing_sockets:
+            request = requests.next_frame()
+            if request is None:
+                break
+            self._handle_completed_request(file_descriptor, request)
+        if len(requests) > MAX_REQUEST_SIZE and file_descriptor in self._client_sockets:
+            self._handle_connection_shutdown(file_descriptor)
 
     def _write_to_client_socket(self, file_descriptor: int) -> None:
-        response = self._responses[file_descriptor]
-        if len(response) < 2 or response[-1] != b'\n' or response[-2] != b'\n':
-            response += b'\n\n'
-        sent_bytes_count = self._client_sockets[file_descriptor].send(response)
-        self._responses[file_descriptor] = response[sent_bytes_count:]
-        if len(response) == sent_bytes_count:
-            if file_descriptor in self._closing_sockets:
-                self._closing_sockets.remove(file_descriptor)
-                self._handle_connection_shutdown(file_descriptor)
-                return
-            self._requests[file_descriptor] = b''
-            self._responses[file_descriptor] = b''
-            self._epoll.modify(file_descriptor, select.EPOLLIN)
-
-    def _handle_completed_request(self, file_descriptor: int) -> None:
-        request: bytes = self._requests[file_descriptor]
-        lines: List[str] = request.decode('utf-8').splitlines()
+        queue = self._responses[file_descriptor]
+        sent_bytes_count = self._sent_response_bytes[file_descriptor]
+        # the queued messages are sent without joining them, the first one from its unsent part
+        buffers = [memoryview(queue[0])[sent_bytes_count:], *islice(queue, 1, MAX_SEND_BUFFERS)]
+        sent_bytes_count += self._client_sockets[file_descriptor].sendmsg(buffers)
+        while len(queue) and sent_bytes_count >= len(queue[0]):
+            sent_bytes_count -= len(queue.popleft())
+        self._sent_response_bytes[file_descriptor] = sent_bytes_count
+        if len(queue):
+            return
+        if file_descriptor in self._closing_sockets:
+            self._closing_sockets.remove(file_descriptor)
+            self._handle_connection_shutdown(file_descriptor)
+            return
+        self._epoll.modify(file_descriptor, select.EPOLLIN)
+
+    def _queue_response(self, file_descriptor: int, message: bytes) -> None:
+        """responses are sent in the order they are queued, once the socket is writable"""
+        self._queue_payload(file_descriptor, message + RESPONSE_TERMINATION_SEQUENCE)
+
+    def _queue_payload(self, file_descriptor: int, payload: bytes) -> None:
+        if file_descriptor not in self._client_sockets or file_descriptor in self._closing_sockets:
+            return
+        queue = self._responses[file_descriptor]
+        if len(queue) == 0:
+            self._epoll.modify(file_descriptor, select.EPOLLIN | select.EPOLLOUT)
+        queue.append(payload)
+
+    def _handle_completed_request(self, file_descriptor: int, request: bytes) -> None:
+        try:
+            lines: List[str] = request.decode('utf-8').splitlines()
+        except UnicodeDecodeError:
+            self._handle_invalid_request(file_descriptor)
+            return
         if not len(lines) > 0:
             self._handle_invalid_request(file_descriptor)
             return
@@ -124,8 +210,7 @@ class Server:
         handler(lines, response)
 
     def _handle_invalid_request(self, file_descriptor: int, message: str = "Invalid Request") -> None:
-        self._responses[file_descriptor] = message.encode('utf-8')
-        self._epoll.modify(file_descriptor, select.EPOLLOUT)
+        self._queue_response(file_descriptor, message.encode('utf-8'))
 
     def _handle_connection_shutdown(self, file_descriptor: int) -> None:
         print(f'connection {file_descriptor} closed')
@@ -136,6 +221,10 @@ class Server:
         del self._client_sockets[file_descriptor]
         del self._requests[file_descriptor]
         del self._responses[file_descriptor]
+        del self._sent_response_bytes[file_descriptor]
+        self._closing_sockets.discard(file_descriptor)
+        for topic in list(self._subscriptions.get(file_descriptor, ())):
+            self.unsubscribe(topic, file_descriptor)
 
     def _create_responses_connection(self, first_file_descriptor: int, second_file_descriptor: int) -> None:
         self._responses_connections[first_file_descriptor] = second_file_descriptor
@@ -155,15 +244,14 @@ class Server:
 
         def send(self, message: str) -> None:
             assert not self._is_already_sent, 'response already sent'
-            self._server._responses[self._file_descriptor] = message.encode('utf-8')
-            self._server._epoll.modify(self._file_descriptor, select.EPOLLOUT)
+            self._server._queue_response(self._file_descriptor, message.encode('utf-8'))
             self._is_already_sent = True
 
         def send_and_close(self, message: str) -> None:
             assert not self._is_already_sent, 'response already sent'
-            self._server._responses[self._file_descriptor] = message.encode('utf-8')
-            self._server._epoll.modify(self._file_descriptor, select.EPOLLOUT)
-            self._server._closing_sockets.add(self._file_descriptor)
+            if self._file_descriptor in self._server._client_sockets:
+                self._server._queue_response(self._file_descriptor, message.encode('utf-8'))
+                self._server._closing_sockets.add(self._file_descriptor)
             self._is_already_sent = True
 
         def reject_request(self) -> None:
@@ -178,5 +266,12 @@ class Server:
         def get_paired_response(self) -> Optional['Server.Response']:
             return self._pair
 
+        def subscribe(self, topic: str) -> None:
+            """the connection of this response gets the messages published to `topic`"""
+            self._server.subscribe(topic, self._file_descriptor)
+
+        def unsubscribe(self, topic: str) -> None:
+            self._server.unsubscribe(topic, self._file_descriptor)
+
         def get_file_descriptor(self) -> int:
             return self._file_descriptor
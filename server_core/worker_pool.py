@@ -0,0 +1,250 @@
+"""Runs several `async_server.Server` processes on one port. Every worker listens with SO_REUSEPORT, so the kernel
+spreads new connections between them, and games whose players are on the same worker never leave it.
+
+The parent process keeps the lobby shared by all workers and talks to each of them over a Unix socket pair.
+Messages are JSON objects, one per SOCK_SEQPACKET packet. A player joining a game hosted on another worker is
+handed over to it: the joining worker detaches the connection and passes its socket through the parent with
+SCM_RIGHTS, and the host's worker serves it from then on.
+
+The channels are blocking sockets used from the event loops. That is safe because packets are small, at most
+`MAX_MESSAGE_SIZE` bytes, and both sides read them as soon as their loop runs, so a send waits at most for one
+iteration of the receiving loop.
+"""
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import socket
+import traceback
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from server_core.async_server import Server
+
+MAX_MESSAGE_SIZE = 1 << 16  # well below the packet size a Unix socket accepts with default buffer sizes
+# requests received behind the handed over one, a connection with more of them is not handed over. They are sent
+# base64 encoded in the handover message, so they have to fit in it with room to spare.
+MAX_HANDOVER_UNREAD = 1 << 14
+
+LobbyEntries = List[Tuple[str, str]]  # host id, game name
+
+
+def send_message(channel: socket.socket, message: Dict[str, Any], file_descriptor: Optional[int] = None) -> None:
+    data = json.dumps(message).encode('utf-8')
+    if file_descriptor is None:
+        channel.sendall(data)
+    else:
+        socket.send_fds(channel, [data], [file_descriptor])
+
+
+def receive_message(channel: socket.socket) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
+    """returns (message, passed file descriptor), message is None once the other side closed the channel. Raises
+    ValueError for truncated or malformed messages, after closing the passed file descriptor."""
+    data, file_descriptors, flags, _ = socket.recv_fds(channel, MAX_MESSAGE_SIZE, 1)
+    if len(data) == 0 and len(file_descriptors) == 0:
+        return None, None
+    try:
+        if flags & (socket.MSG_TRUNC | socket.MSG_CTRUNC):
+            raise ValueError('truncated message')
+        message = json.loads(data)
+    except ValueError:
+        for file_descriptor in file_descriptors:
+            os.close(file_descriptor)
+        raise
+    return message, file_descriptors[0] if len(file_descriptors) else None
+
+
+class SharedLobby:
+    """Lobby of a worker, kept by the parent process. Host ids are `worker:file descriptor`, unique among all
+    workers. Answers come asynchronously, through callbacks."""
+
+    def __init__(self, worker: int, workers: int, channel: socket.socket):
+        self.worker = worker
+        self.workers = workers
+        self._channel = channel
+        self._next_request = 0
+        self._callbacks: Dict[int, Callable[[Any], None]] = {}
+
+    def get_host_id(self, file_descriptor: int) -> str:
+        return f'{self.worker}:{file_descriptor}'
+
+    @staticmethod
+    def parse_host_id(host_id: str) -> Optional[Tuple[int, int]]:
+        """(worker, file descriptor) of a host id, None if it is malformed"""
+        fields = host_id.split(':')
+        if len(fields) != 2 or not all(field.isdigit() for field in fields):
+            return None
+        return int(fields[0]), int(fields[1])
+
+    def add(self, file_descriptor: int, game_name: str) -> None:
+        send_message(self._channel, {'op': 'add', 'host': self.get_host_id(file_descriptor), 'name': game_name})
+
+    def remove(self, file_descriptor: int) -> None:
+        send_message(self._channel, {'op': 'remove', 'host': self.get_host_id(file_descriptor)})
+
+    def get_entries(self, callback: Callable[[LobbyEntries], None]) -> None:
+        self._send_request({'op': 'list'}, lambda entries: callback([(host, name) for host, name in entries]))
+
+    def claim(self, host_id: str, callback: Callable[[Optional[Tuple[int, str]]], None]) -> None:
+        """removes the game from the lobby, the callback gets (worker of its host, game name) or None if it was not
+        there"""
+        self._send_request({'op': 'claim', 'host': host_id},
+                           lambda entry: callback(None if entry is None else (entry[0], entry[1])))
+
+    def restore(self, host_id: str, game_name: str, worker: int) -> None:
+        """puts a claimed game of `worker` back in the lobby, when it could not be joined"""
+        send_message(self._channel, {'op': 'add', 'host': host_id, 'name': game_name, 'worker': worker})
+
+    def hand_over(self, response: Server.Response, worker: int, args: List[str]) -> bool:
+        """passes the connection of `response` to `worker`, whose handover handler gets `args` and answers the
+        request. False if the connection has responses not sent yet or more than `MAX_HANDOVER_UNREAD` bytes of
+        later requests."""
+        detached = response.detach(MAX_HANDOVER_UNREAD)
+        if detached is None:
+            return False
+        file_descriptor, unread = detached
+        try:
+            send_message(self._channel, {'op': 'hand_over', 'worker': worker, 'args': args,
+                                         'unread': base64.b64encode(unread).decode('ascii')}, file_descriptor)
+        except OSError:
+            # the client is already detached, closing its socket is all that is left
+            traceback.print_exc()
+        finally:
+            os.close(file_descriptor)
+        return True
+
+    def _send_request(self, message: Dict[str, Any], callback: Callable[[Any], None]) -> None:
+        self._next_request += 1
+        self._callbacks[self._next_request] = callback
+        message['request'] = self._next_request
+        send_message(self._channel, message)
+
+    def handle_reply(self, message: Dict[str, Any]) -> None:
+        callback = self._callbacks.pop(message['request'])
+        callback(message['result'])
+
+
+class WorkerServer(Server):
+    def __init__(self, host: str, port: int, worker: int, workers: int, channel: socket.socket):
+        super().__init__(host, port, True)
+        self.lobby = SharedLobby(worker, workers, channel)
+        self._channel = channel
+
+    async def _on_start(self) -> None:
+        asyncio.get_running_loop().add_reader(self._channel.fileno(), self._read_channel)
+
+    def _read_channel(self) -> None:
+        try:
+            message, file_descriptor = receive_message(self._channel)
+        except ValueError:
+            traceback.print_exc()
+            return
+        if message is None:
+            # the parent process is gone
+            asyncio.get_running_loop().remove_reader(self._channel.fileno())
+            self.stop()
+            return
+        try:
+            if message.get('op') == 'adopt':
+                assert file_descriptor is not None
+                self.adopt_connection(file_descriptor, message['args'], base64.b64decode(message['unread']))
+                file_descriptor = None
+            else:
+                self.lobby.handle_reply(message)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            if file_descriptor is not None:
+                os.close(file_descriptor)
+
+
+class LobbyCoordinator:
+    """Lobby shared by the workers, run by the parent process"""
+
+    def __init__(self, channels: List[socket.socket]):
+        self._channels = channels
+        self._lobby: Dict[str, Tuple[str, int]] = {}  # host id -> game name, worker
+
+    def run(self) -> None:
+        loop = asyncio.new_event_loop()
+        for worker, channel in enumerate(self._channels):
+            loop.add_reader(channel.fileno(), self._read_channel, worker, loop)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def _read_channel(self, worker: int, loop: asyncio.AbstractEventLoop) -> None:
+        channel = self._channels[worker]
+        try:
+            message, file_descriptor = receive_message(channel)
+        except ValueError:
+            traceback.print_exc()
+            return
+        if message is None:
+            print(f'worker {worker} exited')
+            loop.remove_reader(channel.fileno())
+            self._lobby = {host: entry for host, entry in self._lobby.items() if entry[1] != worker}
+            return
+        try:
+            self._handle_message(worker, message, file_descriptor)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            # passed on to the adopting worker or dropped, this process never serves connections
+            if file_descriptor is not None:
+                os.close(file_descriptor)
+
+    def _handle_message(self, worker: int, message: Dict[str, Any], file_descriptor: Optional[int]) -> None:
+        channel = self._channels[worker]
+        operation = message['op']
+        if operation == 'add':
+            # a restored game is added by the worker that claimed it, not by the worker of its host
+            self._lobby[message['host']] = (message['name'], message.get('worker', worker))
+        elif operation == 'remove':
+            self._lobby.pop(message['host'], None)
+        elif operation == 'list':
+            entries = [(host, name) for host, (name, _) in self._lobby.items()]
+            send_message(channel, {'request': message['request'], 'result': entries})
+        elif operation == 'claim':
+            entry = self._lobby.pop(message['host'], None)
+            send_message(channel, {'request': message['request'],
+                                   'result': None if entry is None else [entry[1], entry[0]]})
+        elif operation == 'hand_over' and file_descriptor is not None:
+            send_message(self._channels[message['worker']], {'op': 'adopt', 'args': message['args'],
+                                                             'unread': message['unread']}, file_descriptor)
+
+
+def _run_worker(host: str, port: int, worker: int, workers: int, channel: socket.socket,
+                configure: Callable[[WorkerServer], None], inherited_channels: List[socket.socket]) -> None:
+    # parent ends of the channels of earlier workers, kept open they would hide the exit of the parent
+    for inherited_channel in inherited_channels:
+        inherited_channel.close()
+    server = WorkerServer(host, port, worker, workers, channel)
+    configure(server)
+    server.start()
+
+
+def run_worker_pool(host: str, port: int, workers: int, configure: Callable[[WorkerServer], None]) -> None:
+    """starts `workers` processes, each calls `configure` with its server before listening, and keeps the shared
+    lobby until interrupted (CTRL + c)"""
+    context = multiprocessing.get_context('fork')
+    channels = []
+    processes = []
+    for worker in range(workers):
+        parent_channel, worker_channel = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        # not daemonic, so workers can start processes of their own. They exit with the parent, see `_read_channel`
+        process = context.Process(target=_run_worker,
+                                  args=(host, port, worker, workers, worker_channel, configure,
+                                        channels + [parent_channel]))
+        process.start()
+        worker_channel.close()
+        channels.append(parent_channel)
+        processes.append(process)
+    try:
+        LobbyCoordinator(channels).run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
@@ -0,0 +1,54 @@
+from server_core.framing import MAX_REQUEST_SIZE, FrameBuffer
+
+
+def read_frames(frame_buffer: FrameBuffer):
+    frames = []
+    while True:
+        frame = frame_buffer.next_frame()
+        if frame is None:
+            return frames
+        frames.append(frame)
+
+
+def test_terminators_split_between_reads() -> None:
+    stream = b'ping\n\necho\na\nb\n\r\nping\n\n'
+    frame_buffer = FrameBuffer()
+    frames = []
+    for index in range(len(stream)):
+        frame_buffer.feed(stream[index:index + 1])
+        frames.extend(read_frames(frame_buffer))
+    assert frames == [b'ping', b'echo\na\nb', b'ping']
+    assert len(frame_buffer) == 0
+
+
+def test_pipelined_frames_in_one_read() -> None:
+    frame_buffer = FrameBuffer()
+    frame_buffer.feed(b'ping\n\necho\nx\n\r\nping\n\npin')
+    assert read_frames(frame_buffer) == [b'ping', b'echo\nx', b'ping']
+    assert len(frame_buffer) == 3
+    frame_buffer.feed(b'g\n')
+    assert read_frames(frame_buffer) == []
+    frame_buffer.feed(b'\n')
+    assert read_frames(frame_buffer) == [b'ping']
+
+
+def test_unterminated_oversized_request_is_counted() -> None:
+    # the servers close a connection whose unfinished request grows above MAX_REQUEST_SIZE
+    frame_buffer = FrameBuffer()
+    chunk = b'x' * (1 << 20)
+    fed = 0
+    while len(frame_buffer) <= MAX_REQUEST_SIZE:
+        frame_buffer.feed(chunk)
+        fed += len(chunk)
+        assert frame_buffer.next_frame() is None
+    assert len(frame_buffer) == fed
+    frame_buffer.feed(b'\n\nping\n\n')
+    assert read_frames(frame_buffer) == [b'x' * fed, b'ping']
+
+
+def test_take_remaining_returns_unread_requests() -> None:
+    frame_buffer = FrameBuffer()
+    frame_buffer.feed(b'ping\n\nmove\n11-15\n')
+    assert frame_buffer.next_frame() == b'ping'
+    assert frame_buffer.take_remaining() == b'move\n11-15\n'
+    assert len(frame_buffer) == 0 and frame_buffer.next_frame() is None
@@ -0,0 +1,25 @@
+import pytest
+from ai.ai import AI
+from board.bitboard import create_board
+from board.fen import STARTING_FEN
+from board.perft import REFERENCE_COUNTS, check_random_replay, check_round_trip, create_position, get_state
+
+
+@pytest.mark.parametrize('use_bitboard', [False, True])
+def test_random_games_are_replayed_back_to_the_start(use_bitboard) -> None:
+    assert check_random_replay(use_bitboard, 30, seed=7)
+
+
+@pytest.mark.parametrize('use_bitboard', [False, True])
+@pytest.mark.parametrize('fen', list(REFERENCE_COUNTS))
+def test_every_move_sequence_is_undone(fen, use_bitboard) -> None:
+    assert check_round_trip(create_position(fen, use_bitboard), 3)
+
+
+@pytest.mark.parametrize('use_bitboard', [False, True])
+def test_search_restores_the_board(use_bitboard) -> None:
+    board = create_position(STARTING_FEN, use_bitboard)
+    state = get_state(board)
+    AI(board.moving_side, 4).get_best_move(board)
+    assert get_state(board) == state
+    assert str(board) == str(create_board(use_bitboard))
@@ -0,0 +1,53 @@
+import random
+from typing import List
+import pytest
+from ai.ai import AI
+from ai.parallel import ParallelAI
+from board.board import Board
+
+DEPTH = 3
+
+
+def create_positions(count: int, seed: int = 1) -> List[Board]:
+    """positions of random games with more than one legal move"""
+    generator = random.Random(seed)
+    positions: List[Board] = []
+    while len(positions) < count:
+        board = Board()
+        for _ in range(generator.randrange(4, 30)):
+            capture_moves, standard_moves = board.generate_moves()
+            all_moves = capture_moves if len(capture_moves) else standard_moves
+            if len(all_moves) == 0:
+                break
+            board.make_move(generator.choice(all_moves))
+        capture_moves, standard_moves = board.generate_moves()
+        if len(capture_moves if len(capture_moves) else standard_moves) > 1:
+            positions.append(board)
+    return positions
+
+
+@pytest.mark.parametrize('quiescence_node_limit', [None, 0, 16])
+def test_parallel_search_chooses_the_serial_move(quiescence_node_limit) -> None:
+    parallel_ai = ParallelAI(Board().moving_side, DEPTH, 2)
+    try:
+        for board in create_positions(15):
+            serial_ai = AI(board.moving_side, DEPTH)
+            parallel_ai.set_color(board.moving_side)
+            if quiescence_node_limit is not None:
+                serial_ai.set_quiescence_node_limit(quiescence_node_limit)
+                parallel_ai.set_quiescence_node_limit(quiescence_node_limit)
+            assert parallel_ai.get_best_move(board) == serial_ai.get_best_move(board), str(board)
+    finally:
+        parallel_ai.close()
+
+
+def test_parallel_search_collects_worker_stats() -> None:
+    parallel_ai = ParallelAI(Board().moving_side, DEPTH, 2)
+    parallel_ai.set_collect_stats(True)
+    try:
+        parallel_ai.get_best_move(Board())
+    finally:
+        parallel_ai.close()
+    assert parallel_ai.stats is not None
+    assert parallel_ai.stats.nodes == parallel_ai.nodes > 0
+    assert parallel_ai.stats.leaf_evaluations > 0 and parallel_ai.stats.cutoffs > 0
@@ -0,0 +1,5 @@
+from board.perft import verify
+
+
+def test_both_boards_pass_perft_verification() -> None:
+    assert verify(5, 10)
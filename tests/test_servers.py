@@ -0,0 +1,71 @@
+import asyncio
+import socket
+import threading
+import time
+import pytest
+from server_core.async_server import Server
+from server_core.framing import MAX_REQUEST_SIZE
+from server_core.fuzz import fuzz
+
+LATE_REPLY_DELAY = 0.2  # seconds
+
+
+def get_free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def read_replies(client_socket: socket.socket, count: int) -> list:
+    received = b''
+    while received.count(b'\n\n') < count:
+        data = client_socket.recv(1 << 16)
+        if len(data) == 0:
+            break
+        received += data
+    return received.split(b'\n\n')[:count]
+
+
+@pytest.fixture
+def async_server():
+    """asyncio server in a thread, `late` is answered after the handler returned"""
+    server = Server('127.0.0.1', get_free_port())
+    server.register_handler('ping', lambda args, res: res.send('pong'))
+    server.register_handler('late', lambda args, res: asyncio.get_running_loop().call_later(
+        LATE_REPLY_DELAY, res.send, 'late ' + ' '.join(args)))
+    thread = threading.Thread(target=server.start, daemon=True)
+    thread.start()
+    deadline = time.perf_counter() + 5
+    while server._loop is None and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    yield server
+    server._loop.call_soon_threadsafe(server.stop)
+    thread.join(5)
+
+
+@pytest.mark.parametrize('implementation', ['epoll', 'asyncio'])
+def test_pipelined_requests_are_answered_in_order(implementation) -> None:
+    # large replies do not fit the socket buffers, so they are sent in parts
+    assert fuzz(implementation, get_free_port(), 2, 150, 1 << 20, 1)
+
+
+def test_late_responses_keep_the_request_order(async_server) -> None:
+    with socket.create_connection(('127.0.0.1', async_server._PORT)) as client_socket:
+        client_socket.settimeout(5)
+        client_socket.sendall(b'late\n1\n\nping\n\nlate\n2\n\r\nping\n\n')
+        assert read_replies(client_socket, 4) == [b'late 1', b'pong', b'late 2', b'pong']
+
+
+def test_oversized_request_closes_the_connection(async_server) -> None:
+    with socket.create_connection(('127.0.0.1', async_server._PORT)) as client_socket:
+        client_socket.settimeout(5)
+        client_socket.sendall(b'ping\n\n')
+        assert read_replies(client_socket, 1) == [b'pong']
+        try:
+            client_socket.sendall(b'x' * (MAX_REQUEST_SIZE + (1 << 16)))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        with pytest.raises((ConnectionResetError, EOFError)):
+            while True:
+                if len(client_socket.recv(1 << 16)) == 0:
+                    raise EOFError